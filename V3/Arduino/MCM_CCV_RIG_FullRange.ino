@@ -42,6 +42,30 @@ bool isDutyCycleActive = false;
 #define HISTORY_SIZE            (RATE_WINDOW_SECONDS * 1000 / RATE_SAMPLE_INTERVAL_MS)
 #define SMOOTHING_ALPHA 0.3 // Valid range: 0.01 (very smooth, slow) to 1.0 (no filtering, instant)
 
+// --- Binary Telemetry Mode ---
+// Enabled by the host with "BIN:<baud>". Every HX711 sample (up to 80 SPS with RATE tied high)
+// is sent as a TelemetryPacket instead of the 10Hz ASCII line. Commands stay ASCII.
+#define DEFAULT_BAUD             115200
+#define BINARY_POLL_MS           2     // Poll is_ready() fast enough to catch every 80 SPS conversion
+#define BINARY_WATCHDOG_MS       5000  // No host traffic for this long -> back to ASCII @ DEFAULT_BAUD
+#define SAMPLE_QUEUE_LEN         32
+
+typedef struct __attribute__((packed)) {
+    uint8_t  sync[2];   // 0xA5 0x5A
+    uint16_t seq;
+    uint32_t t_ms;      // millis() when the load cell sample was taken
+    float    mass;
+    float    rate;
+    float    rpm;
+    uint16_t crc;       // CRC-16/CCITT-FALSE over seq..rpm
+} TelemetryPacket;
+
+typedef struct {
+    uint32_t t_ms;
+    float mass;
+    float rate;
+} LoadCellSample;
+
 // --- Global Variables ---
 HX711 scale;
 float massHistory[HISTORY_SIZE];
@@ -56,7 +80,11 @@ volatile bool motorRunning = false;
 volatile bool motorStepLevel = false;
 volatile float currentMass = 0.0f;
 volatile float currentRate = 0.0f;
+volatile uint32_t currentSampleMs = 0;  // millis() of the sample behind currentMass/currentRate
 volatile bool tareRequested = false;
+volatile bool binaryMode = false;
+volatile uint32_t sampleIntervalMs = RATE_SAMPLE_INTERVAL_MS;
+QueueHandle_t sampleQueue = NULL;
 
 // Control Globals
 float targetRPM = 0.0f;
@@ -65,6 +93,52 @@ bool vibrationEnabled = true;
 
 // Variable for Serial Throttling
 unsigned long lastSerialPrint = 0;
+uint32_t asciiSeq = 0;  // Incremented per ASCII telemetry line so the host can detect drops
+
+// Binary Mode State
+uint16_t packetSeq = 0;
+unsigned long lastHostMsg = 0;
+
+uint16_t crc16(const uint8_t *data, size_t len) {
+    uint16_t crc = 0xFFFF;
+    while (len--) {
+        crc ^= (uint16_t)(*data++) << 8;
+        for (int i = 0; i < 8; i++) {
+            crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+        }
+    }
+    return crc;
+}
+
+void sendPacket(const LoadCellSample &s) {
+    TelemetryPacket pkt;
+    pkt.sync[0] = 0xA5;
+    pkt.sync[1] = 0x5A;
+    pkt.seq  = packetSeq++;
+    pkt.t_ms = s.t_ms;
+    pkt.mass = s.mass;
+    pkt.rate = s.rate;
+    pkt.rpm  = targetRPM;
+    pkt.crc  = crc16((const uint8_t *)&pkt.seq, offsetof(TelemetryPacket, crc) - offsetof(TelemetryPacket, seq));
+    Serial.write((const uint8_t *)&pkt, sizeof(pkt));
+}
+
+void enterBinaryMode(unsigned long baud) {
+    Serial.printf("ACK:BIN:%lu\n", baud);
+    Serial.flush();
+    Serial.begin(baud);  // Re-begin reconfigures the UART; USB-CDC ignores the rate
+    xQueueReset(sampleQueue);
+    packetSeq = 0;
+    sampleIntervalMs = BINARY_POLL_MS;
+    binaryMode = true;
+}
+
+void exitBinaryMode() {
+    binaryMode = false;
+    sampleIntervalMs = RATE_SAMPLE_INTERVAL_MS;
+    Serial.flush();
+    Serial.begin(DEFAULT_BAUD);
+}
 
 // --- Timer Interrupt for Motor Stepping ---
 bool IRAM_ATTR onTimer(void *arg) {
@@ -118,8 +192,11 @@ void loadCellTask(void *pvParameters) {
     // Initialize the filter with 0
     float filteredReading = 0.0f;
 
+    // Binary mode samples faster than the 100ms rate history; track elapsed time between pushes
+    unsigned long lastSampleMs = millis();
+    unsigned long historyAccumMs = 0;
+
     TickType_t xLastWakeTime = xTaskGetTickCount();
-    const TickType_t xFrequency = pdMS_TO_TICKS(RATE_SAMPLE_INTERVAL_MS);
 
     while (true) {
         // --- HANDLE TARE ---
@@ -130,6 +207,7 @@ void loadCellTask(void *pvParameters) {
             currentMass = 0.0f;
             currentRate = 0.0f;
             for (int i = 0; i < HISTORY_SIZE; i++) massHistory[i] = 0.0f;
+            currentSampleMs = millis();
             tareRequested = false; 
         }
 
@@ -143,25 +221,54 @@ void loadCellTask(void *pvParameters) {
             // Previously: if(raw < 1) raw = 0;
             // Now: We pass rawReading directly to the filter.
             
+            unsigned long nowMs = millis();
+            unsigned long dtMs = nowMs - lastSampleMs;
+            lastSampleMs = nowMs;
+            bool fastSampling = binaryMode;
+
             // --- THE MATH TRICK (Exponential Smoothing) ---
-            filteredReading = (SMOOTHING_ALPHA * rawReading) + ((1.0 - SMOOTHING_ALPHA) * filteredReading);
+            // At faster sample rates alpha is scaled so the filter keeps the same time constant
+            float alpha = SMOOTHING_ALPHA;
+            if (fastSampling && dtMs < RATE_SAMPLE_INTERVAL_MS) {
+                alpha = 1.0f - powf(1.0f - SMOOTHING_ALPHA, (float)dtMs / RATE_SAMPLE_INTERVAL_MS);
+            }
+            filteredReading = (alpha * rawReading) + ((1.0 - alpha) * filteredReading);
             
             // Update the global variable
             currentMass = filteredReading;
+            currentSampleMs = nowMs;
             
-            // Rate calculation
-            float oldMass = massHistory[historyIndex];
-            massHistory[historyIndex] = filteredReading;
-            
-            historyIndex = (historyIndex + 1) % HISTORY_SIZE;
-            if (historyIndex == 0) bufferFull = true;
-            
-            if (bufferFull) {
-                currentRate = (filteredReading - oldMass) / (float)RATE_WINDOW_SECONDS;
+            // Rate calculation (history is always spaced RATE_SAMPLE_INTERVAL_MS apart)
+            bool pushHistory = true;
+            if (fastSampling) {
+                historyAccumMs += dtMs;
+                pushHistory = historyAccumMs >= RATE_SAMPLE_INTERVAL_MS;
+                if (pushHistory) historyAccumMs -= RATE_SAMPLE_INTERVAL_MS;
+                if (historyAccumMs > RATE_SAMPLE_INTERVAL_MS) historyAccumMs = 0; // Stalled, don't burst
+            } else {
+                historyAccumMs = 0;
+            }
+
+            if (pushHistory) {
+                float oldMass = massHistory[historyIndex];
+                massHistory[historyIndex] = filteredReading;
+                
+                historyIndex = (historyIndex + 1) % HISTORY_SIZE;
+                if (historyIndex == 0) bufferFull = true;
+                
+                if (bufferFull) {
+                    currentRate = (filteredReading - oldMass) / (float)RATE_WINDOW_SECONDS;
+                }
+            }
+
+            // Hand every sample to loop() for the binary stream (drop if the queue is full)
+            if (fastSampling) {
+                LoadCellSample s = { (uint32_t)nowMs, currentMass, currentRate };
+                xQueueSend(sampleQueue, &s, 0);
             }
         }
         
-        vTaskDelayUntil(&xLastWakeTime, xFrequency);
+        vTaskDelayUntil(&xLastWakeTime, pdMS_TO_TICKS(sampleIntervalMs));
     }
 }
 
@@ -237,7 +344,7 @@ void manageMotorControl(float target, bool vibration) {
 
 // --- Setup ---
 void setup() {
-    Serial.begin(115200);
+    Serial.begin(DEFAULT_BAUD);
     
     // Pins
     gpio_set_direction(BUTTON_PIN, GPIO_MODE_INPUT); 
@@ -258,6 +365,7 @@ void setup() {
     timer_enable_intr(TIMER_GROUP_0, TIMER_0);
     
     // Start Task
+    sampleQueue = xQueueCreate(SAMPLE_QUEUE_LEN, sizeof(LoadCellSample));
     xTaskCreatePinnedToCore(loadCellTask, "LoadCell", 4096, NULL, 1, NULL, 1);
 }
 
@@ -267,6 +375,7 @@ void loop() {
     if (Serial.available() > 0) {
         String input = Serial.readStringUntil('\n');
         input.trim();
+        lastHostMsg = millis();
 
         if (input.startsWith("RPM:")) {
             targetRPM = input.substring(4).toFloat();
@@ -279,7 +388,17 @@ void loop() {
         }
         else if (input == "TARE") {
             tareRequested = true;
-            Serial.println("System: Taring..."); 
+            if (!binaryMode) Serial.println("System: Taring..."); 
+        }
+        else if (input.startsWith("BIN:")) {
+            unsigned long baud = (unsigned long)input.substring(4).toInt();
+            if (baud >= DEFAULT_BAUD) enterBinaryMode(baud);
+        }
+        else if (input == "ASCII") {
+            if (binaryMode) exitBinaryMode();
+        }
+        else if (input == "PING") {
+            // Keepalive only; lastHostMsg already updated
         }
         else if (input == "VIB:1") {
             vibrationEnabled = true;
@@ -311,11 +430,19 @@ void loop() {
     // Delegate to the manager to handle low-speed bursting
     manageMotorControl(activeRPM, activeVib);
 
-    // 3. Output Data (THROTTLED)
-    // Only print every 100ms (10Hz). This prevents the buffer overflow and
+    // 3. Output Data
+    // Binary mode: forward every queued load cell sample as a packet.
+    // ASCII mode: only print every 100ms (10Hz). This prevents the buffer overflow and
     // allows the load cell to communicate without Serial interrupt interference.
-    if (millis() - lastSerialPrint >= 100) {
-        Serial.printf("Mass:%.2f,Rate:%.2f,RPM:%.0f\n", currentMass, currentRate, targetRPM);
+    if (binaryMode) {
+        LoadCellSample s;
+        while (xQueueReceive(sampleQueue, &s, 0) == pdTRUE) sendPacket(s);
+        if (millis() - lastHostMsg > BINARY_WATCHDOG_MS) exitBinaryMode();
+    }
+    else if (millis() - lastSerialPrint >= 100) {
+        // T (sample millis) and Seq trail the original fields so older hosts still parse the line
+        Serial.printf("Mass:%.2f,Rate:%.2f,RPM:%.0f,T:%lu,Seq:%lu\n", currentMass, currentRate, targetRPM,
+                      (unsigned long)currentSampleMs, (unsigned long)asciiSeq++);
         lastSerialPrint = millis();
     }
 
@@ -0,0 +1,110 @@
+"""
+CCV and calibration math shared by the live app and the batch re-analysis.
+
+Everything here works on NumPy arrays, so the same definitions apply to a
+single step in the GUI and to every step of an archive at once.
+"""
+import numpy as np
+
+MIN_MASS_DELTA_G = 0.001   # Below this a step dispensed nothing and has no CCV
+MIN_FIT_RATE = 0.01        # Calibration points with a lower mean rate are ignored
+
+
+def ccv(rpm, span_s, mass_delta):
+    """
+    CCV = (degrees rotated / grams dispensed) * 100.
+
+    Works element-wise; steps that dispensed less than MIN_MASS_DELTA_G get 0.
+    """
+    rpm, span_s, mass_delta = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (rpm, span_s, mass_delta)))
+    degrees = (rpm / 60.0) * 360.0 * span_s
+    ok = mass_delta > MIN_MASS_DELTA_G
+    out = np.zeros(degrees.shape)
+    np.divide(degrees * 100.0, mass_delta, out=out, where=ok)
+    return out if out.ndim else float(out)
+
+
+def linear_fit(rpm, rate):
+    """
+    Calibration fit RPM = m * Rate + c over the valid (rpm > 0, rate > MIN_FIT_RATE) points.
+
+    Returns (m, c, r_squared, n_points); m and c are None if there are fewer
+    than two points or no variation in rate.
+    """
+    rpm = np.asarray(rpm, dtype=float)
+    rate = np.asarray(rate, dtype=float)
+    ok = (rpm > 0) & (rate > MIN_FIT_RATE)
+    x, y = rate[ok], rpm[ok]
+    n = len(x)
+    if n < 2: return None, None, 0.0, n
+    den = n * np.dot(x, x) - x.sum() ** 2
+    if abs(den) < 1e-10: return None, None, 0.0, n
+    m = (n * np.dot(x, y) - x.sum() * y.sum()) / den
+    c = (y.sum() - m * x.sum()) / n
+    ss_tot = np.sum((y - y.mean()) ** 2)
+    ss_res = np.sum((y - (m * x + c)) ** 2)
+    r_squared = 1 - ss_res / ss_tot if ss_tot > 0 else 0.0
+    return float(m), float(c), float(r_squared), n
+
+
+def step_metrics(time, step, mode, value, mass, rate, settle_s=2.0, rpm_mode=0):
+    """
+    Per-step metrics for one raw log in a single vectorized pass.
+
+    Rows must be in recording order; each contiguous run of the same step
+    number is one step. Rows with a missing time, mass or rate are skipped.
+    avg_rate leaves out the first settle_s seconds of each step, like the
+    live StepStats. Returns a dict of equal-length arrays.
+    """
+    time, mass, rate = (np.asarray(a, dtype=float) for a in (time, mass, rate))
+    keep = ~(np.isnan(time) | np.isnan(mass) | np.isnan(rate))
+    time, mass, rate = time[keep], mass[keep], rate[keep]
+    step, mode, value = np.asarray(step)[keep], np.asarray(mode)[keep], np.asarray(value, dtype=float)[keep]
+    if not len(time):
+        return {k: np.zeros(0) for k in ("step", "mode", "value", "samples", "span_s", "mass_delta", "avg_rate",
+                                         "rate_std", "mass_slope", "ccv")}
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(step)) + 1))
+    stops = np.concatenate((starts[1:], [len(step)]))
+    counts = stops - starts
+    k = len(starts)
+    run = np.repeat(np.arange(k), counts)
+
+    t_first, t_last = time[starts], time[stops - 1]
+    span = t_last - t_first
+    mass_delta = mass[stops - 1] - mass[starts]
+
+    # Settled rate mean / std
+    settled = (time - t_first[run]) > settle_s
+    n_set = np.bincount(run, weights=settled, minlength=k)
+    s1 = np.bincount(run, weights=rate * settled, minlength=k)
+    s2 = np.bincount(run, weights=rate * rate * settled, minlength=k)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_rate = np.where(n_set > 0, s1 / n_set, 0.0)
+        var = np.where(n_set > 1, (s2 - s1 * s1 / np.maximum(n_set, 1)) / np.maximum(n_set - 1, 1), 0.0)
+
+        # Least-squares mass slope (g/s) over the whole step
+        x = time - t_first[run]
+        sx = np.bincount(run, weights=x, minlength=k)
+        sxx = np.bincount(run, weights=x * x, minlength=k)
+        sy = np.bincount(run, weights=mass, minlength=k)
+        sxy = np.bincount(run, weights=x * mass, minlength=k)
+        den = counts * sxx - sx * sx
+        slope = np.where((counts > 1) & (np.abs(den) > 1e-12), (counts * sxy - sx * sy) / np.where(den == 0, 1, den), 0.0)
+
+    step_mode = mode[starts]
+    step_value = value[starts]
+    step_ccv = np.where(step_mode == rpm_mode, ccv(step_value, span, mass_delta), 0.0)
+
+    return {
+        "step": step[starts],
+        "mode": step_mode,
+        "value": step_value,
+        "samples": counts,
+        "span_s": span,
+        "mass_delta": mass_delta,
+        "avg_rate": avg_rate,
+        "rate_std": np.sqrt(np.maximum(var, 0.0)),
+        "mass_slope": slope,
+        "ccv": step_ccv,
+    }
@@ -1,16 +1,19 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import serial
-import serial.tools.list_ports
-import threading
 import time
-import csv
-import datetime
 import os
-import json
-import ctypes 
-import math
-from collections import deque 
+import multiprocessing
+import tempfile
+
+from ring_buffer import RingBuffer
+from decimation import M4Decimator
+from blit_plot import BlitPlotter
+from rolling_stats import RollingStats
+from ui_refresh import UiRefresher
+import engine as engine_module
+import metrics
+from engine import DosingEngine
+from telemetry_bus import DROP_OLDEST
 
 # --- GRAPHING IMPORTS ---
 import matplotlib
@@ -19,22 +22,31 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 from matplotlib import style
 
+# Live plot history kept in RAM. Older samples spill to a temp file instead of growing memory.
+# 200k samples is ~5.5 h at the 10 Hz ASCII rate or ~40 min at 80 SPS binary.
+GRAPH_CAPACITY = 200000
+GRAPH_SPILL_PATH = os.path.join(tempfile.gettempdir(), f"ccv_graph_spill_{os.getpid()}.f64")
+# Metrics ports tried from metrics.DEFAULT_PORT up; each further app on the PC (one per rig) takes the next free one
+METRICS_PORTS = 16
+
+# Samples the plot may fall behind by (a stalled Tk loop) before the oldest are dropped; ~4 min at 80 SPS
+PLOT_QUEUE_SIZE = 20000
+
 class DosingApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Dosing Rig Control Panel")
         self.root.geometry("1280x980") 
 
-        # Prevent Windows Sleep
-        try: ctypes.windll.kernel32.SetThreadExecutionState(0x80000003)
-        except: pass 
-
-        # Serial & State
-        self.ser = None
-        self.is_connected = False
-        self.is_running_test = False
-        self.is_manual_active = False 
-        self.stop_test_flag = False
+        # Serial, sequencing, logging and analysis live in the engine; this class is a front end to it
+        self.engine = DosingEngine()
+        # The plot has its own queue on the telemetry bus and drains it on the Tk thread (_drain_plot_samples)
+        self.plot_samples = self.engine.bus.subscribe("plot", maxsize=PLOT_QUEUE_SIZE, policy=DROP_OLDEST)
+        self.engine.on("step", self._on_engine_step)
+        self.engine.on("test_finished", self._on_engine_test_finished)
+        self.engine.on("disconnected", self._on_engine_disconnected)
+        self.engine.on("profile_written", self._on_engine_profile_written)
+        self.engine.on("warning", self._on_engine_warning)
 
         # Live Data
         self.current_mass_str = tk.StringVar(value="0.00 g")
@@ -42,22 +54,20 @@ class DosingApp:
         self.current_rpm_str = tk.StringVar(value="0 RPM")
         self.test_timer_text = tk.StringVar(value="00:00")
         self.last_ccv_str = tk.StringVar(value="--") # Restored from V3
-        
-        self.raw_mass_float = 0.0 
-        self.raw_rate_float = 0.0
-        self.live_rpm_float = 0.0
 
         # Graph Data (Preserving 10s Average)
-        self.graph_time = []
-        self.graph_mass = []
-        self.graph_rate_raw = []
-        self.graph_rate_avg = [] 
-        self.rate_window = deque(maxlen=100) # 100 * 0.1s = 10s window
+        self.graph = RingBuffer(GRAPH_CAPACITY, ("time", "mass", "rate_raw", "rate_avg"), spill_path=GRAPH_SPILL_PATH)
+        self.graph_lod = M4Decimator(3) # Whole-session mass/rate_raw/rate_avg at ~2 points per pixel
+        self.rate_stats = RollingStats(window_s=10.0) # 10s window on the rig's sample clock
         self.start_time_offset = 0.0
 
         # Settings
         self.save_filepath = tk.StringVar()
         self.vibration_enabled = tk.BooleanVar(value=True) 
+        self.binary_mode_enabled = tk.BooleanVar(value=False)
+        self.ingest_process_enabled = tk.BooleanVar(value=False) # Serial ingest + raw log in a child process (see shm_ingest.py)
+        self.binary_log_enabled = tk.BooleanVar(value=False) # Raw log as .ccvraw instead of CSV (summary stays CSV)
+        self.profile_enabled = tk.BooleanVar(value=False) # Profile test runs / manual sessions (see profiling.py)
         self.manual_mode_var = tk.StringVar(value="RPM")
         self.builder_mode_var = tk.StringVar(value="RPM")
         
@@ -66,14 +76,34 @@ class DosingApp:
 
         # Test Data Containers
         self.sequence_data = [] 
-        self.last_calibration_results = [] 
+        self.test_op_mode = "CCV" # Operation mode of the running / last test
 
         self._setup_ui()
         
-        # Threads
-        threading.Thread(target=self._read_serial_loop, daemon=True).start()
+        # Live readouts: one fixed-rate tick instead of root.after() per field per frame
+        self.ui_refresher = UiRefresher(self.root, lambda: self.engine.latest, interval_ms=100)
+        self.ui_refresher.bind(self.current_mass_str, lambda s: f"{s.mass:.2f} g")
+        self.ui_refresher.bind(self.current_rate_str, lambda s: f"{s.rate:.2f} g/s")
+        self.ui_refresher.bind(self.current_rpm_str, lambda s: f"{int(s.rpm)} RPM")
+        self.ui_refresher.bind(self.test_timer_text, lambda s: self._test_timer_text())
+        self.ui_refresher.start()
+        ui = self.ui_refresher
+        reg = self.engine.metrics
+        reg.gauge("ccv_ui_queue_depth", "Pending Tk after() events at the last display tick", fn=lambda: ui.queue_depth)
+        reg.gauge("ccv_ui_queue_depth_max", "Most pending Tk after() events seen at a display tick", fn=lambda: ui.max_queue_depth)
+        reg.gauge("ccv_ui_lag_seconds", "How late the last display tick ran", fn=lambda: ui.lag_ms / 1000.0)
+        reg.gauge("ccv_ui_lag_max_seconds", "Latest a display tick has run", fn=lambda: ui.max_lag_ms / 1000.0)
+        
+        # Serial ingest runs on its own thread per connection (see DosingEngine.connect)
         self._animate_graph()
 
+        # Prometheus text on loopback (also written next to the logs at the end of each test)
+        try:
+            url = self.engine.serve_metrics(metrics.DEFAULT_PORT, tries=METRICS_PORTS)
+            self.root.title(f"Dosing Rig Control Panel (metrics {url})")
+        except OSError as e:
+            self._on_engine_warning(f"Metrics endpoint unavailable: {e}")
+
     def _setup_ui(self):
         # --- 1. Connection & Global Settings ---
         conn_frame = ttk.LabelFrame(self.root, text="1. Connection & Settings")
@@ -86,6 +116,9 @@ class DosingApp:
         ttk.Button(conn_frame, text="Refresh", command=self._refresh_ports).pack(side="left", padx=5)
         
         ttk.Checkbutton(conn_frame, text="Enable Vibration", variable=self.vibration_enabled, command=self._update_vibration).pack(side="right", padx=20)
+        ttk.Checkbutton(conn_frame, text="Binary Telemetry (80 SPS)", variable=self.binary_mode_enabled).pack(side="right", padx=5)
+        ttk.Checkbutton(conn_frame, text="Ingest Process", variable=self.ingest_process_enabled).pack(side="right", padx=5)
+        ttk.Checkbutton(conn_frame, text="Profile", variable=self.profile_enabled).pack(side="right", padx=5)
 
         # --- MIDDLE CONTAINER ---
         middle_container = ttk.Frame(self.root)
@@ -155,6 +188,11 @@ class DosingApp:
         self.canvas = FigureCanvasTkAgg(self.fig, master=graph_frame)
         self.canvas.draw()
         self.canvas.get_tk_widget().pack(side="left", fill="both", expand=True)
+        # Only the three lines move; everything else is blitted from a cached background
+        plot_hist = self.engine.metrics.histogram("ccv_plot_frame_seconds", "Render time of one live plot frame")
+        self.plotter = BlitPlotter(self.canvas, [(self.ax1, [self.line_mass]),
+                                                 (self.ax2, [self.line_rate_raw, self.line_rate_avg])],
+                                   frame_hist=plot_hist)
 
         ttk.Button(graph_frame, text="Clear Graph", command=self._reset_graph_data).pack(side="right", padx=10)
 
@@ -232,6 +270,7 @@ class DosingApp:
         self.entry_save = ttk.Entry(action_frame, textvariable=self.save_filepath, width=40)
         self.entry_save.pack(side="left", padx=5)
         ttk.Button(action_frame, text="Browse", command=self._browse_file).pack(side="left", padx=5)
+        ttk.Checkbutton(action_frame, text="Binary Raw Log", variable=self.binary_log_enabled).pack(side="left", padx=5)
 
         ttk.Label(action_frame, text="Elapsed:").pack(side="left", padx=(20, 5))
         ttk.Label(action_frame, textvariable=self.test_timer_text, font=("Arial", 12, "bold"), foreground="darkblue").pack(side="left")
@@ -241,7 +280,7 @@ class DosingApp:
         
         ttk.Button(action_frame, text="EMERGENCY STOP", command=self._emergency_stop).pack(side="right", padx=10)
 
-    # --- LOGIC: Test Runner ---
+    # --- LOGIC: Test Runner (runs in the engine, see engine.py) ---
     def _start_test_thread(self):
         if not self.sequence_data:
             messagebox.showwarning("Empty", "No steps in sequence.")
@@ -250,198 +289,100 @@ class DosingApp:
             messagebox.showwarning("No File", "Select save location first.")
             return
         
-        self.stop_test_flag = False
-        self.test_timer_text.set("00:00")
         self.last_ccv_str.set("--")
         self._reset_graph_data()
-        threading.Thread(target=self._run_test_logic, daemon=True).start()
+        self._set_ui_locked_for_test(True)
+        self.test_op_mode = self.operation_mode.get() # Check mode: "CCV" or "CAL"
+        self.engine.vibration_enabled = self.vibration_enabled.get()
+        self.engine.profile_runs = self.profile_enabled.get()
+        self.engine.start_test(self.sequence_data, self.save_filepath.get(), self.test_op_mode, self.binary_log_enabled.get())
+
+    def _test_timer_text(self):
+        elapsed = self.engine.elapsed()
+        return f"{int(elapsed) // 60:02d}:{int(elapsed) % 60:02d}"
+
+    # --- ENGINE EVENTS (engine threads; UI work is handed to the Tk thread) ---
+    def _on_engine_step(self, result):
+        if result.ccv is not None: self.root.after(0, self.last_ccv_str.set, f"{result.ccv:.0f}")
+
+    def _on_engine_test_finished(self, status, error, samples_lost):
+        self.root.after(0, lambda: self._set_ui_locked_for_test(False))
+        if samples_lost:
+            self.root.after(0, lambda: messagebox.showwarning(
+                "Samples Lost", f"{samples_lost} samples are missing from this run's log and step results "
+                                "(the test runner fell behind)."))
+        if error is not None:
+            self.root.after(0, lambda: messagebox.showerror("Error", str(error)))
+        # Final Popups
+        elif self.test_op_mode == "CAL" and len(self.engine.last_calibration_results) > 0:
+            self.root.after(0, self._perform_regression)
+        else:
+            self.root.after(0, lambda: messagebox.showinfo("Done", "Test Complete."))
 
-    def _run_test_logic(self):
-        self.is_running_test = True
-        self.last_calibration_results = []
-        op_mode = self.operation_mode.get() # Check mode: "CCV" or "CAL"
-        
-        self.root.after(0, lambda: self._set_ui_locked_for_test(True))
-        filename = self.save_filepath.get()
-        summary_filename = filename.replace(".csv", "_Summary.csv")
-        
-        try:
-            self._update_vibration()
-            time.sleep(0.1)
+    def _on_engine_warning(self, message):
+        self.root.after(0, lambda: messagebox.showwarning("Warning", message))
 
-            # Open Files: 
-            # 1. Raw File (Always used)
-            # 2. Summary File (Only used if in CCV mode)
-            
-            raw_file = open(filename, 'w', newline='') 
-            raw_writer = csv.writer(raw_file)
-            # Generic Header
-            raw_writer.writerow(["Time_s", "Mode", "Value", "Mass_g", "Rate_g_s", "Vib_On"])
-            
-            sum_file = None
-            sum_writer = None
-            
-            if op_mode == "CCV":
-                sum_file = open(summary_filename, 'w', newline='')
-                sum_writer = csv.writer(sum_file)
-                # V3 Standard Header
-                sum_writer.writerow(["Step_Num", "TargetRPM", "Duration_s", "Grams_Dispensed", "CCV_Value"])
-
-            start_time = time.time()
-            step_count = 0
-            vib_status = "1" if self.vibration_enabled.get() else "0"
-
-            for step in self.sequence_data:
-                if self.stop_test_flag or not self.is_connected: break
-                step_count += 1
-                
-                mode = step["type"]
-                val = step["val"]
-                duration = step["duration"]
-                
-                # --- V3 CCV ENFORCEMENT ---
-                if op_mode == "CCV" and mode == "RATE":
-                    # Warning: CCV mode logic relies on RPM. 
-                    # We will run it, but CCV math will be meaningless if we don't know RPM.
-                    pass 
-
-                # Send Command
-                cmd_str = f"RPM:{val}\n" if mode == "RPM" else f"RATE:{val}\n"
-                self.ser.write(cmd_str.encode())
-
-                step_start_mass = self.raw_mass_float
-                step_end = time.time() + duration
-                rate_accumulator = [] 
-                
-                while time.time() < step_end:
-                    if self.stop_test_flag: break
-                    elapsed = time.time() - start_time
-                    
-                    # Update test timer display
-                    minutes = int(elapsed) // 60
-                    seconds = int(elapsed) % 60
-                    self.root.after(0, self.test_timer_text.set, f"{minutes:02d}:{seconds:02d}")
-                    
-                    # Calibration Data Collection (Skip start transient)
-                    if (time.time() - (step_end - duration)) > 2.0:
-                            rate_accumulator.append(self.raw_rate_float)
-
-                    # Log Raw
-                    raw_writer.writerow([round(elapsed, 2), mode, val, f"{self.raw_mass_float:.2f}", f"{self.raw_rate_float:.2f}", vib_status])
-                    raw_file.flush()
-                    time.sleep(0.1)
-
-                # --- END OF STEP LOGIC ---
-                
-                # 1. Calibration Data Store
-                if mode == "RPM":
-                    avg_rate = sum(rate_accumulator)/len(rate_accumulator) if rate_accumulator else 0
-                    self.last_calibration_results.append((val, avg_rate))
-
-                # 2. CCV Summary Logic (V3 Feature)
-                if op_mode == "CCV":
-                    step_end_mass = self.raw_mass_float
-                    mass_delta = step_end_mass - step_start_mass
-                    
-                    # Calculate CCV
-                    # Formula: CCV = (Degrees Rotated / Grams Dispensed) * 100
-                    # Note: Only valid if Mode was RPM.
-                    ccv_val = 0.0
-                    if mode == "RPM":
-                        total_degrees = (val / 60.0) * 360.0 * duration
-                        if mass_delta > 0.001:
-                            ccv_val = (total_degrees / mass_delta) * 100.0
-                    
-                    self.root.after(0, self.last_ccv_str.set, f"{ccv_val:.0f}")
-                    if sum_writer:
-                        sum_writer.writerow([step_count, val, duration, f"{mass_delta:.2f}", f"{ccv_val:.1f}"])
-                        sum_file.flush()
-
-            # End Loop
-            if self.is_connected: self.ser.write(b"STOP\n")
-            
-            # Clean up files
-            raw_file.close()
-            if sum_file: sum_file.close()
-            
-            # Final Popups
-            if op_mode == "CAL" and len(self.last_calibration_results) > 0:
-                self.root.after(0, self._perform_regression)
-            else:
-                self.root.after(0, lambda: messagebox.showinfo("Done", "Test Complete."))
+    def _on_engine_profile_written(self, paths):
+        self.root.after(0, lambda: messagebox.showinfo("Profile", "Profile written:\n" + "\n".join(paths)))
 
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Error", str(e)))
+    def _on_engine_disconnected(self, error):
+        self.root.after(0, self._set_disconnected)
 
-        finally:
-            self.is_running_test = False
-            self.root.after(0, lambda: self._set_ui_locked_for_test(False))
+    def _drain_plot_samples(self):
+        # Everything published since the last redraw; samples outside a test or manual run are discarded
+        snaps = self.plot_samples.get_batch()
+        if not (self.engine.is_running_test or self.engine.is_manual_active): return
+        for snap in snaps:
+            self.rate_stats.add(snap.rate, snap.t)
+            avg = self.rate_stats.mean
+            t = snap.t - self.start_time_offset
+            self.graph.append(t, snap.mass, snap.rate, avg)
+            self.graph_lod.add(t, (snap.mass, snap.rate, avg))
+            self.plotter.extents.observe(t, ((0, snap.mass), (1, snap.rate), (1, avg)))
 
     # --- MATH & CALIBRATION (Linear Regression) ---
     def _perform_regression(self):
-        valid_points = []
-        for rpm, rate in self.last_calibration_results:
-            if rpm > 0 and rate > 0.01:
-                valid_points.append((rpm, rate))
-        
-        if len(valid_points) < 2:
-            messagebox.showwarning("Calibration Failed", "Not enough valid data points.")
-            return
-
-        # Linear Regression: RPM = m * Rate + c
-        n = len(valid_points)
-        sum_x = sum(rate for rpm, rate in valid_points)
-        sum_y = sum(rpm for rpm, rate in valid_points)
-        sum_xy = sum(rate * rpm for rpm, rate in valid_points)
-        sum_x2 = sum(rate**2 for rpm, rate in valid_points)
-        
+        # Linear Regression: RPM = m * Rate + c (same fit as reanalyze.py, see analysis.py)
         try:
-            denominator = (n * sum_x2 - sum_x**2)
-            if abs(denominator) < 1e-10:
-                messagebox.showerror("Error", "Cannot compute linear fit - insufficient variation in data.")
-                return
-            
-            m = (n * sum_xy - sum_x * sum_y) / denominator
-            c = (sum_y - m * sum_x) / n
-            
-            # Calculate R² for quality assessment
-            y_mean = sum_y / n
-            ss_tot = sum((rpm - y_mean)**2 for rpm, rate in valid_points)
-            ss_res = sum((rpm - (m * rate + c))**2 for rpm, rate in valid_points)
-            r_squared = 1 - (ss_res / ss_tot) if ss_tot > 0 else 0
-            
+            m, c, r_squared, n = self.engine.calibration_fit()
         except Exception as e:
             messagebox.showerror("Error", f"Math Error in Linear Regression: {str(e)}")
             return
 
+        if n < 2:
+            messagebox.showwarning("Calibration Failed", "Not enough valid data points.")
+            return
+        if m is None:
+            messagebox.showerror("Error", "Cannot compute linear fit - insufficient variation in data.")
+            return
+
+        self.engine.record_fit(m, c, r_squared, n)
+
         msg = f"Linear Calibration Calculated!\n\nRPM = {m:.4f} * Rate + {c:.4f}\nR² = {r_squared:.4f}\n\nUpload to Rig?"
         if messagebox.askyesno("Calibration", msg):
             self._upload_calibration(m, c)
 
     def _upload_calibration(self, a, b):
-        if self.ser and self.is_connected:
-            cmd = f"CAL:{a:.3f},{b:.3f}\n"
-            self.ser.write(cmd.encode())
+        if self.engine.upload_calibration(a, b):
             messagebox.showinfo("Success", "Calibration saved to Rig.")
 
     # --- UI & UTILS ---
-    def _get_ports(self): return [port.device for port in serial.tools.list_ports.comports()]
+    def _get_ports(self): return engine_module.list_ports()
     def _refresh_ports(self): self.port_combo['values'] = self._get_ports()
     
     def _toggle_connection(self):
-        if not self.is_connected:
+        if not self.engine.is_connected:
             try:
-                self.ser = serial.Serial(self.port_combo.get(), 115200, timeout=1)
-                self.is_connected = True
+                # Binary mode is opt-in; firmware without it never ACKs and we stay on ASCII
+                self.engine.connect(self.port_combo.get(), binary=self.binary_mode_enabled.get(),
+                                    ingest_process=self.ingest_process_enabled.get())
                 self.btn_connect.config(text="Disconnect")
                 self._set_ui_connected(True)
             except: messagebox.showerror("Error", "Connect Failed")
         else:
-            self._handle_manual_disconnect()
+            self.engine.disconnect()
 
-    def _handle_manual_disconnect(self):
-        self.is_connected = False
-        if self.ser: self.ser.close()
+    def _set_disconnected(self):
         self.btn_connect.config(text="Connect")
         self._set_ui_connected(False)
 
@@ -453,33 +394,34 @@ class DosingApp:
         self.btn_manual_stop.config(state=s)
 
     def _send_tare(self): 
-        if self.ser: self.ser.write(b"TARE\n")
+        self.engine.tare()
         self._reset_graph_data()
 
     def _reset_graph_data(self):
-        self.graph_time = []
-        self.graph_mass = []
-        self.graph_rate_raw = []
-        self.graph_rate_avg = []
-        self.rate_window.clear()
-        self.start_time_offset = time.time()
+        self.graph.clear()
+        self.graph_lod.clear()
+        self.plotter.reset()
+        for line in (self.line_mass, self.line_rate_raw, self.line_rate_avg): line.set_data([], [])
+        self.rate_stats.clear()
+        self.start_time_offset = time.monotonic()
         self.canvas.draw()
 
     def _update_vibration(self):
-        if self.ser: self.ser.write(b"VIB:1\n" if self.vibration_enabled.get() else b"VIB:0\n")
+        self.engine.set_vibration(self.vibration_enabled.get())
 
     def _manual_start(self):
         try:
             val = float(self.entry_manual_val.get())
-            cmd = f"RPM:{val}\n" if self.manual_mode_var.get() == "RPM" else f"RATE:{val}\n"
-            if self.ser: self.ser.write(cmd.encode())
-            self.is_manual_active = True
-            if not self.graph_time: self.start_time_offset = time.time()
+            # Profiled on this (Tk) thread until Stop; reports go next to the selected log file
+            self.engine.profile_runs = self.profile_enabled.get()
+            log_dir = os.path.dirname(self.save_filepath.get())
+            self.engine.manual_start(self.manual_mode_var.get(), val,
+                                     profile_base=os.path.join(log_dir, engine_module.manual_profile_base()))
+            if not len(self.graph): self.start_time_offset = time.monotonic()
         except: pass
 
     def _manual_stop(self):
-        if self.ser: self.ser.write(b"STOP\n")
-        self.is_manual_active = False
+        self.engine.manual_stop()
 
     def _add_step(self):
         try:
@@ -505,25 +447,8 @@ class DosingApp:
                 messagebox.showwarning("Invalid Duration", "Duration must be > 0")
                 return
             
-            # Calculate 7 RPM points:
-            # 0: 0.8 * Low (80% of low)
-            # 1: Low
-            # 2: Low + (High-Low)/3
-            # 3: (Low+High)/2 (Midpoint)
-            # 4: Low + 2*(High-Low)/3
-            # 5: High
-            # 6: 1.2 * High (120% of high)
-            
-            rpm_range = high_rpm - low_rpm
-            points = [
-                0.8 * low_rpm,
-                low_rpm,
-                low_rpm + rpm_range / 3.0,
-                (low_rpm + high_rpm) / 2.0,
-                low_rpm + 2.0 * rpm_range / 3.0,
-                high_rpm,
-                1.2 * high_rpm
-            ]
+            # Calculate 7 RPM points (see engine.curve_points)
+            points = engine_module.curve_points(low_rpm, high_rpm)
             
             self._clear_sequence()
             
@@ -542,116 +467,59 @@ class DosingApp:
     def _save_routine(self):
         if not self.sequence_data: return
         f = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")])
-        if f:
-            with open(f, 'w') as file: json.dump(self.sequence_data, file, indent=4)
+        if f: engine_module.save_routine(f, self.sequence_data)
             
     def _load_routine(self):
         f = filedialog.askopenfilename(filetypes=[("JSON", "*.json")])
         if f:
-            with open(f, 'r') as file:
-                data = json.load(file)
-                self._clear_sequence()
-                # Support V3 (rpm, duration) and V4+ (type, val, duration)
-                for step in data:
-                    if isinstance(step, dict):
-                        # V4/V5/V6 format
-                        m = step.get("type", "RPM")
-                        v = step.get("val", 0)
-                        d = step.get("duration", 0)
-                        self.sequence_data.append({"type": m, "val": v, "duration": d})
-                        self.tree.insert("", "end", values=(m, v, d))
-                    elif isinstance(step, list):
-                        # V3 format (simple list of [rpm, duration])
-                        # We assume these are RPM
-                        self.sequence_data.append({"type": "RPM", "val": step[0], "duration": step[1]})
-                        self.tree.insert("", "end", values=("RPM", step[0], step[1]))
-
+            # Supports V3 (rpm, duration) and V4+ (type, val, duration)
+            steps = engine_module.load_routine(f)
+            self._clear_sequence()
+            for step in steps:
+                self.sequence_data.append(step)
+                self.tree.insert("", "end", values=(step["type"], step["val"], step["duration"]))
 
     def _clear_sequence(self):
         self.sequence_data = []
         for i in self.tree.get_children(): self.tree.delete(i)
 
     def _browse_file(self):
-        fname = f"Test_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M')}.csv"
-        f = filedialog.asksaveasfilename(initialfile=fname, defaultextension=".csv")
+        f = filedialog.asksaveasfilename(initialfile=engine_module.default_filename(), defaultextension=".csv")
         if f:
             # Check if file or its summary variant exists, and add iteration if needed
-            final_path = self._get_unique_filename(f)
-            self.save_filepath.set(final_path)
-
-    def _get_unique_filename(self, filepath):
-        """Check if file exists and add iteration number to avoid overwriting."""
-        if not os.path.exists(filepath):
-            return filepath
-        
-        # File exists, find a unique name
-        base, ext = os.path.splitext(filepath)
-        summary_path = f"{base}_Summary{ext}"
-        
-        iteration = 1
-        while True:
-            new_path = f"{base}_{iteration}{ext}"
-            new_summary_path = f"{base}_{iteration}_Summary{ext}"
-            
-            # Check both the main file and summary file don't exist
-            if not os.path.exists(new_path) and not os.path.exists(new_summary_path):
-                return new_path
-            
-            iteration += 1
-            if iteration > 1000:  # Safety check to prevent infinite loop
-                messagebox.showwarning("Warning", "Could not find unique filename after 1000 iterations.")
-                return filepath
-    
+            self.save_filepath.set(engine_module.unique_filename(f))
 
     def _emergency_stop(self):
-        self.stop_test_flag = True
-        if self.ser: self.ser.write(b"STOP\n")
+        self.engine.emergency_stop()
 
     def _set_ui_locked_for_test(self, locked):
         s = "disabled" if locked else "normal"
         self.btn_run.config(state=s)
 
-    def _read_serial_loop(self):
-        while True:
-            if self.is_connected and self.ser:
-                try:
-                    if self.ser.in_waiting:
-                        line = self.ser.readline().decode('utf-8', errors='ignore').strip()
-                        if "Mass:" in line:
-                            parts = line.split(',')
-                            for p in parts:
-                                if "Mass" in p: self.raw_mass_float = float(p.split(':')[1])
-                                if "Rate" in p: self.raw_rate_float = float(p.split(':')[1])
-                                if "RPM" in p: 
-                                    try: self.live_rpm_float = float(p.split(':')[1])
-                                    except: pass
-                                    self.root.after(0, self.current_rpm_str.set, f"{int(self.live_rpm_float)} RPM")
-                            
-                            self.root.after(0, self.current_mass_str.set, f"{self.raw_mass_float:.2f} g")
-                            self.root.after(0, self.current_rate_str.set, f"{self.raw_rate_float:.2f} g/s")
-                            
-                            if self.is_running_test or self.is_manual_active:
-                                self.rate_window.append(self.raw_rate_float)
-                                avg = sum(self.rate_window)/len(self.rate_window)
-                                t = len(self.graph_time) * 0.1 if self.is_running_test else time.time() - self.start_time_offset
-                                self.graph_time.append(t)
-                                self.graph_mass.append(self.raw_mass_float)
-                                self.graph_rate_raw.append(self.raw_rate_float)
-                                self.graph_rate_avg.append(avg)
-                except: pass
-            time.sleep(0.01)
-
     def _animate_graph(self):
-        if len(self.graph_time) > 1:
-            self.line_mass.set_data(self.graph_time, self.graph_mass)
-            self.line_rate_raw.set_data(self.graph_time, self.graph_rate_raw)
-            self.line_rate_avg.set_data(self.graph_time, self.graph_rate_avg)
-            self.ax1.relim(); self.ax1.autoscale_view()
-            self.ax2.relim(); self.ax2.autoscale_view()
-            self.canvas.draw()
+        self._drain_plot_samples()
+        if len(self.graph) > 1:
+            # Two points per horizontal pixel is all the screen can show
+            px = max(self.canvas.get_tk_widget().winfo_width(), 100)
+            self.graph_lod.set_max_bins(px // 2)
+            if self.graph.count <= px * 2:
+                # Short history: plot raw samples straight from the ring buffer
+                t, mass, rate_raw, rate_avg = self.graph.views()
+                self.line_mass.set_data(t, mass)
+                self.line_rate_raw.set_data(t, rate_raw)
+                self.line_rate_avg.set_data(t, rate_avg)
+            else:
+                # Redraw cost now depends on plot width, not on how long the test has run
+                self.line_mass.set_data(*self.graph_lod.series(0))
+                self.line_rate_raw.set_data(*self.graph_lod.series(1))
+                self.line_rate_avg.set_data(*self.graph_lod.series(2))
+            # Full redraw only when the running extents push an axis limit; see self.plotter.stats()
+            self.plotter.render()
         self.root.after(500, self._animate_graph)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Frozen exe: lets the ingest process start
     root = tk.Tk()
     app = DosingApp(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    app.graph.clear() # Deletes the spill file
\ No newline at end of file
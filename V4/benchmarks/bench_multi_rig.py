@@ -0,0 +1,105 @@
+"""
+Host CPU per rig as rigs are added to one RigManager event loop.
+
+N simulated rigs (rig_sim.RigSimulator, POSIX ptys) run in a child process
+so their cost stays out of the measurement. This process connects to all
+of them with multi_rig.RigManager and runs the same one-step routine on
+each, writing real raw/summary logs and results-store rows. Reported per
+rig count: frames ingested, process CPU (all threads, so log writers are
+included) in total and per rig, and event loop lag from a 10 ms probe.
+
+    python V4/benchmarks/bench_multi_rig.py [--rigs 1 2 4 8 16] [--seconds 10] [--frame-hz 80] [--binary]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from multi_rig import RigManager
+
+PROBE_S = 0.01  # Event loop lag probe period
+
+
+def _serve_rigs(n, frame_hz, conn):
+    # Child process: n simulators until the parent says stop
+    from rig_sim import RigSimulator, RigModel
+    sims = [RigSimulator(RigModel(seed=i), frame_hz=frame_hz).start() for i in range(n)]
+    conn.send([sim.port for sim in sims])
+    conn.recv()
+    for sim in sims: sim.stop()
+
+
+async def _lag_probe(stop, lags):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(PROBE_S)
+        lags.append(time.perf_counter() - t - PROBE_S)
+
+
+async def _run(ports, seconds, binary, out_dir):
+    manager = RigManager(os.path.join(out_dir, "results.sqlite"))
+    for port in ports: manager.add(port, binary=binary)
+    failed = await manager.connect_all()
+    if failed: raise RuntimeError(f"connect failed: {failed}")
+    steps = [{"type": "RPM", "val": 60, "duration": seconds}]
+    filenames = {rig: os.path.join(out_dir, f"rig{i}.csv") for i, rig in enumerate(manager.rigs)}
+
+    stop = asyncio.Event()
+    lags = []
+    probe = asyncio.create_task(_lag_probe(stop, lags))
+    frames0 = sum(rig.frames_in for rig in manager.rigs)
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    statuses = await manager.run_all(steps, filenames)
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    frames = sum(rig.frames_in for rig in manager.rigs) - frames0
+    stop.set()
+    await probe
+    dropped = sum(rig.seq_tracker.dropped for rig in manager.rigs)
+    manager.close()
+    lags.sort()
+    return {
+        "rigs": len(ports),
+        "complete": statuses.count("complete"),
+        "frames": frames,
+        "frames_per_s": frames / wall,
+        "dropped": dropped,
+        "cpu_pct": 100.0 * cpu / wall,
+        "cpu_pct_per_rig": 100.0 * cpu / wall / len(ports),
+        "lag_p50_ms": lags[len(lags) // 2] * 1000.0 if lags else 0.0,
+        "lag_max_ms": lags[-1] * 1000.0 if lags else 0.0,
+    }
+
+
+def run(rig_counts=(1, 2, 4, 8, 16), seconds=10.0, frame_hz=80.0, binary=False):
+    results = []
+    for n in rig_counts:
+        parent, child = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=_serve_rigs, args=(n, frame_hz, child), daemon=True)
+        proc.start()
+        ports = parent.recv()
+        try:
+            with tempfile.TemporaryDirectory() as out_dir:
+                results.append(asyncio.run(_run(ports, seconds, binary, out_dir)))
+        finally:
+            parent.send("stop")
+            proc.join(10)
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rigs", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Rig counts to measure")
+    ap.add_argument("--seconds", type=float, default=10.0, help="Routine length per measurement")
+    ap.add_argument("--frame-hz", type=float, default=80.0, help="ASCII telemetry rate per simulated rig")
+    ap.add_argument("--binary", action="store_true", help="Binary telemetry (80 SPS regardless of --frame-hz)")
+    a = ap.parse_args()
+
+    print(f"{'rigs':>4} {'done':>4} {'frames/s':>9} {'dropped':>7} {'CPU %':>6} {'CPU %/rig':>9} {'lag p50':>8} {'lag max':>8}")
+    for r in run(a.rigs, a.seconds, a.frame_hz, a.binary):
+        print(f"{r['rigs']:>4} {r['complete']:>4} {r['frames_per_s']:>9.0f} {r['dropped']:>7} {r['cpu_pct']:>6.1f} "
+              f"{r['cpu_pct_per_rig']:>9.2f} {r['lag_p50_ms']:>6.2f}ms {r['lag_max_ms']:>6.2f}ms")
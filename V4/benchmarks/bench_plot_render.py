@@ -0,0 +1,103 @@
+"""
+Live plot frame time: legacy full redraw vs. M4 decimation + blitting.
+
+Builds the same figure as DosingApp on the Agg backend, feeds it a
+recording of the given length and times one _animate_graph-style frame
+per simulated 500 ms tick.
+
+    python V4/benchmarks/bench_plot_render.py [hours] [sample_hz]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from blit_plot import BlitPlotter
+from decimation import M4Decimator
+
+PLOT_WIDTH_PX = 1200
+
+
+def make_figure():
+    fig = Figure(figsize=(PLOT_WIDTH_PX / 100, 3), dpi=100)
+    canvas = FigureCanvasAgg(fig)
+    ax1 = fig.add_subplot(111)
+    ax2 = ax1.twinx()
+    lm, = ax1.plot([], [], 'b-', label='Mass (g)', linewidth=1.5)
+    lr, = ax2.plot([], [], color='limegreen', alpha=0.3, linewidth=1, label='Raw Rate')
+    la, = ax2.plot([], [], color='darkgreen', linewidth=2.5, label='10s Avg Rate')
+    ax1.legend([lm, lr, la], [l.get_label() for l in (lm, lr, la)], loc='upper left')
+    canvas.draw()
+    return canvas, ax1, ax2, (lm, lr, la)
+
+
+def make_recording(n, hz):
+    t = np.arange(n) / hz
+    rate = 1.0 + 0.05 * np.random.randn(n)
+    mass = np.cumsum(rate) / hz
+    avg = np.convolve(rate, np.ones(100) / 100, mode="same")
+    return t, mass, rate, avg
+
+
+def frame_ticks(n, hz, frames):
+    # Indices at which a 500 ms UI tick fires, spread over the last part of the run
+    step = max(1, int(hz * 0.5))
+    return list(range(max(2, n - frames * step), n + 1, step))[-frames:]
+
+
+def run_legacy(t, mass, rate, avg, hz, frames):
+    canvas, ax1, ax2, (lm, lr, la) = make_figure()
+    times = []
+    for k in frame_ticks(len(t), hz, frames):
+        t0 = time.perf_counter()
+        lm.set_data(t[:k], mass[:k]); lr.set_data(t[:k], rate[:k]); la.set_data(t[:k], avg[:k])
+        ax1.relim(); ax1.autoscale_view()
+        ax2.relim(); ax2.autoscale_view()
+        canvas.draw()
+        times.append(time.perf_counter() - t0)
+    return times, None
+
+
+def run_blit(t, mass, rate, avg, hz, frames):
+    canvas, ax1, ax2, (lm, lr, la) = make_figure()
+    plotter = BlitPlotter(canvas, [(ax1, [lm]), (ax2, [lr, la])])
+    lod = M4Decimator(3, max_bins=PLOT_WIDTH_PX // 2)
+    ticks = frame_ticks(len(t), hz, frames)
+    fed = 0
+    times = []
+    for k in ticks:
+        # Ingest side (serial thread in the app), not part of the frame time
+        for i in range(fed, k):
+            lod.add(t[i], (mass[i], rate[i], avg[i]))
+            plotter.extents.observe(t[i], ((0, mass[i]), (1, rate[i]), (1, avg[i])))
+        fed = k
+        t0 = time.perf_counter()
+        lm.set_data(*lod.series(0)); lr.set_data(*lod.series(1)); la.set_data(*lod.series(2))
+        plotter.render()
+        times.append(time.perf_counter() - t0)
+    return times, plotter.stats()
+
+
+def summarise(name, times):
+    ms = sorted(1000.0 * x for x in times)
+    print(f"{name:22s}: mean {sum(ms) / len(ms):7.2f} ms   p95 {ms[int(0.95 * (len(ms) - 1))]:7.2f} ms   max {ms[-1]:7.2f} ms")
+
+
+if __name__ == "__main__":
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    hz = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    n = int(hours * 3600 * hz)
+    rec = make_recording(n, hz)
+    print(f"{hours:g} h at {hz:g} Hz = {n} samples, {PLOT_WIDTH_PX} px plot")
+    legacy, _ = run_legacy(*rec, hz, frames=20)
+    summarise("legacy draw()+relim()", legacy)
+    blit, stats = run_blit(*rec, hz, frames=20)
+    summarise("M4 + blit", blit)
+    print(f"full redraws in blit path: {stats['full_redraws']} of {stats['frames']} frames")
@@ -0,0 +1,55 @@
+"""
+Frames/sec ceiling of SerialReader.
+
+Pushes firmware-format lines through a pseudo-terminal (Linux/macOS) so the
+real pyserial read()/in_waiting path is exercised without a rig attached.
+
+    python V4/benchmarks/bench_serial_reader.py [n_frames]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import serial
+from serial_reader import SerialReader
+
+FRAME = b"Mass:123.45,Rate:1.23,RPM:80\n"
+FIRMWARE_HZ = 10
+
+
+def run(n_frames=200000, burst=1000):
+    master, slave = os.openpty()
+    ser = serial.Serial(os.ttyname(slave), timeout=0.2)
+    done = threading.Event()
+    received = [0]
+
+    def on_batch(lines):
+        received[0] += len(lines)
+        if received[0] >= n_frames:
+            done.set()
+
+    reader = SerialReader(ser, on_batch)
+    reader.start()
+    payload = FRAME * burst
+    t0 = time.perf_counter()
+    for _ in range(n_frames // burst):
+        os.write(master, payload)
+    done.wait(60)
+    elapsed = time.perf_counter() - t0
+    reader.stop()
+    ser.close()
+    os.close(master)
+    os.close(slave)
+    return received[0], elapsed, reader.stats()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    count, elapsed, stats = run(n)
+    fps = count / elapsed if elapsed > 0 else 0.0
+    print(f"Frames received : {count}/{n} in {elapsed:.3f} s")
+    print(f"Ceiling         : {fps:,.0f} frames/s ({fps / FIRMWARE_HZ:,.0f}x firmware {FIRMWARE_HZ} Hz)")
+    print(f"Reader stats    : {stats}")
@@ -0,0 +1,304 @@
+"""
+Host pipeline benchmark suite (Linux/macOS, no hardware needed).
+
+Runs every benchmark below, prints a table and, with -o, writes the
+results as JSON (one record per metric plus machine/version metadata) so
+runs of different versions can be compared with --compare.
+
+    python V4/benchmarks/bench_suite.py [-o results.json] [--quick] [--only parse,regression]
+    python V4/benchmarks/bench_suite.py --compare base.json new.json
+
+    parse       frames/s of TelemetryParser, the legacy split() loop and the binary decoder
+    latency     pty write -> parsed frame -> app state, p50/p95/p99 at 100 Hz
+    rolling     cost per sample of the 10 s rolling average (RollingStats vs. deque + sum)
+    logwrite    raw-log rows/s and caller latency per fsync policy
+    regression  calibration fit on 1k/100k/1M points (analysis.linear_fit vs. the pure-Python loop)
+    render      _animate_graph frame time at 1k/100k/1M samples (legacy draw vs. M4 + blit)
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import numpy as np
+
+import analysis
+import binary_protocol
+import bench_plot_render
+import bench_telemetry_parser
+from clock_sync import ClockSync, SequenceTracker
+from log_writer import GroupCommitWriter
+from raw_log import BinaryLogWriter, CSV_HEADER
+from rolling_stats import RollingStats
+from serial_reader import SerialReader
+from telemetry_parser import TelemetryParser
+from ui_refresh import LiveSnapshot
+
+SUITE_VERSION = 1
+
+
+class Results:
+    def __init__(self):
+        self.records = []
+
+    def add(self, bench, metric, value, unit, better="lower", **params):
+        self.records.append({"bench": bench, "metric": metric, "value": float(value), "unit": unit,
+                             "better": better, "params": params})
+        p = " ".join(f"{k}={v}" for k, v in params.items())
+        print(f"  {bench:10s} {metric:32s} {value:14,.3f} {unit:9s} {p}", flush=True)
+
+
+def percentiles(xs, ps=(50, 95, 99)):
+    a = np.asarray(xs)
+    return {p: float(np.percentile(a, p)) for p in ps}
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+# --- Benchmarks ---
+def bench_parse(res, quick):
+    n = 20000 if quick else 200000
+    data = bench_telemetry_parser.make_stream(n)
+    for name, fn in (("legacy_split", bench_telemetry_parser.legacy_parse), ("telemetry_parser", bench_telemetry_parser.parser_parse)):
+        t = best_of(lambda: fn(data), 3)
+        res.add("parse", f"{name}_frames_per_s", n / t, "frames/s", "higher", frames=n)
+    packets = b"".join(binary_protocol.encode_frame(i, i * 0.01, 1.0, 80.0, i) for i in range(n))
+
+    def dec():
+        d = binary_protocol.BinaryFrameDecoder()
+        for i in range(0, len(packets), 4096): d.feed(packets[i:i + 4096])
+    t = best_of(dec, 3)
+    res.add("parse", "binary_decoder_frames_per_s", n / t, "frames/s", "higher", frames=n)
+
+
+def bench_latency(res, quick):
+    import serial
+    n = 200 if quick else 1000
+    master, slave = os.openpty()
+    ser = serial.Serial(os.ttyname(slave), timeout=0.2)
+    clock, seqs = ClockSync(), SequenceTracker()
+    state = [None]
+    arrived = {}
+
+    def on_batch(frames):
+        # What _handle_serial_batch does before the plot/log work
+        now = time.perf_counter()
+        for f in frames:
+            if not seqs.observe(f.seq): continue
+            t = clock.observe(f.t_ms, time.monotonic())
+            state[0] = LiveSnapshot(f.mass, f.rate, f.rpm, t)
+            arrived[f.seq] = now
+
+    reader = SerialReader(ser, on_batch, framer=TelemetryParser())
+    reader.start()
+    sent = {}
+    for i in range(n):
+        sent[i] = time.perf_counter()
+        os.write(master, b"Mass:%.2f,Rate:1.00,RPM:80,T:%d,Seq:%d\n" % (i * 0.01, i * 10, i))
+        time.sleep(0.01)
+    time.sleep(0.2)
+    reader.stop()
+    ser.close()
+    os.close(master)
+    os.close(slave)
+    lat = [(arrived[i] - sent[i]) * 1e6 for i in sent if i in arrived]
+    for p, v in percentiles(lat).items():
+        res.add("latency", f"serial_to_state_p{p}_us", v, "us", frames=len(lat), rate_hz=100)
+    res.add("latency", "frames_lost", n - len(lat), "frames", frames=n)
+
+
+def bench_rolling(res, quick):
+    n = 100000 if quick else 1000000
+    rates = (1.0 + 0.05 * np.random.default_rng(0).standard_normal(n)).tolist()
+
+    def legacy():
+        w = deque(maxlen=100)
+        for r in rates:
+            w.append(r)
+            sum(w) / len(w)
+
+    def rolling():
+        s = RollingStats(window_s=10.0)
+        for i, r in enumerate(rates):
+            s.add(r, i * 0.1)
+            s.mean
+
+    for name, fn in (("deque_sum", legacy), ("rolling_stats", rolling)):
+        t = best_of(fn, 1 if not quick else 2)
+        res.add("rolling", f"{name}_ns_per_sample", t / n * 1e9, "ns", samples=n, window=100)
+
+
+def bench_logwrite(res, quick, directory):
+    rows = 2000 if quick else 10000
+    row = [12.34, "RPM", 80, "123.45", "1.23", "1", 3]
+    d = tempfile.mkdtemp(prefix="ccv_bench_", dir=directory)
+
+    def per_row(fsync):
+        import csv
+        lat = []
+        with open(os.path.join(d, f"per_row_{fsync}.csv"), "w", newline="") as f:
+            w = csv.writer(f)
+            t0 = time.perf_counter()
+            for _ in range(rows):
+                a = time.perf_counter()
+                w.writerow(row)
+                f.flush()
+                if fsync: os.fsync(f.fileno())
+                lat.append(time.perf_counter() - a)
+            return time.perf_counter() - t0, lat
+
+    def group(cls, fsync, name):
+        w = cls(os.path.join(d, name), header=CSV_HEADER, commit_interval_s=1.0, fsync=fsync)
+        r = (12.34, "RPM", 80, 123.45, 1.23, 1, 3) if cls is BinaryLogWriter else row
+        lat = []
+        t0 = time.perf_counter()
+        for _ in range(rows):
+            a = time.perf_counter()
+            w.write_row(r)
+            lat.append(time.perf_counter() - a)
+        w.close()
+        return time.perf_counter() - t0, lat, w.stats()
+
+    cases = [("flush_per_row", lambda: per_row(False)), ("fsync_per_row", lambda: per_row(True)),
+             ("group_commit_fsync", lambda: group(GroupCommitWriter, True, "gc.csv")[:2]),
+             ("group_commit_nofsync", lambda: group(GroupCommitWriter, False, "gcn.csv")[:2]),
+             ("binary_group_commit_fsync", lambda: group(BinaryLogWriter, True, "gc.ccvraw")[:2])]
+    for name, fn in cases:
+        total, lat = fn()
+        res.add("logwrite", f"{name}_rows_per_s", rows / total, "rows/s", "higher", rows=rows, dir=directory or tempfile.gettempdir())
+        res.add("logwrite", f"{name}_call_p99_us", percentiles([x * 1e6 for x in lat])[99], "us", rows=rows)
+    for fn in os.listdir(d): os.remove(os.path.join(d, fn))
+    os.rmdir(d)
+
+
+def legacy_fit(points):
+    # The pure-Python sums _perform_regression used before analysis.linear_fit
+    n = len(points)
+    sum_x = sum(rate for rpm, rate in points)
+    sum_y = sum(rpm for rpm, rate in points)
+    sum_xy = sum(rate * rpm for rpm, rate in points)
+    sum_x2 = sum(rate ** 2 for rpm, rate in points)
+    m = (n * sum_xy - sum_x * sum_y) / (n * sum_x2 - sum_x ** 2)
+    c = (sum_y - m * sum_x) / n
+    y_mean = sum_y / n
+    ss_tot = sum((rpm - y_mean) ** 2 for rpm, rate in points)
+    ss_res = sum((rpm - (m * rate + c)) ** 2 for rpm, rate in points)
+    return m, c, 1 - ss_res / ss_tot
+
+
+def bench_regression(res, quick):
+    rng = np.random.default_rng(1)
+    for n in (1000, 100000) if quick else (1000, 100000, 1000000):
+        rpm = rng.uniform(5, 300, n)
+        rate = rpm / 100 + rng.normal(0, 0.02, n)
+        pts = list(zip(rpm.tolist(), rate.tolist()))
+        reps = 3 if n < 1000000 else 1
+        res.add("regression", "legacy_python_ms", best_of(lambda: legacy_fit(pts), reps) * 1e3, "ms", points=n)
+        res.add("regression", "linear_fit_ms", best_of(lambda: analysis.linear_fit(rpm, rate), reps) * 1e3, "ms", points=n)
+
+
+def bench_render(res, quick):
+    import matplotlib
+    matplotlib.use("Agg")
+    hz = 10.0
+    sizes = (1000, 100000) if quick else (1000, 100000, 1000000)
+    for n in sizes:
+        rec = bench_plot_render.make_recording(n, hz)
+        frames = 5 if n >= 1000000 else 10
+        legacy, _ = bench_plot_render.run_legacy(*rec, hz, frames=frames)
+        blit, _ = bench_plot_render.run_blit(*rec, hz, frames=frames)
+        for name, times in (("legacy_frame", legacy), ("m4_blit_frame", blit)):
+            ms = [t * 1e3 for t in times]
+            res.add("render", f"{name}_mean_ms", sum(ms) / len(ms), "ms", samples=n)
+            res.add("render", f"{name}_p95_ms", percentiles(ms, (95,))[95], "ms", samples=n)
+
+
+BENCHES = {
+    "parse": bench_parse,
+    "latency": bench_latency,
+    "rolling": bench_rolling,
+    "logwrite": bench_logwrite,
+    "regression": bench_regression,
+    "render": bench_render,
+}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "suite_version": SUITE_VERSION,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(base_path, new_path):
+    with open(base_path) as f: base = json.load(f)
+    with open(new_path) as f: new = json.load(f)
+    key = lambda r: (r["bench"], r["metric"], json.dumps(r["params"], sort_keys=True))
+    old = {key(r): r for r in base["results"]}
+    print(f"{base['meta'].get('git_commit', '?')} -> {new['meta'].get('git_commit', '?')}")
+    for r in new["results"]:
+        o = old.get(key(r))
+        if not o or not o["value"]: continue
+        ratio = r["value"] / o["value"]
+        gain = ratio if r["better"] == "higher" else 1 / ratio if ratio else float("inf")
+        flag = "  better" if gain > 1.1 else "  WORSE" if gain < 0.9 else ""
+        p = " ".join(f"{k}={v}" for k, v in r["params"].items() if k not in ("dir",))
+        print(f"  {r['bench']:10s} {r['metric']:32s} {o['value']:12,.3f} -> {r['value']:12,.3f} {r['unit']:9s} x{gain:6.2f}{flag}  {p}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="CCV host pipeline benchmarks.")
+    ap.add_argument("-o", "--out", help="Write results as JSON to this file")
+    ap.add_argument("--only", help="Comma-separated subset of: " + ", ".join(BENCHES))
+    ap.add_argument("--quick", action="store_true", help="Smaller sizes (smoke test)")
+    ap.add_argument("--log-dir", default=None, help="Directory for the log write benchmark (default: temp dir)")
+    ap.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="Compare two result files and exit")
+    a = ap.parse_args(argv)
+
+    if a.compare:
+        compare(*a.compare)
+        return 0
+
+    names = a.only.split(",") if a.only else list(BENCHES)
+    res = Results()
+    meta = metadata()
+    print(f"bench_suite @ {meta['git_commit'] or 'unknown'}  python {meta['python']}  {meta['platform']}")
+    for name in names:
+        fn = BENCHES[name]
+        if name == "logwrite": fn(res, a.quick, a.log_dir)
+        else: fn(res, a.quick)
+    if a.out:
+        with open(a.out, "w") as f:
+            json.dump({"meta": meta, "results": res.records}, f, indent=1)
+        print(f"-> {a.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+Per-frame parse cost: TelemetryParser vs. the split()-based loop it replaced.
+
+    python V4/benchmarks/bench_telemetry_parser.py [n_frames]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from telemetry_parser import TelemetryParser
+
+
+def make_stream(n):
+    return b"".join(b"Mass:%.2f,Rate:%.2f,RPM:%d\n" % (i * 0.01, 1.0 + (i % 7) * 0.1, 80) for i in range(n))
+
+
+def legacy_parse(data):
+    # Pre-parser logic from _read_serial_loop, minus the Tk calls
+    out = []
+    for raw in data.split(b"\n"):
+        try:
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if "Mass:" in line:
+                mass = rate = rpm = 0.0
+                for p in line.split(','):
+                    if "Mass" in p: mass = float(p.split(':')[1])
+                    if "Rate" in p: rate = float(p.split(':')[1])
+                    if "RPM" in p: rpm = float(p.split(':')[1])
+                out.append((mass, rate, rpm))
+        except: pass
+    return out
+
+
+def parser_parse(data, chunk=4096):
+    # Fed in port-sized chunks, as SerialReader does
+    p = TelemetryParser()
+    out = []
+    for i in range(0, len(data), chunk):
+        out.extend(p.feed(data[i:i + chunk]))
+    return out
+
+
+def bench(fn, data, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        n = len(fn(data))
+        best = min(best, time.perf_counter() - t0)
+    return n, best
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    data = make_stream(n)
+    for name, fn in (("legacy split()", legacy_parse), ("TelemetryParser", parser_parse)):
+        count, t = bench(fn, data)
+        print(f"{name:16s}: {count} frames, {t * 1e9 / count:7.0f} ns/frame, {count / t:12,.0f} frames/s")
@@ -0,0 +1,127 @@
+import binascii
+import struct
+import time
+
+from telemetry_parser import TelemetryFrame
+
+# --- WIRE FORMAT (must match TelemetryPacket in MCM_CCV_RIG_FullRange.ino) ---
+# A5 5A | seq:u16 | t_ms:u32 | mass:f32 | rate:f32 | rpm:f32 | crc16:u16     (little-endian, 22 bytes)
+# CRC is CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF) over seq..rpm.
+SYNC = b"\xA5\x5A"
+PACKET = struct.Struct("<2xHIfffH")
+SEQ_MODULUS = 1 << 16
+PACKET_SIZE = PACKET.size
+_BODY_START = 2
+_BODY_END = PACKET_SIZE - 2
+
+DEFAULT_BAUD = 115200
+BINARY_BAUD = 921600
+KEEPALIVE_S = 1.0  # Firmware drops back to ASCII @ 115200 after 5 s without host traffic
+SILENCE_S = 5 * KEEPALIVE_S  # No valid packet for this long: the rig has left binary mode, renegotiate
+
+
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(seq, mass, rate, rpm, t_ms=0):
+    """Build one packet exactly as the firmware does (used by simulators and benchmarks)."""
+    body = struct.pack("<HIfff", seq & 0xFFFF, t_ms & 0xFFFFFFFF, mass, rate, rpm)
+    return SYNC + body + struct.pack("<H", crc16(body))
+
+
+class BinaryFrameDecoder:
+    """
+    Incremental decoder for binary telemetry packets.
+
+    Works in place on one bytearray through a memoryview; struct.unpack_from
+    and the CRC both read from the view, so no per-packet slices are copied.
+    Has the same feed()/stats() interface as TelemetryParser and can be used
+    as a SerialReader framer.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self.frames = 0
+        self.crc_errors = 0
+        self.resyncs = 0
+        self.skipped_bytes = 0
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        n = len(buf)
+        out = []
+        pos = 0
+        unpack_from = PACKET.unpack_from
+        with memoryview(buf) as mv:
+            while True:
+                i = buf.find(SYNC, pos)
+                if i < 0:
+                    # Hold back a trailing 0xA5 in case it is the first half of the next sync word
+                    keep = n - 1 if n > pos and buf[-1] == SYNC[0] else n
+                    self.skipped_bytes += keep - pos
+                    pos = keep
+                    break
+                if i != pos:
+                    self.resyncs += 1
+                    self.skipped_bytes += i - pos
+                if i + PACKET_SIZE > n:
+                    pos = i
+                    break
+                seq, t_ms, mass, rate, rpm, crc = unpack_from(mv, i)
+                if binascii.crc_hqx(mv[i + _BODY_START:i + _BODY_END], 0xFFFF) != crc:
+                    # Either corruption or a false sync inside another packet; rescan from the next byte
+                    self.crc_errors += 1
+                    self.skipped_bytes += 1
+                    pos = i + 1
+                    continue
+                out.append(TelemetryFrame(mass, rate, rpm, seq, t_ms))
+                pos = i + PACKET_SIZE
+        del buf[:pos]
+        self.frames += len(out)
+        return out
+
+    def reset(self):
+        self._buf.clear()
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "crc_errors": self.crc_errors,
+            "resyncs": self.resyncs,
+            "skipped_bytes": self.skipped_bytes,
+        }
+
+
+# --- HANDSHAKE ---
+def negotiate_binary(ser, baud=BINARY_BAUD, timeout=2.0):
+    """
+    Ask the rig to switch to binary telemetry at `baud`.
+
+    Must run before the SerialReader is started, since it reads the reply
+    itself. Returns True once the rig has acknowledged and the host port has
+    been moved to the new baud rate. Older firmware never answers, in which
+    case the port is left untouched in ASCII mode and False is returned.
+    """
+    ser.reset_input_buffer()
+    ser.write(f"BIN:{int(baud)}\n".encode())
+    ack = f"ACK:BIN:{int(baud)}".encode()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        line = ser.readline()
+        if ack in line:
+            ser.flush()
+            ser.baudrate = baud
+            # Anything still buffered was sent at the old rate and is garbage now
+            time.sleep(0.05)
+            ser.reset_input_buffer()
+            return True
+    return False
+
+
+def leave_binary(ser):
+    """Return the rig to ASCII telemetry at the default baud (best effort, e.g. before closing)."""
+    ser.write(b"ASCII\n")
+    ser.flush()
+    ser.baudrate = DEFAULT_BAUD
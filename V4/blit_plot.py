@@ -0,0 +1,130 @@
+import time
+from collections import deque
+
+
+class RunningExtents:
+    """O(1) running x range and per-axis y range, fed sample by sample."""
+
+    def __init__(self, n_axes):
+        self.n_axes = n_axes
+        self.reset()
+
+    def reset(self):
+        self.xmin = self.xmax = None
+        self.ymin = [None] * self.n_axes
+        self.ymax = [None] * self.n_axes
+
+    def observe(self, x, ys):
+        """ys is one (axis_index, value) pair per plotted series."""
+        if self.xmin is None:
+            self.xmin = self.xmax = x
+        elif x > self.xmax: self.xmax = x
+        elif x < self.xmin: self.xmin = x
+        ymin, ymax = self.ymin, self.ymax
+        for a, y in ys:
+            if ymin[a] is None:
+                ymin[a] = ymax[a] = y
+            elif y < ymin[a]: ymin[a] = y
+            elif y > ymax[a]: ymax[a] = y
+
+
+class BlitPlotter:
+    """
+    Blitting renderer for a figure whose only moving parts are a few Line2D artists.
+
+    Axes, ticks, labels and the legend are rendered once into a cached
+    background. Each frame restores that background and redraws only the
+    lines. Limits come from RunningExtents and only ever grow, with headroom;
+    a full canvas.draw() happens only when a limit has to move.
+
+    Every render() is timed; see stats() (and frame_hist, an optional
+    metrics.Histogram).
+    """
+
+    def __init__(self, canvas, axes_lines, x_headroom=0.25, y_pad=0.1, history=1000, frame_hist=None):
+        self.canvas = canvas
+        self.fig = canvas.figure
+        self.axes_lines = axes_lines  # [(ax, [line, ...]), ...], first axis owns the shared x
+        self.extents = RunningExtents(len(axes_lines))
+        self.x_headroom = x_headroom
+        self.y_pad = y_pad
+        self._bg = None
+        self._limits = None
+
+        for _, lines in axes_lines:
+            for line in lines: line.set_animated(True)
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+        # Frame-time accounting
+        self.frame_times = deque(maxlen=history)
+        self.frame_hist = frame_hist
+        self.frames = 0
+        self.full_redraws = 0
+
+    def reset(self):
+        self.extents.reset()
+        self._limits = None
+
+    def _on_draw(self, event):
+        # Any full draw (ours, a resize, a theme change) refreshes the cached background
+        self._bg = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for ax, lines in self.axes_lines:
+            for line in lines: ax.draw_artist(line)
+
+    def _wanted_limits(self):
+        ext = self.extents
+        if ext.xmin is None:
+            return None
+        cur = self._limits
+        x0, x1 = ext.xmin, ext.xmax
+        if cur is None or x0 < cur[0][0] or x1 > cur[0][1]:
+            span = max(x1 - x0, 1.0)
+            xlim = (x0, x1 + span * self.x_headroom)
+        else:
+            xlim = cur[0]
+        ylims = []
+        for a in range(len(self.axes_lines)):
+            lo, hi = ext.ymin[a], ext.ymax[a]
+            if lo is None:
+                ylims.append(cur[a + 1] if cur else (0.0, 1.0))
+                continue
+            if cur is None or lo < cur[a + 1][0] or hi > cur[a + 1][1]:
+                pad = max((hi - lo) * self.y_pad, 0.1)
+                ylims.append((lo - pad, hi + pad))
+            else:
+                ylims.append(cur[a + 1])
+        return (xlim, *ylims)
+
+    def render(self):
+        t0 = time.perf_counter()
+        wanted = self._wanted_limits()
+        if wanted is not None and (wanted != self._limits or self._bg is None):
+            self._limits = wanted
+            self.axes_lines[0][0].set_xlim(*wanted[0])
+            for (ax, _), ylim in zip(self.axes_lines, wanted[1:]):
+                ax.set_ylim(*ylim)
+            self.canvas.draw()  # _on_draw caches the new background and draws the lines
+            self.full_redraws += 1
+        elif self._bg is not None:
+            self.canvas.restore_region(self._bg)
+            self._draw_lines()
+        self.canvas.blit(self.fig.bbox)
+        dt = time.perf_counter() - t0
+        self.frame_times.append(dt)
+        if self.frame_hist is not None: self.frame_hist.observe(dt)
+        self.frames += 1
+
+    def stats(self):
+        ft = sorted(self.frame_times)
+        if not ft:
+            return {"frames": 0, "full_redraws": 0}
+        return {
+            "frames": self.frames,
+            "full_redraws": self.full_redraws,
+            "mean_ms": 1000.0 * sum(ft) / len(ft),
+            "p95_ms": 1000.0 * ft[int(0.95 * (len(ft) - 1))],
+            "max_ms": 1000.0 * ft[-1],
+        }
@@ -0,0 +1,135 @@
+from collections import deque
+
+MILLIS_WRAP = 1 << 32  # ESP32 millis() is a uint32_t and wraps after ~49.7 days
+
+
+class ClockSync:
+    """
+    Maps the rig's millis() onto the host's time.monotonic().
+
+    Every received frame gives one observation delta = host_rx - device_t.
+    Transport delay and host stalls only ever make delta larger, so the lower
+    envelope of delta is the true offset. The minimum is taken per bucket of
+    device time and a straight line fitted through the bucket minima gives the
+    offset and the relative drift of the two clocks (crystal ppm error).
+    """
+
+    def __init__(self, bucket_s=5.0, max_buckets=24):
+        self.bucket_s = bucket_s
+        self._minima = deque(maxlen=max_buckets)  # (device_s, delta) per completed bucket
+        self.resets = 0
+        self._reset_state()
+
+    def _reset_state(self):
+        self._minima.clear()
+        self._last_raw = None
+        self._wraps = 0
+        self._bucket = None
+        self._bucket_min = None
+        self.offset = None  # host_s - device_s at device_s == 0
+        self.drift = 0.0    # host seconds gained per device second
+
+    def device_seconds(self, t_ms):
+        """Unwrapped device time in seconds."""
+        if self._last_raw is not None and t_ms < self._last_raw:
+            if self._last_raw - t_ms > MILLIS_WRAP // 2:
+                self._wraps += 1
+            elif self._last_raw - t_ms > 1000:
+                # Clock went backwards by more than jitter: the rig rebooted
+                self.resets += 1
+                self._reset_state()
+        self._last_raw = t_ms
+        return (t_ms + self._wraps * MILLIS_WRAP) / 1000.0
+
+    def observe(self, t_ms, host_s):
+        """Record one frame; returns its sample time on the host monotonic clock."""
+        dev = self.device_seconds(t_ms)
+        delta = host_s - dev
+        bucket = int(dev // self.bucket_s)
+        if bucket != self._bucket:
+            if self._bucket_min is not None:
+                self._minima.append(self._bucket_min)
+                self._refit()
+            self._bucket = bucket
+            self._bucket_min = (dev, delta)
+        elif delta < self._bucket_min[1]:
+            self._bucket_min = (dev, delta)
+
+        if self.offset is None or len(self._minima) < 2:
+            # Not enough history for a drift estimate yet; track the lowest delta seen so far
+            best = self._bucket_min[1]
+            if self._minima: best = min(best, min(d for _, d in self._minima))
+            self.offset = best
+        return self.to_host(dev)
+
+    def _refit(self):
+        n = len(self._minima)
+        if n < 2:
+            return
+        sx = sy = sxx = sxy = 0.0
+        for x, y in self._minima:
+            sx += x; sy += y; sxx += x * x; sxy += x * y
+        den = n * sxx - sx * sx
+        if abs(den) < 1e-12:
+            return
+        self.drift = (n * sxy - sx * sy) / den
+        self.offset = (sy - self.drift * sx) / n
+
+    def to_host(self, dev_s):
+        """Device seconds (unwrapped) -> host monotonic seconds."""
+        return dev_s + self.offset + self.drift * dev_s
+
+    def stats(self):
+        return {"offset_s": self.offset, "drift_ppm": self.drift * 1e6, "resets": self.resets}
+
+
+class SequenceTracker:
+    """Counts dropped, duplicated and out-of-order frames from the rig's sequence counter."""
+
+    def __init__(self, modulus=MILLIS_WRAP, max_reorder=64):
+        self.modulus = modulus
+        self.max_reorder = max_reorder  # Further back than this is a rig restart, not a late frame
+        self.expected = None
+        self.received = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.restarts = 0
+
+    def observe(self, seq):
+        """Returns False if the frame repeats or predates one already seen and should be ignored."""
+        self.received += 1
+        if self.expected is None:
+            self.expected = (seq + 1) % self.modulus
+            return True
+        diff = (seq - self.expected) % self.modulus
+        if diff == 0:
+            self.expected = (seq + 1) % self.modulus
+            return True
+        if diff < self.modulus // 2:
+            # Jumped ahead: diff frames never arrived
+            self.dropped += diff
+            self.expected = (seq + 1) % self.modulus
+            return True
+        behind = self.modulus - diff
+        if behind == 1:
+            self.duplicates += 1
+        elif behind <= self.max_reorder:
+            self.out_of_order += 1
+        else:
+            self.restarts += 1
+            self.expected = (seq + 1) % self.modulus
+            return True
+        return False
+
+    def reset(self):
+        self.expected = None
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "dropped": self.dropped,
+            "duplicates": self.duplicates,
+            "out_of_order": self.out_of_order,
+            "restarts": self.restarts,
+        }
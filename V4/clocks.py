@@ -0,0 +1,106 @@
+"""
+Clocks for the test runner: the real monotonic clock, or virtual time.
+
+A clock provides now(), sleep(dt) and queue(), the frame queue type whose
+get(timeout) waits on that clock. With VirtualClock nothing ever blocks:
+waiting advances virtual time straight to the next scheduled event (a rig
+model producing a frame, say), so a routine of any length runs as fast as
+the code it exercises.
+"""
+import heapq
+import itertools
+import queue
+import time
+from collections import deque
+
+
+class SystemClock:
+    """Wall time (time.monotonic) with real sleeps and thread-safe queues."""
+
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, dt):
+        time.sleep(dt)
+
+    def queue(self):
+        return queue.Queue()
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+class VirtualClock:
+    """
+    Discrete-event virtual time (seconds), single-threaded.
+
+    call_at/call_every schedule callbacks; sleep() and VirtualQueue.get()
+    run them in time order while moving now() forward. Ties run in
+    scheduling order, so a run is fully deterministic.
+    """
+
+    def __init__(self, t0=0.0):
+        self.t = t0
+        self._events = []  # (t, order, fn)
+        self._order = itertools.count()
+
+    def now(self):
+        return self.t
+
+    def call_at(self, t, fn):
+        heapq.heappush(self._events, (t, next(self._order), fn))
+
+    def call_every(self, period, fn, start=None):
+        """fn() every period seconds from start (default: one period from now) until it returns False."""
+        at = [self.t + period if start is None else start]
+
+        def tick():
+            if fn() is False: return
+            at[0] += period
+            self.call_at(at[0], tick)
+        self.call_at(at[0], tick)
+
+    def next_event(self):
+        return self._events[0][0] if self._events else None
+
+    def advance_to(self, t):
+        events = self._events
+        while events and events[0][0] <= t:
+            et, _, fn = heapq.heappop(events)
+            if et > self.t: self.t = et
+            fn()
+        if t > self.t: self.t = t
+
+    def sleep(self, dt):
+        self.advance_to(self.t + dt)
+
+    def queue(self):
+        return VirtualQueue(self)
+
+
+class VirtualQueue:
+    """queue.Queue look-alike whose get(timeout) waits in virtual time."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self._items = deque()
+
+    def put(self, item):
+        self._items.append(item)
+
+    def qsize(self):
+        return len(self._items)
+
+    def get(self, block=True, timeout=None):
+        clock = self.clock
+        deadline = float("inf") if (timeout is None and block) else clock.t + (timeout or 0.0)
+        while not self._items:
+            nxt = clock.next_event()
+            if nxt is None or nxt > deadline:
+                if deadline != float("inf"): clock.advance_to(deadline)
+                raise queue.Empty
+            clock.advance_to(nxt)
+        return self._items.popleft()
+
+    def get_nowait(self):
+        return self.get(block=False)
@@ -0,0 +1,8 @@
+"""pytest setup for V4: the modules are flat scripts, imported by name from this folder."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# test_runner.py is the step runner, not a test module
+collect_ignore = ["test_runner.py"]
@@ -0,0 +1,144 @@
+import threading
+
+import numpy as np
+
+# Column layout of one bin: first, min, max, last (M4 aggregation)
+_FIRST, _MIN, _MAX, _LAST = 0, 1, 2, 3
+
+
+class M4Decimator:
+    """
+    Incremental M4 (first/min/max/last) decimation of several series sharing one time axis.
+
+    Samples are folded into fixed-width time bins as they arrive. When the
+    bins no longer cover the recorded span, the width doubles and neighbouring
+    bins are merged, so the output never exceeds 4 * max_bins points no
+    matter how long the recording is. With max_bins = plot width / 2 that is
+    two points per horizontal pixel, and every pixel column still shows the
+    true extremes of the data behind it.
+
+    In the app every call runs on the Tk thread: add() from
+    _drain_plot_samples, which drains the "plot" subscription of the
+    telemetry bus, series() from the redraw and clear() from the graph reset.
+    The internal lock is only there for callers that split add() and
+    series() across threads.
+    """
+
+    def __init__(self, n_series, max_bins=600, min_width=0.05):
+        self.n_series = n_series
+        self.max_bins = max_bins
+        self.min_width = min_width
+        self._lock = threading.Lock()
+        self._alloc(max_bins)
+        self.clear()
+
+    def _alloc(self, size):
+        self._k = np.zeros(size, dtype=np.int64)
+        self._t = np.zeros((self.n_series, size, 4))
+        self._v = np.zeros((self.n_series, size, 4))
+
+    def clear(self):
+        with self._lock:
+            self.t0 = None
+            self.width = self.min_width
+            self.n_closed = 0
+            self.samples = 0
+            self._cur = None  # Open bin index
+            self._open_t = None
+            self._open_v = None
+
+    def set_max_bins(self, max_bins):
+        """Resize for a new plot width. Shrinking merges immediately; growing takes effect as data arrives."""
+        max_bins = max(8, int(max_bins))
+        with self._lock:
+            if max_bins > len(self._k):
+                k, t, v = self._k, self._t, self._v
+                self._alloc(max_bins)
+                n = self.n_closed
+                self._k[:n], self._t[:, :n], self._v[:, :n] = k[:n], t[:, :n], v[:, :n]
+            self.max_bins = max_bins
+            while self._cur is not None and self._cur >= self.max_bins:
+                self._merge()
+
+    def add(self, t, values):
+        with self._lock:
+            self.samples += 1
+            if self.t0 is None:
+                self.t0 = t
+                self._open(0, t, values)
+                return
+            k = int((t - self.t0) / self.width)
+            if k <= self._cur:
+                # Same bin (or a slightly out-of-order timestamp): fold into the open bin
+                ot, ov = self._open_t, self._open_v
+                for i, y in enumerate(values):
+                    if y < ov[i][_MIN]: ov[i][_MIN] = y; ot[i][_MIN] = t
+                    if y > ov[i][_MAX]: ov[i][_MAX] = y; ot[i][_MAX] = t
+                    ov[i][_LAST] = y; ot[i][_LAST] = t
+                return
+            self._close()
+            while k >= self.max_bins:
+                self._merge()
+                k = int((t - self.t0) / self.width)
+            self._open(k, t, values)
+
+    def _open(self, k, t, values):
+        self._cur = k
+        self._open_t = [[t, t, t, t] for _ in values]
+        self._open_v = [[y, y, y, y] for y in values]
+
+    def _close(self):
+        n = self.n_closed
+        self._k[n] = self._cur
+        self._t[:, n] = self._open_t
+        self._v[:, n] = self._open_v
+        self.n_closed = n + 1
+
+    def _merge(self):
+        # Double the bin width and combine each pair of neighbouring bins (vectorised, O(bins))
+        self.width *= 2
+        self._cur //= 2
+        n = self.n_closed
+        if n:
+            nk = self._k[:n] // 2
+            a = np.flatnonzero(np.r_[True, nk[1:] != nk[:-1]])  # First bin of each merged pair
+            b = np.r_[a[1:], n] - 1                              # Last bin of each merged pair
+            t, v = self._t[:, :n], self._v[:, :n]
+            nt = np.empty((self.n_series, len(a), 4))
+            nv = np.empty_like(nt)
+            nt[:, :, _FIRST], nv[:, :, _FIRST] = t[:, a, _FIRST], v[:, a, _FIRST]
+            nt[:, :, _LAST], nv[:, :, _LAST] = t[:, b, _LAST], v[:, b, _LAST]
+            use_b = v[:, b, _MIN] < v[:, a, _MIN]
+            nt[:, :, _MIN] = np.where(use_b, t[:, b, _MIN], t[:, a, _MIN])
+            nv[:, :, _MIN] = np.where(use_b, v[:, b, _MIN], v[:, a, _MIN])
+            use_b = v[:, b, _MAX] > v[:, a, _MAX]
+            nt[:, :, _MAX] = np.where(use_b, t[:, b, _MAX], t[:, a, _MAX])
+            nv[:, :, _MAX] = np.where(use_b, v[:, b, _MAX], v[:, a, _MAX])
+            m = len(a)
+            self._k[:m] = nk[a]
+            self._t[:, :m], self._v[:, :m] = nt, nv
+            self.n_closed = n = m
+
+        # The open bin may now share its index with the last closed one
+        if n and self._k[n - 1] == self._cur:
+            self.n_closed = n = n - 1
+            ot, ov = self._open_t, self._open_v
+            for i in range(self.n_series):
+                ct, cv = self._t[i, n], self._v[i, n]
+                ot[i][_FIRST], ov[i][_FIRST] = ct[_FIRST], cv[_FIRST]
+                if cv[_MIN] <= ov[i][_MIN]: ot[i][_MIN], ov[i][_MIN] = ct[_MIN], cv[_MIN]
+                if cv[_MAX] >= ov[i][_MAX]: ot[i][_MAX], ov[i][_MAX] = ct[_MAX], cv[_MAX]
+
+    def series(self, i):
+        """Decimated (t, y) arrays for series i, in time order, ready for Line2D.set_data."""
+        with self._lock:
+            if self.t0 is None:
+                return np.empty(0), np.empty(0)
+            n = self.n_closed
+            t = np.concatenate([self._t[i, :n], [self._open_t[i]]])
+            v = np.concatenate([self._v[i, :n], [self._open_v[i]]])
+        # Within each bin emit first, then min/max in the order they occurred, then last
+        swap = t[:, _MIN] > t[:, _MAX]
+        order = np.where(swap[:, None], [_FIRST, _MAX, _MIN, _LAST], [_FIRST, _MIN, _MAX, _LAST])
+        rows = np.arange(len(t))[:, None]
+        return t[rows, order].ravel(), v[rows, order].ravel()
@@ -0,0 +1,755 @@
+"""
+Headless dosing engine: connection, telemetry state, test runs and outputs.
+
+Everything the rig needs except the GUI. DosingEngine owns the serial
+port and ingest thread, the live snapshot, the step runner with its raw
+and summary logs and the results store, and the calibration fit. Front
+ends subscribe to events with on(); auto_ccv_V4.py is one, the CLI below
+is another. Importing this module pulls in neither tkinter nor matplotlib.
+
+    python engine.py routine.json --port COM3 [-o Test.csv] [--mode CAL] [--binary] [--binary-log] [--upload-cal]
+    python engine.py --curve 20 100 10 --port /dev/ttyUSB0 --mode CAL
+    python engine.py --list-ports
+    python engine.py routine.json --port COM3 --metrics-port 9464   # http://127.0.0.1:9464/metrics
+    python engine.py routine.json --port COM3 --profile             # Test_*_Profile.* next to the raw log
+
+Live samples are published on engine.bus (telemetry_bus.TelemetryBus);
+consumers subscribe there with their own bounded queue. engine.latest is
+the newest sample.
+
+engine.metrics (metrics.Registry) counts frames, parse errors, drops, serial
+read latency, writer queue depth, log commit (fsync) latency and step
+timing. serve_metrics() exposes it on loopback in Prometheus text format;
+each test run also writes it next to its logs (metrics_path()).
+
+Events (callbacks run on the engine's threads, not a UI thread):
+    connected(port)
+    disconnected(error)       error is None for a requested disconnect
+    test_started(op_mode, steps)
+    step(result)              test_runner.StepResult of each finished step
+    test_finished(status, error, samples_lost)   status: "complete", "stopped" or "error";
+                              samples_lost: samples the runner never saw (normally 0)
+    profile_written(paths)    reports of a profiled test run or manual session (profile_runs)
+    warning(message)          something failed without stopping the engine (results store, metrics
+                              dump, a listener); printed to stderr if nobody listens
+"""
+import argparse
+import ctypes
+import datetime
+import json
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+
+import serial
+import serial.tools.list_ports
+
+import analysis
+import binary_protocol
+import metrics
+import profiling
+import raw_log as raw_log_module
+from clock_sync import ClockSync, SequenceTracker, MILLIS_WRAP
+from clocks import SYSTEM_CLOCK
+from log_writer import GroupCommitWriter
+from results_store import ResultsStore, DEFAULT_DB_PATH
+from serial_reader import SerialReader
+from telemetry_parser import TelemetryParser
+from test_runner import TestRunner
+from telemetry_bus import TelemetryBus, DROP_NEWEST
+from ui_refresh import LiveSnapshot
+
+# Raw log group commit: one write+fsync per interval or per this many pending bytes
+LOG_COMMIT_INTERVAL_S = 1.0
+LOG_COMMIT_BYTES = 64 * 1024
+
+RUNNER_QUEUE_SIZE = 1 << 16  # Samples the test runner may fall behind by (~13 min at 80 SPS) before samples are lost (and counted)
+
+# Files one run writes under the stem of its raw log name; a stem is taken if any of them exists
+RUN_FILE_SUFFIXES = (".csv", raw_log_module.EXTENSION, "_Summary.csv", "_Metrics.prom", "_Profile.pstats")
+
+# Parser / ring counters reported as ccv_parse_errors_total{kind=...}
+PARSE_ERROR_KINDS = ("rejected", "resyncs", "overflows", "crc_errors")
+
+SUMMARY_HEADER = ["Step_Num", "TargetRPM", "Duration_s", "Grams_Dispensed", "CCV_Value"]  # V3 Standard Header
+
+
+# --- ROUTINES & FILES ---
+def load_routine(path):
+    """Steps of a routine JSON: V3 ([rpm, duration] lists) or V4+ ({"type", "val", "duration"})."""
+    with open(path, "r") as file:
+        data = json.load(file)
+    steps = []
+    for step in data:
+        if isinstance(step, dict):
+            steps.append({"type": step.get("type", "RPM"), "val": step.get("val", 0), "duration": step.get("duration", 0)})
+        elif isinstance(step, list):
+            # V3 format, always RPM
+            steps.append({"type": "RPM", "val": step[0], "duration": step[1]})
+    return steps
+
+
+def save_routine(path, steps):
+    with open(path, "w") as file: json.dump(steps, file, indent=4)
+
+
+def curve_points(low_rpm, high_rpm):
+    """The 7 RPM points of the linear fit test."""
+    # 0: 0.8 * Low (80% of low)
+    # 1: Low
+    # 2: Low + (High-Low)/3
+    # 3: (Low+High)/2 (Midpoint)
+    # 4: Low + 2*(High-Low)/3
+    # 5: High
+    # 6: 1.2 * High (120% of high)
+    rpm_range = high_rpm - low_rpm
+    return [
+        0.8 * low_rpm,
+        low_rpm,
+        low_rpm + rpm_range / 3.0,
+        (low_rpm + high_rpm) / 2.0,
+        low_rpm + 2.0 * rpm_range / 3.0,
+        high_rpm,
+        1.2 * high_rpm
+    ]
+
+
+def summary_path(filename):
+    return filename.replace(".csv", "_Summary.csv")
+
+
+def metrics_path(filename):
+    return os.path.splitext(filename)[0] + "_Metrics.prom"
+
+
+def default_filename():
+    return f"Test_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M')}.csv"
+
+
+def manual_profile_base():
+    return f"Manual_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+
+
+def unique_filename(filepath):
+    """
+    filepath, or filepath with the next free _<n> suffix if any output of a
+    run under its stem exists (raw CSV or .ccvraw, summary, metrics, profile).
+    """
+    base, ext = os.path.splitext(filepath)
+    folder, stem = os.path.split(base)
+    suffixes = sorted({ext, *RUN_FILE_SUFFIXES}, key=len, reverse=True)
+    # One directory listing instead of probing name after name
+    try: names = set(os.listdir(folder or "."))
+    except OSError: names = set()
+    if not os.path.exists(filepath) and not any(stem + s in names for s in suffixes):
+        return filepath
+
+    # Every file of the new iteration must not exist, whichever of them an earlier run wrote
+    pattern = re.compile(re.escape(stem) + r"_(\d+)(?:" + "|".join(map(re.escape, suffixes)) + ")$")
+    taken = [int(m.group(1)) for m in map(pattern.match, names) if m]
+    return f"{base}_{max(taken, default=0) + 1}{ext}"
+
+
+def raw_log_path(filename, log_binary=False):
+    return os.path.splitext(filename)[0] + raw_log_module.EXTENSION if log_binary else filename
+
+
+def open_raw_log(filename, log_binary=False, commit_hist=None):
+    """Raw log writer, written and fsynced by a background thread in batches (see log_writer.py)."""
+    if log_binary:
+        # Same columns as fixed-width records with a per-step index (see raw_log.py)
+        return raw_log_module.BinaryLogWriter(raw_log_path(filename, True), commit_interval_s=LOG_COMMIT_INTERVAL_S,
+                                              commit_bytes=LOG_COMMIT_BYTES, commit_hist=commit_hist)
+    # Generic Header
+    return GroupCommitWriter(filename, header=raw_log_module.CSV_HEADER, commit_interval_s=LOG_COMMIT_INTERVAL_S,
+                             commit_bytes=LOG_COMMIT_BYTES, commit_hist=commit_hist)
+
+
+def open_logs(filename, op_mode="CCV", log_binary=False, commit_hist=None):
+    """(raw_log, sum_log) writers of one test run; sum_log is None outside CCV mode."""
+    # Open Files:
+    # 1. Raw File (Always used)
+    # 2. Summary File (Only used if in CCV mode)
+    raw_log = open_raw_log(filename, log_binary, commit_hist)
+    sum_log = GroupCommitWriter(summary_path(filename), header=SUMMARY_HEADER) if op_mode == "CCV" else None
+    return raw_log, sum_log
+
+
+# --- SERIAL LINK (shared by DosingEngine, shm_ingest and multi_rig) ---
+def open_port(port, binary=False):
+    """Open a rig's port; binary=True negotiates binary telemetry. Returns (ser, binary_active)."""
+    ser = serial.Serial(port, binary_protocol.DEFAULT_BAUD, timeout=1)
+    try:
+        return ser, bool(binary and binary_protocol.negotiate_binary(ser))
+    except Exception:
+        ser.close()
+        raise
+
+
+def new_parser(binary_active):
+    return binary_protocol.BinaryFrameDecoder() if binary_active else TelemetryParser()
+
+
+def binary_silent(last_rx_t):
+    """True once no valid packet has arrived for SILENCE_S: the rig's watchdog has dropped it back to ASCII."""
+    return time.monotonic() - last_rx_t > binary_protocol.SILENCE_S
+
+
+def renegotiate_binary(ser):
+    """Switch a rig that dropped back to ASCII (at the default baud) into binary mode again; False if it does not answer."""
+    try:
+        ser.baudrate = binary_protocol.DEFAULT_BAUD
+        return binary_protocol.negotiate_binary(ser)
+    except Exception:
+        return False
+
+
+def silence_error():
+    return TimeoutError(f"No binary telemetry for {binary_protocol.SILENCE_S:g} s "
+                        "and the rig did not renegotiate binary mode")
+
+
+def _stderr(message):
+    # sys.stderr is None in the windowed (--noconsole) exe
+    if sys.stderr is not None: print(message, file=sys.stderr)
+
+
+def list_ports():
+    return [port.device for port in serial.tools.list_ports.comports()]
+
+
+class DosingEngine:
+    """
+    One rig: serial connection, live telemetry and test execution.
+
+    Thread model: the SerialReader thread updates the telemetry state and
+    feeds the running test; run_test() blocks its caller (start_test() runs
+    it on a thread of its own). Commands may be sent from any thread.
+    """
+
+    def __init__(self, clock=SYSTEM_CLOCK, results_db_path=DEFAULT_DB_PATH):
+        # Prevent Windows Sleep
+        try: ctypes.windll.kernel32.SetThreadExecutionState(0x80000003)
+        except: pass
+
+        self.clock = clock # Time base of the test runner (clocks.VirtualClock runs it in virtual time)
+        self.results_db_path = results_db_path
+        self._listeners = {}
+
+        # Serial & State
+        self.ser = None
+        self.port = None
+        self.serial_reader = None
+        self.ingest = None # shm_ingest.IngestProcess when the port is read in a child process
+        self.telemetry_parser = TelemetryParser() # or BinaryFrameDecoder once binary mode is negotiated
+        self.binary_active = False
+        self.is_connected = False
+        self.is_running_test = False
+        self.is_manual_active = False
+        self.stop_test_flag = False
+        self.vibration_enabled = True
+        self._keepalive_stop = threading.Event()
+        self._write_lock = threading.Lock() # Runner, UI and keepalive threads all write commands
+
+        # Live Data
+        self.last_sample_t = 0.0 # time.monotonic() at which the latest sample was taken on the rig
+        self.last_rx_t = 0.0 # time.monotonic() of the last read that held a valid frame
+        self.bus = TelemetryBus() # Every accepted sample, to each subscriber's own bounded queue
+        self.clock_sync = ClockSync()
+        self.seq_tracker = SequenceTracker()
+
+        # Test State
+        self.test_start_t = 0.0
+        self.test_elapsed = 0.0 # Final elapsed time of the last test
+        self.raw_log = None # GroupCommitWriter of the running test (stats() for queue depth / commit latency)
+        self.last_run_id = None # Results store id of the last test, for its calibration fit
+        self.last_calibration_results = []
+        self.last_ccv = None
+        self.last_status = None # "complete", "stopped" or "error"
+        self.last_samples_lost = 0 # Samples the last test's runner (and in-process raw log) never received
+        self.test_thread = None
+
+        # Metrics
+        self.metrics = metrics.Registry()
+        self.metrics_server = None
+        self.dump_metrics = True # Write metrics_path(filename) at the end of each test
+        self._init_metrics()
+
+        # Profiling (see profiling.py)
+        self.profile_runs = False # Profile each test run and manual session
+        self.manual_profiler = None
+
+    @property
+    def latest(self):
+        """Newest telemetry_bus.Sample (one immutable record, never a mix of two frames)."""
+        return self.bus.latest
+
+    # --- METRICS ---
+    def _init_metrics(self):
+        reg = self.metrics
+        link = lambda key: (lambda: self.link_stats().get(key, 0))
+        reg.counter("ccv_serial_bytes_total", "Bytes read from the rig", fn=link("bytes_in"))
+        reg.counter("ccv_frames_total", "Telemetry samples accepted and published", fn=lambda: self.bus.published)
+        reg.counter("ccv_parse_errors_total", "Telemetry that did not parse, by kind",
+                    fn=lambda: [({"kind": k}, v) for k, v in self.link_stats().items() if k in PARSE_ERROR_KINDS])
+        reg.counter("ccv_frames_dropped_total", "Samples lost on the link (sequence gaps)", fn=link("dropped"))
+        reg.counter("ccv_frames_duplicate_total", "Repeated samples ignored", fn=link("duplicates"))
+        reg.counter("ccv_subscriber_dropped_total", "Samples a telemetry bus subscriber lost to a full queue",
+                    fn=lambda: [({"subscriber": sub.name}, sub.dropped) for sub in self.bus.subscriptions])
+        reg.gauge("ccv_sample_age_seconds", "Time since the newest sample was taken on the rig",
+                  fn=lambda: time.monotonic() - self.last_sample_t if self.last_sample_t else None)
+        self.serial_errors = reg.counter("ccv_serial_errors_total", "Serial failures that ended a connection")
+        self.serial_write_errors = reg.counter("ccv_serial_write_errors_total", "Keepalive writes that failed")
+        self.binary_renegotiations = reg.counter("ccv_binary_renegotiations_total",
+                                                 "Binary mode renegotiated after the rig stopped sending packets")
+        self.read_latency = reg.histogram("ccv_serial_read_seconds",
+                                          "Host time from the first byte of a serial read to its samples being published")
+
+        # Test runs
+        reg.gauge("ccv_test_running", "1 while a test runs", fn=lambda: int(self.is_running_test))
+        reg.gauge("ccv_writer_queue_depth", "Raw log rows waiting for the writer thread",
+                  fn=lambda: self.raw_log.stats()["queue_depth"] if self.raw_log else 0)
+        reg.counter("ccv_writer_blocked_puts_total", "Raw log rows that found the writer queue full (this test)",
+                    fn=lambda: self.raw_log.blocked_puts if self.raw_log else 0)
+        self.commit_latency = reg.histogram("ccv_log_commit_seconds", "Write and fsync time of one raw log batch")
+        self.step_jitter = reg.histogram("ccv_step_start_late_seconds",
+                                         "How late each step command went out after its scheduled boundary")
+
+    def link_stats(self):
+        """Ingest counters of the connection: reader, parser and sequence tracker (or the ingest ring)."""
+        if self.ingest: return self.ingest.stats()
+        s = {}
+        if self.serial_reader: s.update(self.serial_reader.stats())
+        s.update(self.telemetry_parser.stats())
+        s.update(self.seq_tracker.stats())
+        return s
+
+    def serve_metrics(self, port=metrics.DEFAULT_PORT, tries=1):
+        """
+        Serve engine.metrics at http://127.0.0.1:<port>/metrics; returns the URL.
+        With tries > 1 the next ports are tried while one is taken (one app per rig).
+        Raises OSError if none is free.
+        """
+        if self.metrics_server is None:
+            for p in range(port, port + tries):
+                try:
+                    self.metrics_server = metrics.MetricsServer(self.metrics, p).start()
+                    break
+                except OSError:
+                    if p == port + tries - 1: raise
+        return self.metrics_server.url
+
+    # --- EVENTS ---
+    def on(self, event, fn):
+        self._listeners.setdefault(event, []).append(fn)
+        return fn
+
+    def off(self, event, fn):
+        try: self._listeners.get(event, []).remove(fn)
+        except ValueError: pass
+
+    def _emit(self, event, *args):
+        for fn in list(self._listeners.get(event, ())):
+            try: fn(*args)
+            except Exception as e:
+                if event == "warning": _stderr(f"warning listener failed: {e}")
+                else: self._warn(f"{event} listener failed: {e}")
+
+    def _warn(self, message):
+        # Front ends show these; the windowed exe has no console for print()
+        if self._listeners.get("warning"): self._emit("warning", message)
+        else: _stderr(message)
+
+    # --- CONNECTION ---
+    def connect(self, port, binary=False, ingest_process=False):
+        """
+        Open port; binary=True negotiates 80 SPS binary telemetry (firmware without it stays on ASCII).
+        ingest_process=True reads the port and writes raw logs in a child process (see shm_ingest.py).
+        """
+        if ingest_process:
+            import shm_ingest  # multiprocessing and shared memory only when asked for
+            self.ingest = shm_ingest.IngestProcess(port, binary).start()
+            self.port = port
+            self.is_connected = True
+            self.binary_active = self.ingest.binary_active
+            self.ingest.run_reader(self._publish, self._on_serial_error)
+            self._emit("connected", port)
+            return
+
+        ser, binary_active = open_port(port, binary)
+        self.ser = ser
+        self.port = port
+        self.is_connected = True
+        self.binary_active = binary_active
+        self.last_rx_t = time.monotonic()
+        self.telemetry_parser = new_parser(binary_active)
+        if self.binary_active:
+            self._keepalive_stop.clear()
+            threading.Thread(target=self._binary_keepalive, name="BinaryKeepalive", daemon=True).start()
+        self.clock_sync = ClockSync()
+        self.seq_tracker = SequenceTracker(binary_protocol.SEQ_MODULUS if self.binary_active else MILLIS_WRAP)
+        self.serial_reader = SerialReader(self.ser, self._handle_serial_batch, on_error=self._on_serial_error,
+                                          framer=self.telemetry_parser, latency=self.read_latency)
+        self.serial_reader.start()
+        self._emit("connected", port)
+
+    def disconnect(self, error=None):
+        if not self.is_connected and self.ser is None and self.ingest is None: return
+        self.is_connected = False
+        self._keepalive_stop.set()
+        if self.ingest:
+            self.ingest.close()
+            self.ingest = None
+        if self.serial_reader:
+            self.serial_reader.stop()
+            self.serial_reader = None
+        if self.ser and self.binary_active and error is None:
+            try:
+                with self._write_lock: binary_protocol.leave_binary(self.ser)
+            except: pass
+        self.binary_active = False
+        if self.ser:
+            try: self.ser.close()
+            except: pass
+            self.ser = None
+        self._emit("disconnected", error)
+
+    def _binary_keepalive(self):
+        # The rig falls back to ASCII if it hears nothing from us for a few seconds
+        while self.is_connected and self.binary_active:
+            try: self._write(b"PING\n")
+            except Exception: self.serial_write_errors.inc()
+            if self._keepalive_stop.wait(binary_protocol.KEEPALIVE_S): return
+            # Its watchdog fired anyway (host stall, rig reset): it now talks ASCII at the default baud
+            if binary_silent(self.last_rx_t):
+                if self._renegotiate_binary(): continue
+                if self.is_connected: self.disconnect(silence_error())
+                return
+
+    def _renegotiate_binary(self):
+        """Switch a rig that dropped back to ASCII into binary mode again; False if it does not answer."""
+        if self.serial_reader:
+            self.serial_reader.stop()  # negotiate_binary() reads the reply itself
+        with self._write_lock:
+            ok = renegotiate_binary(self.ser)
+        if not ok or not self.is_connected: return False
+        self.binary_renegotiations.inc()
+        self.telemetry_parser = binary_protocol.BinaryFrameDecoder()
+        self.seq_tracker.reset()
+        self.last_rx_t = time.monotonic()
+        self.serial_reader = SerialReader(self.ser, self._handle_serial_batch, on_error=self._on_serial_error,
+                                          framer=self.telemetry_parser, latency=self.read_latency)
+        self.serial_reader.start()
+        return True
+
+    def _on_serial_error(self, e):
+        # Called from the reader thread when the port disappears (cable pulled, rig reset)
+        self.serial_errors.inc()
+        self.disconnect(e)
+
+    def _handle_serial_batch(self, frames):
+        # Runs on the SerialReader thread with every TelemetryFrame parsed from one read().
+        # Malformed lines never reach here; they are counted in self.telemetry_parser.stats()
+        rx_t = self.last_rx_t = time.monotonic()
+        accepted = []
+        for frame in frames:
+            # Drops/duplicates are counted in self.seq_tracker; repeats are not processed twice
+            if frame.seq is not None and not self.seq_tracker.observe(frame.seq): continue
+            self.last_sample_t = self.clock_sync.observe(frame.t_ms, rx_t) if frame.t_ms is not None else rx_t
+            accepted.append(LiveSnapshot(frame.mass, frame.rate, frame.rpm, self.last_sample_t))
+        if accepted: self._publish(accepted)
+
+    def _publish(self, snaps):
+        # Timestamped samples from the SerialReader thread, or the ring reader in ingest process mode.
+        # Fan-out never waits on a consumer: each has its own queue and overflow policy
+        self.last_sample_t = self.bus.publish(snaps)[-1].t
+
+    # --- COMMANDS ---
+    def send(self, cmd):
+        """Write one command line (no-op while disconnected)."""
+        if not self.is_connected: return
+        if self.ingest: self.ingest.send(cmd)
+        elif self.ser: self._write(cmd.encode())
+
+    def _write(self, data):
+        # One line at a time: lines never interleave, and pyserial on Windows shares one OVERLAPPED per port
+        with self._write_lock:
+            self.ser.write(data)
+
+    def tare(self):
+        self.send("TARE\n")
+
+    def set_vibration(self, enabled=None):
+        if enabled is not None: self.vibration_enabled = bool(enabled)
+        self.send("VIB:1\n" if self.vibration_enabled else "VIB:0\n")
+
+    def manual_start(self, mode, val, profile_base=None):
+        """With profile_runs, profiles the session until manual_stop(), which must run on the same thread."""
+        self.send(f"RPM:{val}\n" if mode == "RPM" else f"RATE:{val}\n")
+        self.is_manual_active = True
+        if self.profile_runs and self.manual_profiler is None:
+            self.manual_profiler = profiling.RunProfiler(profile_base or manual_profile_base()).start()
+
+    def manual_stop(self):
+        self.send("STOP\n")
+        self.is_manual_active = False
+        if self.manual_profiler:
+            profiler, self.manual_profiler = self.manual_profiler, None
+            self._write_profile(profiler)
+
+    def _write_profile(self, profiler):
+        try: self._emit("profile_written", profiler.stop())
+        except Exception as e: self._warn(f"Profile not written: {e}")
+
+    def emergency_stop(self):
+        self.stop_test_flag = True
+        self.send("STOP\n")
+
+    # --- TEST RUNS ---
+    def elapsed(self):
+        return self.clock.now() - self.test_start_t if self.is_running_test else self.test_elapsed
+
+    def start_test(self, steps, filename, op_mode="CCV", log_binary=False):
+        """run_test() on a daemon thread; returns the thread."""
+        self.stop_test_flag = False
+        self.test_thread = threading.Thread(target=self.run_test, args=(steps, filename, op_mode, log_binary), daemon=True)
+        self.test_thread.start()
+        return self.test_thread
+
+    def run_test(self, steps, filename, op_mode="CCV", log_binary=False):
+        """
+        Run a sequence to completion (blocking). Writes the raw log (CSV, or
+        .ccvraw with log_binary), the summary CSV in CCV mode and the results
+        store. Returns the run status; errors are reported via test_finished.
+        """
+        steps = list(steps)
+        self.test_start_t = self.clock.now()
+        self.is_running_test = True
+        self.last_calibration_results = []
+        self.last_ccv = None
+        raw_log = None
+        sum_log = None
+        ingest_log = None # IngestProcess writing the raw log
+        frames = None
+        profiler = None
+        store = None
+        run_id = None
+        run_status = "error"
+        error = None
+        self._emit("test_started", op_mode, steps)
+
+        try:
+            # cProfile follows this (runner) thread; the stack sampler sees every thread
+            if self.profile_runs: profiler = profiling.RunProfiler(os.path.splitext(filename)[0]).start()
+            self.set_vibration()
+            self.clock.sleep(0.1)
+
+            ingest = self.ingest
+            if ingest:
+                # The ingest process writes the raw log itself (below); only the summary is ours
+                sum_log = GroupCommitWriter(summary_path(filename), header=SUMMARY_HEADER) if op_mode == "CCV" else None
+            else:
+                raw_log, sum_log = open_logs(filename, op_mode, log_binary, self.commit_latency)
+            self.raw_log = raw_log
+
+            # Results database (one connection per thread, so it lives on this runner thread)
+            try:
+                store = ResultsStore(self.results_db_path)
+                run_id = store.begin_run(self.port, op_mode, raw_log_path(filename, log_binary), sum_log.path if sum_log else None,
+                                         int(self.vibration_enabled))
+                self.last_run_id = run_id
+            except Exception as e:
+                self._warn(f"Results store unavailable: {e}")
+                store = None
+
+            stop = lambda: self.stop_test_flag or not self.is_connected
+            vib_status = "1" if self.vibration_enabled else "0"
+            start_time = None
+            if ingest:
+                # Fix the step boundaries now so the child logs on the same schedule as the runner
+                start_time = self.clock.now()
+                ingest.start_log(filename, log_binary, start_time, steps, vib_status)
+                ingest_log = ingest
+
+            def on_step(result):
+                if result.ccv is not None: self.last_ccv = result.ccv
+                self._emit("step", result)
+
+            # From here on every sample is queued for us too (see _publish)
+            # The reader never waits for the runner: the deep queue absorbs stalls, and anything beyond it is
+            # dropped from the new end (the runner still sees a contiguous start) and reported as samples_lost
+            frames = self.bus.subscribe("runner", maxsize=RUNNER_QUEUE_SIZE, policy=DROP_NEWEST)
+            runner = TestRunner(steps, op_mode, self.send, frames, clock=self.clock, raw_log=raw_log,
+                                raw_binary=log_binary, sum_log=sum_log, store=store, run_id=run_id,
+                                vib_status=vib_status, stop=stop, on_step=on_step, start_time=start_time,
+                                jitter=self.step_jitter)
+            self.last_calibration_results = runner.calibration_results
+            self.test_start_t = self.clock.now()
+            runner.run()
+
+            # Clean up files (commits whatever is still queued)
+            if raw_log: raw_log.close()
+            if ingest_log:
+                ingest_log.stop_log()
+                ingest_log = None
+            if sum_log: sum_log.close()
+            run_status = "stopped" if stop() else "complete"
+
+        except Exception as e:
+            error = e
+
+        finally:
+            # Still flushed and closed if the test aborted with an error
+            for log in (raw_log, sum_log):
+                if log:
+                    try: log.close()
+                    except Exception: pass
+            if ingest_log:
+                try: ingest_log.stop_log()
+                except Exception: pass
+            if store:
+                try:
+                    store.end_run(run_id, run_status, frames.dropped if frames is not None else None)
+                    store.close()
+                except Exception: pass
+            if frames is not None:
+                frames.close()
+                self.last_samples_lost = frames.dropped
+            self.test_elapsed = self.clock.now() - self.test_start_t
+            self.is_running_test = False
+            self.last_status = run_status
+            if profiler: self._write_profile(profiler)
+            if self.dump_metrics:
+                try: self.metrics.dump(metrics_path(filename))
+                except Exception as e: self._warn(f"Metrics dump failed: {e}")
+            # After the dump, which still reports this test's writer; the gauges must not poll a closed writer
+            self.raw_log = None
+        self._emit("test_finished", run_status, error, self.last_samples_lost)
+        return run_status
+
+    # --- MATH & CALIBRATION (Linear Regression) ---
+    def calibration_fit(self):
+        """RPM = m * Rate + c over the last run's RPM steps: (m, c, r_squared, n), m None if no fit."""
+        rpms = [rpm for rpm, rate in self.last_calibration_results]
+        rates = [rate for rpm, rate in self.last_calibration_results]
+        return analysis.linear_fit(rpms, rates)
+
+    def record_fit(self, m, c, r_squared, n):
+        try:
+            store = ResultsStore(self.results_db_path)
+            store.add_fit(self.last_run_id, m, c, r_squared, n)
+            store.close()
+        except Exception as e:
+            self._warn(f"Results store unavailable: {e}")
+
+    def upload_calibration(self, a, b):
+        """Send CAL:<a>,<b> to the rig; False if not connected."""
+        if not self.is_connected: return False
+        self.send(f"CAL:{a:.3f},{b:.3f}\n")
+        try:
+            store = ResultsStore(self.results_db_path)
+            store.mark_fit_uploaded(self.last_run_id)
+            store.close()
+        except Exception: pass
+        return True
+
+
+# --- CLI ---
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run a test routine on a rig without the GUI.")
+    ap.add_argument("routine", nargs="?", help="Routine JSON (V3 or V4 format)")
+    ap.add_argument("--curve", nargs=3, type=float, metavar=("LOW", "HIGH", "DURATION"),
+                    help="Generate the 7-point linear fit routine instead of loading one")
+    ap.add_argument("--port", help="Serial port of the rig")
+    ap.add_argument("-o", "--output", help="Raw log CSV (default Test_<date>.csv; never overwritten)")
+    ap.add_argument("--mode", choices=["CCV", "CAL"], default="CCV", help="CCV summary or flow calibration (default CCV)")
+    ap.add_argument("--binary", action="store_true", help="Negotiate binary telemetry (80 SPS)")
+    ap.add_argument("--binary-log", action="store_true", help="Write the raw log as .ccvraw")
+    ap.add_argument("--ingest-process", action="store_true", help="Read the port and write the raw log in a child process")
+    ap.add_argument("--no-vibration", action="store_true", help="Run with the vibrator off")
+    ap.add_argument("--tare", action="store_true", help="Tare the scale before starting")
+    ap.add_argument("--upload-cal", action="store_true", help="CAL mode: send the fit to the rig")
+    ap.add_argument("--db", default=DEFAULT_DB_PATH, help="Results database (default %(default)s)")
+    ap.add_argument("--metrics-port", type=int, metavar="PORT", help="Serve Prometheus metrics on 127.0.0.1:PORT")
+    ap.add_argument("--profile", action="store_true",
+                    help="Profile the run (cProfile, stack samples, tracemalloc) into <log>_Profile.* / _Memory.txt")
+    ap.add_argument("--list-ports", action="store_true", help="List serial ports and exit")
+    a = ap.parse_args(argv)
+
+    if a.list_ports:
+        for p in list_ports(): print(p)
+        return 0
+    if a.curve:
+        low, high, duration = a.curve
+        if low <= 0 or high <= 0 or low >= high or duration <= 0:
+            ap.error("--curve needs 0 < LOW < HIGH and DURATION > 0")
+        steps = [{"type": "RPM", "val": rpm, "duration": duration} for rpm in curve_points(low, high)]
+    elif a.routine:
+        steps = load_routine(a.routine)
+    else:
+        ap.error("a routine JSON or --curve is required")
+    if not steps: ap.error("routine has no steps")
+    if not a.port: ap.error("--port is required")
+
+    output = unique_filename(a.output or default_filename())
+    engine = DosingEngine(results_db_path=a.db)
+    engine.vibration_enabled = not a.no_vibration
+    engine.profile_runs = a.profile
+    if a.metrics_port is not None:
+        try: print(f"Metrics: {engine.serve_metrics(a.metrics_port)}", flush=True)
+        except OSError as e: print(f"Metrics endpoint unavailable: {e}", file=sys.stderr)
+
+    def on_step(r):
+        line = f"Step {r.num}/{len(steps)}: {r.mode} {r.val:g} for {r.duration:g} s, {r.mass_delta:.2f} g, {r.stats.rate.mean:.3f} g/s"
+        if r.ccv is not None: line += f", CCV {r.ccv:.1f}"
+        print(line, flush=True)
+
+    def on_finished(status, error, samples_lost):
+        if error is not None: print(f"Error: {error}", file=sys.stderr)
+        if samples_lost: print(f"Warning: {samples_lost} samples missing from the run (test runner fell behind)", file=sys.stderr)
+    engine.on("step", on_step)
+    engine.on("test_finished", on_finished)
+    engine.on("warning", lambda message: print(f"Warning: {message}", file=sys.stderr))
+    engine.on("profile_written", lambda paths: print("Profile: " + ", ".join(paths)))
+    engine.on("disconnected", lambda e: e is not None and print(f"Rig disconnected: {e}", file=sys.stderr))
+
+    try:
+        engine.connect(a.port, binary=a.binary, ingest_process=a.ingest_process)
+    except Exception as e:
+        print(f"Connect failed: {e}", file=sys.stderr)
+        return 1
+    total = sum(float(s["duration"]) for s in steps)
+    print(f"{a.mode} routine: {len(steps)} steps, {total:g} s on {a.port}{' (binary)' if engine.binary_active else ''} -> {output}", flush=True)
+
+    try:
+        if a.tare:
+            engine.tare()
+            time.sleep(1.0)
+        thread = engine.start_test(steps, output, a.mode, a.binary_log)
+        try:
+            while thread.is_alive(): thread.join(0.5)
+        except KeyboardInterrupt:
+            print("Stopping...", file=sys.stderr)
+            engine.emergency_stop()
+            thread.join()
+
+        if a.mode == "CAL" and engine.last_calibration_results:
+            m, c, r_squared, n = engine.calibration_fit()
+            if m is None:
+                print("Calibration failed: not enough valid data points or variation.", file=sys.stderr)
+            else:
+                engine.record_fit(m, c, r_squared, n)
+                print(f"RPM = {m:.4f} * Rate + {c:.4f}  (R² = {r_squared:.4f}, {n} points)")
+                if a.upload_cal and engine.last_status == "complete":
+                    print("Calibration saved to rig." if engine.upload_calibration(m, c) else "Upload failed: rig disconnected.")
+    finally:
+        engine.disconnect()
+    print(f"Run {engine.last_status}: {output}")
+    return 0 if engine.last_status == "complete" else 1
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+Low-overhead metrics registry with a Prometheus text exporter.
+
+Hot paths only ever do `counter.inc()` or `histogram.observe(x)` (a bisect
+and two additions, no locks: each metric has a single writer thread).
+Counters the components already keep (parser rejects, sequence drops,
+writer queue depth, ...) are not duplicated; they are registered as
+functions and read only when the registry is rendered.
+
+    reg = Registry()
+    frames = reg.counter("ccv_frames_total", "Telemetry frames received")
+    reg.gauge("ccv_writer_queue_depth", "Rows waiting", fn=lambda: writer.stats()["queue_depth"])
+    server = MetricsServer(reg, port=9464).start()   # http://127.0.0.1:9464/metrics
+    reg.dump("Test_Metrics.prom")
+"""
+import bisect
+import math
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 9464  # Loopback port of the /metrics endpoint
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram bucket upper bounds in seconds (100 us .. 10 s)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt(v):
+    if v is None: return "NaN"
+    v = float(v)
+    if math.isinf(v): return "+Inf" if v > 0 else "-Inf"
+    if v == int(v) and abs(v) < 1e15: return str(int(v))
+    return repr(v)
+
+
+def _labels(labels):
+    items = list(labels.items())
+    if not items: return ""
+    esc = lambda s: str(s).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+class Counter:
+    """
+    Monotonic count. With fn, the value is read from fn() at render time
+    instead; fn may also return [(labels, value), ...] for a label set that
+    changes at run time (e.g. one series per bus subscriber).
+    """
+    kind = "counter"
+
+    def __init__(self, name, help="", labels=None, fn=None):
+        self.name = name
+        self.help = help
+        self.labels = dict(labels or {})
+        self.fn = fn
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+    def samples(self):
+        v = self.get()
+        if isinstance(v, list):
+            return [(self.name, dict(self.labels, **labels), x) for labels, x in v]
+        return [(self.name, self.labels, v)]
+
+
+class Gauge(Counter):
+    """Current level (queue depth, lag). With fn, read at render time."""
+    kind = "gauge"
+
+    def set(self, v):
+        self.value = v
+
+
+class Histogram:
+    """Cumulative-bucket distribution (Prometheus histogram) of observed values."""
+    kind = "histogram"
+
+    def __init__(self, name, help="", labels=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = dict(labels or {})
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(self.bounds, v)] += 1
+        self.count += 1
+        self.sum += v
+        if v > self.max: self.max = v
+
+    def quantile(self, q):
+        """Bucket upper bound below which a fraction q of observations fall (None if empty)."""
+        if not self.count: return None
+        target = q * self.count
+        acc = 0
+        for bound, n in zip(self.bounds, self.counts):
+            acc += n
+            if acc >= target: return bound
+        return self.max
+
+    def samples(self):
+        out = []
+        acc = 0
+        counts = list(self.counts)
+        for bound, n in zip(self.bounds + (math.inf,), counts):
+            acc += n
+            out.append((self.name + "_bucket", dict(self.labels, le=_fmt(bound)), acc))
+        out.append((self.name + "_sum", self.labels, self.sum))
+        out.append((self.name + "_count", self.labels, acc))
+        return out
+
+    def stats(self):
+        return {"count": self.count, "sum": self.sum, "max": self.max,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99)}
+
+
+class Registry:
+    """Named metrics of one engine (or process). Metrics sharing a name differ by labels."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def unregister(self, metric):
+        with self._lock:
+            self._metrics = [m for m in self._metrics if m is not metric]
+
+    def counter(self, name, help="", labels=None, fn=None):
+        return self.register(Counter(name, help, labels, fn))
+
+    def gauge(self, name, help="", labels=None, fn=None):
+        return self.register(Gauge(name, help, labels, fn))
+
+    def histogram(self, name, help="", labels=None, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        seen = set()
+        for m in metrics:
+            if m.name not in seen:
+                seen.add(m.name)
+                if m.help: lines.append(f"# HELP {m.name} {m.help}")
+                lines.append(f"# TYPE {m.name} {m.kind}")
+            try:
+                for name, labels, value in m.samples():
+                    lines.append(f"{name}{_labels(labels)} {_fmt(value)}")
+            except Exception as e:
+                # A component that has gone away (port closed mid-scrape) must not break the whole page
+                lines.append(f"# {m.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write the current render() to path; returns path."""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        return path
+
+
+class _ExclusiveHTTPServer(ThreadingHTTPServer):
+    # ThreadingHTTPServer sets SO_REUSEADDR, which on Windows lets a second app bind a taken port
+    # without an error; a bind conflict must raise so the caller can try the next port
+    allow_reuse_address = False
+    daemon_threads = True
+
+    def server_bind(self):
+        if hasattr(socket, "SO_EXCLUSIVEADDRUSE"):  # Windows only
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        super().server_bind()
+
+
+class MetricsServer:
+    """GET /metrics on a loopback HTTP port, served from a daemon thread."""
+
+    def __init__(self, registry, port=DEFAULT_PORT, host="127.0.0.1"):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._httpd = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = _ExclusiveHTTPServer((self.host, self.port), Handler)
+        self.port = self._httpd.server_address[1]  # port=0 picks a free one
+        threading.Thread(target=self._httpd.serve_forever, name="MetricsServer", daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/metrics"
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
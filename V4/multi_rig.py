@@ -0,0 +1,370 @@
+"""
+Drive many rigs from one host process on a single asyncio event loop.
+
+Each RigSession has its own serial connection, telemetry state (parser,
+clock sync, sequence tracker, latest snapshot), AsyncTestRunner and log
+writers. Nothing polls: on POSIX every port is registered with the loop
+(add_reader) and read only when bytes arrive; on Windows, whose loop has
+no add_reader for serial handles, one SerialReader thread per port hands
+its batches to the loop. One results store connection serves all rigs.
+
+    python multi_rig.py routine.json --port COM3 --port COM4 ... [--out-dir DIR] [--mode CAL] [--binary]
+
+Every rig runs the same routine; outputs are <out-dir>/Test_<date>_<port>.csv.
+See benchmarks/bench_multi_rig.py for the per-rig CPU cost as rigs are added.
+"""
+import argparse
+import asyncio
+import os
+import re
+import signal
+import sys
+import time
+
+import serial
+
+import binary_protocol
+import engine as engine_module
+from clock_sync import ClockSync, SequenceTracker, MILLIS_WRAP
+from clocks import SYSTEM_CLOCK
+from results_store import ResultsStore, DEFAULT_DB_PATH
+from serial_reader import SerialReader
+from telemetry_parser import TelemetryParser
+from test_runner import AsyncTestRunner
+from ui_refresh import LiveSnapshot, EMPTY_SNAPSHOT
+
+
+class RigSession:
+    """One rig on the manager's event loop. All methods run on the loop thread."""
+
+    def __init__(self, manager, port, name=None, binary=False, vibration=True):
+        self.manager = manager
+        self.port = port
+        self.name = name or port
+        self.binary = binary
+        self.vibration_enabled = vibration
+
+        self.ser = None
+        self.telemetry_parser = TelemetryParser()
+        self.binary_active = False
+        self.is_connected = False
+        self.error = None
+        self.clock_sync = ClockSync()
+        self.seq_tracker = SequenceTracker()
+        self.latest = EMPTY_SNAPSHOT
+        self.bytes_in = 0
+        self.frames_in = 0
+        self.binary_renegotiations = 0
+        self.last_rx_t = 0.0  # time.monotonic() of the last read that held a valid frame
+        self._reader = None
+        self._keepalive_task = None
+        self._held = None  # Commands sent while binary mode is renegotiated, written once it is back
+
+        self.is_running_test = False
+        self.stop_test_flag = False
+        self.test_frame_q = None
+        self.runner = None
+        self.last_status = None
+        self.last_run_id = None
+        self.on_step = None  # on_step(session, StepResult)
+
+    # --- CONNECTION ---
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        # Opening and the binary handshake block for up to a few seconds; keep them off the loop
+        self.ser, self.binary_active = await loop.run_in_executor(None, engine_module.open_port, self.port, self.binary)
+        self.is_connected = True
+        self.clock_sync = ClockSync()
+        self.seq_tracker = SequenceTracker(binary_protocol.SEQ_MODULUS if self.binary_active else MILLIS_WRAP)
+        self.last_rx_t = time.monotonic()
+        self._start_reader()
+        if self.binary_active:
+            self._keepalive_task = asyncio.create_task(self._binary_keepalive())
+
+    def _start_reader(self):
+        loop = asyncio.get_running_loop()
+        ser = self.ser
+        self.telemetry_parser = engine_module.new_parser(self.binary_active)
+        try:
+            fd = ser.fileno()
+            ser.timeout = 0  # read() never blocks the loop
+            loop.add_reader(fd, self._on_readable)
+        except (AttributeError, NotImplementedError):
+            ser.timeout = 1
+            self._reader = SerialReader(ser, lambda b: loop.call_soon_threadsafe(self._on_frames, b),
+                                        on_error=lambda e: loop.call_soon_threadsafe(self._on_error, e),
+                                        framer=self.telemetry_parser)
+            self._reader.start()
+
+    def _stop_reader(self):
+        if self._reader:
+            self._reader.stop()
+            self._reader = None
+        else:
+            try: asyncio.get_running_loop().remove_reader(self.ser.fileno())
+            except Exception: pass
+
+    def disconnect(self, error=None):
+        if self.ser is None: return
+        self.is_connected = False
+        self.error = error
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        self._stop_reader()
+        self._held = None
+        if self.binary_active and error is None:
+            try: binary_protocol.leave_binary(self.ser)
+            except Exception: pass
+        self.binary_active = False
+        try: self.ser.close()
+        except Exception: pass
+        self.ser = None
+
+    async def _binary_keepalive(self):
+        # The rig falls back to ASCII if it hears nothing from us for a few seconds
+        while self.is_connected:
+            self.send("PING\n")
+            await asyncio.sleep(binary_protocol.KEEPALIVE_S)
+            # Its watchdog fired anyway (host stall, rig reset): it now talks ASCII at the default baud
+            if self.is_connected and engine_module.binary_silent(self.last_rx_t):
+                if await self._renegotiate_binary(): continue
+                if self.is_connected: self._on_error(engine_module.silence_error())
+                return
+
+    async def _renegotiate_binary(self):
+        """Switch a rig that dropped back to ASCII into binary mode again; False if it does not answer."""
+        loop = asyncio.get_running_loop()
+        ser = self.ser
+        self._stop_reader()  # negotiate_binary() reads the reply itself
+        self._held = []
+        ser.timeout = 1
+        ok = await loop.run_in_executor(None, engine_module.renegotiate_binary, ser)
+        if not ok or not self.is_connected or self.ser is not ser: return False
+        self.binary_renegotiations += 1
+        self.seq_tracker.reset()
+        self.last_rx_t = time.monotonic()
+        self._start_reader()
+        held, self._held = self._held, None
+        for cmd in held: self.send(cmd)
+        return True
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except (serial.SerialException, OSError, TypeError, AttributeError) as e:
+            self._on_error(e)
+            return
+        if not data: return
+        self.bytes_in += len(data)
+        frames = self.telemetry_parser.feed(data)
+        if frames: self._on_frames(frames)
+
+    def _on_error(self, e):
+        # Port gone (cable pulled, rig reset): a running test sees not is_connected and stops
+        print(f"[{self.name}] disconnected: {e}", file=sys.stderr)
+        self.disconnect(e)
+
+    def _on_frames(self, frames):
+        rx_t = self.last_rx_t = time.monotonic()
+        frame_q = self.test_frame_q
+        for frame in frames:
+            # Drops/duplicates are counted in self.seq_tracker; repeats are not processed twice
+            if frame.seq is not None and not self.seq_tracker.observe(frame.seq): continue
+            t = self.clock_sync.observe(frame.t_ms, rx_t) if frame.t_ms is not None else rx_t
+            self.latest = LiveSnapshot(frame.mass, frame.rate, frame.rpm, t)
+            self.frames_in += 1
+            if frame_q is not None: frame_q.put_nowait(self.latest)
+
+    # --- COMMANDS ---
+    def send(self, cmd):
+        if self._held is not None:
+            self._held.append(cmd)  # The handshake owns the port; step commands go out right after it
+            return
+        if self.ser and self.is_connected:
+            try: self.ser.write(cmd.encode())
+            except (serial.SerialException, OSError) as e: self._on_error(e)
+
+    def stop(self):
+        self.stop_test_flag = True
+        self.send("STOP\n")
+
+    # --- TEST RUN ---
+    async def run_test(self, steps, filename, op_mode="CCV", log_binary=False):
+        """Run one routine on this rig; returns "complete", "stopped" or "error" (see DosingEngine.run_test)."""
+        loop = asyncio.get_running_loop()
+        self.is_running_test = True
+        self.stop_test_flag = False
+        raw_log = sum_log = None
+        store = self.manager.store()
+        run_id = None
+        run_status = "error"
+        try:
+            self.send("VIB:1\n" if self.vibration_enabled else "VIB:0\n")
+            await asyncio.sleep(0.1)
+            raw_log, sum_log = engine_module.open_logs(filename, op_mode, log_binary)
+            if store:
+                run_id = store.begin_run(self.port, op_mode, raw_log.path, sum_log.path if sum_log else None,
+                                         int(self.vibration_enabled))
+                self.last_run_id = run_id
+
+            stop = lambda: self.stop_test_flag or not self.is_connected
+            on_step = (lambda r: self.on_step(self, r)) if self.on_step else None
+            frame_q = asyncio.Queue()
+            self.runner = AsyncTestRunner(steps, op_mode, self.send, frame_q, clock=SYSTEM_CLOCK, raw_log=raw_log,
+                                          raw_binary=log_binary, sum_log=sum_log, store=store, run_id=run_id,
+                                          vib_status="1" if self.vibration_enabled else "0", stop=stop, on_step=on_step)
+            self.test_frame_q = frame_q
+            await self.runner.run_async()
+            run_status = "stopped" if stop() else "complete"
+        except Exception as e:
+            self.error = e
+            print(f"[{self.name}] error: {e}", file=sys.stderr)
+        finally:
+            self.test_frame_q = None
+            # close() waits for the final fsync; don't hold up the other rigs meanwhile
+            for log in (raw_log, sum_log):
+                if log:
+                    try: await loop.run_in_executor(None, log.close)
+                    except Exception: pass
+            if store and run_id is not None:
+                try: store.end_run(run_id, run_status)
+                except Exception: pass
+            self.is_running_test = False
+            self.last_status = run_status
+        return run_status
+
+    def calibration_fit(self):
+        return self.runner.fit() if self.runner else (None, None, 0.0, 0)
+
+    def stats(self):
+        return {
+            "port": self.port,
+            "connected": self.is_connected,
+            "binary": self.binary_active,
+            "bytes_in": self.bytes_in,
+            "frames_in": self.frames_in,
+            "binary_renegotiations": self.binary_renegotiations,
+            "status": self.last_status,
+            **{f"seq_{k}": v for k, v in self.seq_tracker.stats().items()},
+        }
+
+
+class RigManager:
+    """A set of RigSessions on one event loop."""
+
+    def __init__(self, results_db_path=DEFAULT_DB_PATH):
+        self.results_db_path = results_db_path
+        self.rigs = []
+        self._store = None
+        self._store_failed = False
+
+    def add(self, port, name=None, binary=False, vibration=True):
+        rig = RigSession(self, port, name, binary, vibration)
+        self.rigs.append(rig)
+        return rig
+
+    def store(self):
+        # One SQLite connection, opened on the loop thread and only used there
+        if self._store is None and not self._store_failed:
+            try: self._store = ResultsStore(self.results_db_path)
+            except Exception as e:
+                print(f"Results store unavailable: {e}")
+                self._store_failed = True
+        return self._store
+
+    async def connect_all(self):
+        """Connect every rig concurrently; returns {rig: exception} for the ones that failed."""
+        results = await asyncio.gather(*(rig.connect() for rig in self.rigs), return_exceptions=True)
+        return {rig: r for rig, r in zip(self.rigs, results) if isinstance(r, BaseException)}
+
+    async def run_all(self, steps, filenames, op_mode="CCV", log_binary=False):
+        """Run steps on every connected rig at once; filenames maps rig -> raw log path."""
+        rigs = [rig for rig in self.rigs if rig.is_connected]
+        return await asyncio.gather(*(rig.run_test(steps, filenames[rig], op_mode, log_binary) for rig in rigs))
+
+    def stop_all(self):
+        for rig in self.rigs: rig.stop()
+
+    def close(self):
+        for rig in self.rigs: rig.disconnect()
+        if self._store:
+            self._store.close()
+            self._store = None
+
+    def stats(self):
+        return [rig.stats() for rig in self.rigs]
+
+
+# --- CLI ---
+def rig_filename(out_dir, port):
+    stem = os.path.splitext(engine_module.default_filename())[0]
+    tag = re.sub(r"\W+", "_", port.replace("/dev/", "")).strip("_")  # COM3, ttyUSB0, pts_3
+    return engine_module.unique_filename(os.path.join(out_dir, f"{stem}_{tag}.csv"))
+
+
+async def _main(a, steps):
+    manager = RigManager(a.db)
+    for port in a.port:
+        manager.add(port, binary=a.binary, vibration=not a.no_vibration)
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGINT, manager.stop_all)
+    except (NotImplementedError, AttributeError, RuntimeError):
+        pass
+
+    def on_step(rig, r):
+        line = f"[{rig.name}] Step {r.num}/{len(steps)}: {r.mode} {r.val:g}, {r.mass_delta:.2f} g, {r.stats.rate.mean:.3f} g/s"
+        if r.ccv is not None: line += f", CCV {r.ccv:.1f}"
+        print(line, flush=True)
+
+    try:
+        for rig, e in (await manager.connect_all()).items():
+            print(f"[{rig.name}] connect failed: {e}", file=sys.stderr)
+        rigs = [rig for rig in manager.rigs if rig.is_connected]
+        if not rigs: return 1
+        os.makedirs(a.out_dir, exist_ok=True)
+        filenames = {rig: rig_filename(a.out_dir, rig.port) for rig in rigs}
+        for rig in rigs:
+            rig.on_step = on_step
+            print(f"[{rig.name}] {a.mode} routine -> {filenames[rig]}{' (binary)' if rig.binary_active else ''}", flush=True)
+
+        await manager.run_all(steps, filenames, a.mode, a.binary_log)
+
+        for rig in rigs:
+            if a.mode == "CAL" and rig.runner and rig.runner.calibration_results:
+                m, c, r_squared, n = rig.calibration_fit()
+                if m is None:
+                    print(f"[{rig.name}] calibration failed: not enough valid data points or variation.")
+                    continue
+                store = manager.store()
+                if store: store.add_fit(rig.last_run_id, m, c, r_squared, n)
+                print(f"[{rig.name}] RPM = {m:.4f} * Rate + {c:.4f}  (R² = {r_squared:.4f}, {n} points)")
+                if a.upload_cal and rig.last_status == "complete" and rig.is_connected:
+                    rig.send(f"CAL:{m:.3f},{c:.3f}\n")
+                    if store: store.mark_fit_uploaded(rig.last_run_id)
+            print(f"[{rig.name}] run {rig.last_status}")
+        return 0 if all(rig.last_status == "complete" for rig in rigs) and len(rigs) == len(manager.rigs) else 1
+    finally:
+        manager.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run one routine on several rigs from a single process.")
+    ap.add_argument("routine", help="Routine JSON (V3 or V4 format)")
+    ap.add_argument("--port", action="append", required=True, help="Serial port of a rig (repeat per rig)")
+    ap.add_argument("--out-dir", default=".", help="Output folder (default: current)")
+    ap.add_argument("--mode", choices=["CCV", "CAL"], default="CCV", help="CCV summary or flow calibration (default CCV)")
+    ap.add_argument("--binary", action="store_true", help="Negotiate binary telemetry (80 SPS)")
+    ap.add_argument("--binary-log", action="store_true", help="Write raw logs as .ccvraw")
+    ap.add_argument("--no-vibration", action="store_true", help="Run with the vibrators off")
+    ap.add_argument("--upload-cal", action="store_true", help="CAL mode: send each rig its fit")
+    ap.add_argument("--db", default=DEFAULT_DB_PATH, help="Results database (default %(default)s)")
+    a = ap.parse_args(argv)
+
+    steps = engine_module.load_routine(a.routine)
+    if not steps: ap.error("routine has no steps")
+    return asyncio.run(_main(a, steps))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
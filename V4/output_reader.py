@@ -0,0 +1,257 @@
+"""
+Loader for historical rig output files (V1-V4 raw CSVs, _Summary CSVs and .ccvraw).
+
+The layout is detected from the header and every file comes back in one
+canonical column set, parsed with pandas' C reader over a memory-mapped
+file. Each parsed file is cached as a columnar sidecar (one .npy per
+column, opened with mmap) keyed by the source's size and mtime, so a
+second pass over the archive does not parse any text.
+
+    python output_reader.py OUTPUT/          # list layouts, rows and steps
+    python output_reader.py --to-bin Test.csv [Test.ccvraw]
+"""
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import raw_log
+from log_writer import committed_length
+
+CACHE_DIR_NAME = ".ccv_cache"
+CACHE_VERSION = 1
+
+# Canonical columns and their dtypes
+RAW_COLUMNS = {"time": "f8", "mode": "u1", "value": "f8", "mass": "f8", "rate": "f8", "vib": "u1", "step": "u2"}
+SUMMARY_COLUMNS = {"step": "u2", "value": "f8", "duration": "f8", "grams": "f8", "ccv": "f8"}
+
+# Header -> (layout, kind, {source column: canonical column})
+LAYOUTS = [
+    ("V1", "raw", {"Time_s": "time", "TargetRPM": "value", "ActualMass_g": "mass", "ActualRate_g_s": "rate", "Vibration_On": "vib"}),
+    ("V2/V3", "raw", {"Time_s": "time", "TargetRPM": "value", "Mass_g": "mass", "Rate_g_s": "rate", "Vib_On": "vib"}),
+    ("V4", "raw", {"Time_s": "time", "Mode": "mode", "Value": "value", "Mass_g": "mass", "Rate_g_s": "rate", "Vib_On": "vib", "Step": "step"}),
+    ("V4", "raw", {"Time_s": "time", "Mode": "mode", "Value": "value", "Mass_g": "mass", "Rate_g_s": "rate", "Vib_On": "vib"}),
+    ("Summary", "summary", {"Step_Num": "step", "TargetRPM": "value", "Duration_s": "duration", "Grams_Dispensed": "grams", "CCV_Value": "ccv"}),
+]
+
+
+def detect_layout(header):
+    """(layout, kind, column map) for a CSV header row; raises ValueError if unknown."""
+    names = [h.strip() for h in header]
+    for layout, kind, cmap in LAYOUTS:
+        if names == list(cmap):
+            return layout, kind, cmap
+    raise ValueError(f"Unrecognised output header: {','.join(names)}")
+
+
+class RunTable:
+    """One output file as canonical NumPy columns (read-only memmaps when served from the cache)."""
+
+    def __init__(self, path, layout, kind, columns):
+        self.path = path
+        self.layout = layout
+        self.kind = kind
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def step_bounds(self):
+        """[(step, start, stop), ...] row ranges of each contiguous step run (raw files)."""
+        steps = self.columns["step"]
+        if not len(steps): return []
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(steps)) + 1))
+        stops = np.concatenate((starts[1:], [len(steps)]))
+        return [(int(steps[a]), int(a), int(b)) for a, b in zip(starts, stops)]
+
+    def step(self, n):
+        """Columns of step n as views (or copies if the step ran in several pieces)."""
+        runs = [(a, b) for s, a, b in self.step_bounds() if s == n]
+        if len(runs) == 1:
+            a, b = runs[0]
+            return {k: v[a:b] for k, v in self.columns.items()}
+        return {k: np.concatenate([v[a:b] for a, b in runs]) if runs else v[:0] for k, v in self.columns.items()}
+
+    def to_frame(self):
+        return pd.DataFrame({k: np.asarray(v) for k, v in self.columns.items()})
+
+
+# --- Parsing ---
+def _parse_csv(path):
+    with open(path, "r", newline="") as f:
+        header = f.readline().rstrip("\r\n").split(",")
+    layout, kind, cmap = detect_layout(header)
+    # A <log>.wal marker left by a crashed run: only the batches that fully reached the disk count
+    length = committed_length(path)
+    if length is not None and length < os.path.getsize(path):
+        with open(path, "rb") as f:
+            src = io.BytesIO(f.read(length))
+        df = pd.read_csv(src, skipinitialspace=True, na_values=["--"])
+    else:
+        df = pd.read_csv(path, memory_map=True, skipinitialspace=True, na_values=["--"])
+    df = df[df.iloc[:, -1].notna()]  # Torn last line of a crashed run (the last column is always written)
+    df = df.rename(columns=lambda c: cmap.get(c.strip(), c))
+    spec = RAW_COLUMNS if kind == "raw" else SUMMARY_COLUMNS
+    cols = {}
+    n = len(df)
+
+    if kind == "raw":
+        if "mode" in df:
+            codes = df["mode"].map(raw_log.MODE_CODES)
+            cols["mode"] = codes.fillna(raw_log.MODE_UNKNOWN).to_numpy("u1")
+        else:
+            cols["mode"] = np.full(n, raw_log.MODE_CODES["RPM"], "u1")  # V1-V3 only ran RPM steps
+
+    for name, dt in spec.items():
+        if name in cols: continue
+        if name in df:
+            v = pd.to_numeric(df[name], errors="coerce").to_numpy("f8")
+            if dt != "f8": v = np.nan_to_num(v).astype(dt)
+            cols[name] = v
+        elif name == "step":
+            cols[name] = _derive_steps(cols["mode"], cols["value"])
+
+    return RunTable(path, layout, kind, cols)
+
+
+def _derive_steps(mode, value):
+    # Files without a Step column: a new step starts wherever Mode/Value changes
+    if not len(value): return np.zeros(0, "u2")
+    v = np.nan_to_num(value, nan=-1.0)
+    change = np.concatenate(([True], (np.diff(v) != 0) | (np.diff(mode.astype("i2")) != 0)))
+    return np.cumsum(change).astype("u2")
+
+
+def _load_ccvraw(path):
+    with raw_log.BinaryLogReader(path) as r:
+        rec = r.records
+        cols = {k: np.array(rec[src], dtype=dt) for k, (src, dt) in
+                {"time": ("time", "f8"), "mode": ("mode", "u1"), "value": ("value", "f8"), "mass": ("mass", "f8"),
+                 "rate": ("rate", "f8"), "vib": ("vib", "u1"), "step": ("step", "u2")}.items()}
+        del rec
+    return RunTable(path, "V4-bin", "raw", cols)
+
+
+# --- Columnar sidecar cache ---
+def _cache_dir(path, cache_root):
+    path = os.path.abspath(path)
+    if cache_root is None:
+        return os.path.join(os.path.dirname(path), CACHE_DIR_NAME, os.path.basename(path))
+    # One shared cache for the whole archive: same-named files in different folders must not collide
+    return os.path.join(cache_root, f"{os.path.basename(path)}-{zlib.crc32(os.path.dirname(path).encode()):08x}")
+
+
+def _key(st):
+    return {"version": CACHE_VERSION, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _read_cache(path, d, st):
+    try:
+        with open(os.path.join(d, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("key") != _key(st):
+        return None
+    try:
+        cols = {name: np.load(os.path.join(d, name + ".npy"), mmap_mode="r") for name in meta["columns"]}
+    except (OSError, ValueError):
+        # Half-replaced entry (interrupted _write_cache) or a truncated .npy: parse the source again
+        return None
+    return RunTable(path, meta["layout"], meta["kind"], cols)
+
+
+def _write_cache(table, d, st):
+    # Written to a temp dir and renamed into place, so readers never see half a cache entry
+    parent = os.path.dirname(d)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent)
+    try:
+        for name, v in table.columns.items():
+            np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(v))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"key": _key(st), "layout": table.layout, "kind": table.kind,
+                       "columns": list(table.columns)}, f)
+        if os.path.isdir(d): shutil.rmtree(d, ignore_errors=True)
+        os.replace(tmp, d)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load(path, cache=True, cache_root=None):
+    """
+    Load any output file as a RunTable.
+
+    cache_root defaults to a .ccv_cache folder next to the file. A read-only
+    archive still loads, it just isn't cached.
+    """
+    st = os.stat(path)
+    d = _cache_dir(path, cache_root)
+    if cache:
+        table = _read_cache(path, d, st)
+        if table is not None: return table
+    table = _load_ccvraw(path) if path.endswith(raw_log.EXTENSION) else _parse_csv(path)
+    if cache:
+        try: _write_cache(table, d, st)
+        except OSError: pass
+    return table
+
+
+def load_summary(raw_path, **kw):
+    """The _Summary.csv companion of a raw file (V2 onwards), or None."""
+    base, _ = os.path.splitext(raw_path)
+    p = base + "_Summary.csv"
+    return load(p, **kw) if os.path.exists(p) else None
+
+
+def scan(root):
+    """Every output file under root, skipping the cache folders."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [x for x in dirnames if x != CACHE_DIR_NAME]
+        for fn in sorted(filenames):
+            if fn.endswith(".csv") or fn.endswith(raw_log.EXTENSION):
+                yield os.path.join(dirpath, fn)
+
+
+# --- Conversion ---
+def to_binary(src, dst):
+    """
+    Convert a raw CSV (any V1-V4 layout) to .ccvraw. Returns the number of rows.
+
+    Files without a Step column get step numbers from changes of Mode/Value.
+    """
+    t = load(src, cache=False)
+    if t.kind != "raw":
+        raise ValueError(f"{src}: not a raw log")
+    w = raw_log.BinaryLogWriter(dst, commit_interval_s=3600.0, commit_bytes=1 << 20, fsync=False)
+    modes = [raw_log.MODES[c] if c < len(raw_log.MODES) else "" for c in range(256)]
+    c = t.columns
+    for tt, mode, value, mass, rate, vib, step in zip(*(c[k].tolist() for k in ("time", "mode", "value", "mass", "rate", "vib", "step"))):
+        w.write_row((tt, modes[mode], value, mass, rate, vib, step))
+    w.close()
+    return len(t)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--to-bin":
+        src = sys.argv[2]
+        dst = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(src)[0] + raw_log.EXTENSION
+        print(f"{to_binary(src, dst)} rows -> {dst}")
+        sys.exit(0)
+    for p in scan(sys.argv[1] if len(sys.argv) > 1 else "."):
+        try:
+            t = load(p)
+        except ValueError as e:
+            print(f"{p}: skipped ({e})")
+            continue
+        extra = f", {len(t.step_bounds())} steps" if t.kind == "raw" else ""
+        print(f"{p}: {t.layout} {t.kind}, {len(t)} rows{extra}")
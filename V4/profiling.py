@@ -0,0 +1,160 @@
+"""
+On-demand profiling of one test run or manual session.
+
+RunProfiler wraps a run with:
+  - cProfile on the thread that starts it (the runner thread for a test,
+    the Tk thread for a manual session) -> <base>_Profile.pstats and a
+    readable <base>_Profile.txt (top functions by cumulative time)
+  - a stack sampler over every thread (reader, runner, Tk, writers) ->
+    <base>_Profile.collapsed, one "thread;outer;...;inner count" line per
+    distinct stack, for flamegraph.pl / speedscope / inferno
+  - tracemalloc snapshots at start, periodically and at stop ->
+    <base>_Memory.txt with the memory timeline and the top growth by line
+
+Only the standard library is used, so it works inside the frozen exe.
+
+    prof = RunProfiler("Test_2024-01-01_10-00").start()
+    ...
+    paths = prof.stop()   # must be called on the thread that called start()
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+SAMPLE_INTERVAL_S = 0.01    # Stack sampler period (all threads)
+SNAPSHOT_INTERVAL_S = 60.0  # tracemalloc snapshot period
+TRACE_FRAMES = 5            # Frames kept per allocation traceback
+TOP_N = 40                  # Rows in the text reports
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+class StackSampler:
+    """Counts the Python stack of every thread every interval_s, in collapsed stack form."""
+
+    def __init__(self, interval_s=SAMPLE_INTERVAL_S, on_tick=None):
+        self.interval_s = interval_s
+        self.on_tick = on_tick  # Called from the sampler thread after each sample (snapshot timer)
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="StackSampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me: continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            if self.on_tick: self.on_tick()
+
+    def write_collapsed(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        return path
+
+
+class RunProfiler:
+    """cProfile + stack sampler + tracemalloc around one run; outputs are named <base>_Profile.* / <base>_Memory.txt."""
+
+    def __init__(self, base, sample_interval_s=SAMPLE_INTERVAL_S, snapshot_interval_s=SNAPSHOT_INTERVAL_S,
+                 trace_frames=TRACE_FRAMES):
+        self.base = base
+        self.snapshot_interval_s = snapshot_interval_s
+        self.trace_frames = trace_frames
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(sample_interval_s, on_tick=self._maybe_snapshot)
+        self.timeline = []  # (elapsed_s, traced_bytes, peak_bytes)
+        self._first = self._last = None
+        self._started_tracing = False
+        self._t0 = 0.0
+        self._next_snapshot = 0.0
+        self.active = False
+
+    def start(self):
+        self._t0 = time.monotonic()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self._started_tracing = True
+        self._first = self._snapshot()
+        self._next_snapshot = self._t0 + self.snapshot_interval_s
+        self.sampler.start()
+        self.profile.enable()
+        self.active = True
+        return self
+
+    def _snapshot(self):
+        # The profiler's own bookkeeping is not what we are looking for
+        snap = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                                          tracemalloc.Filter(False, __file__)))
+        current, peak = tracemalloc.get_traced_memory()
+        self.timeline.append((time.monotonic() - self._t0, current, peak))
+        self._last = snap
+        return snap
+
+    def _maybe_snapshot(self):
+        # Sampler thread; the snapshot holds the GIL for a while, so only every snapshot_interval_s
+        if time.monotonic() >= self._next_snapshot:
+            self._snapshot()
+            self._next_snapshot = time.monotonic() + self.snapshot_interval_s
+
+    def stop(self):
+        """Stop everything and write the reports; returns the list of files written."""
+        if not self.active: return []
+        self.active = False
+        self.profile.disable()
+        self.sampler.stop()
+        self._snapshot()
+        if self._started_tracing: tracemalloc.stop()
+
+        paths = [self.base + "_Profile.pstats", self.base + "_Profile.txt",
+                 self.base + "_Profile.collapsed", self.base + "_Memory.txt"]
+        self.profile.dump_stats(paths[0])
+        with open(paths[1], "w", encoding="utf-8") as f:
+            pstats.Stats(self.profile, stream=f).sort_stats("cumulative").print_stats(TOP_N)
+        self.sampler.write_collapsed(paths[2])
+        with open(paths[3], "w", encoding="utf-8") as f:
+            f.write(self._memory_report())
+        return paths
+
+    def _memory_report(self):
+        out = io.StringIO()
+        out.write("elapsed_s,traced_kib,peak_kib\n")
+        for t, cur, peak in self.timeline:
+            out.write(f"{t:.1f},{cur / 1024:.1f},{peak / 1024:.1f}\n")
+        out.write(f"\nTop {TOP_N} growth by line (start -> stop):\n")
+        for stat in self._last.compare_to(self._first, "lineno")[:TOP_N]:
+            out.write(f"{stat}\n")
+        out.write(f"\nTop {TOP_N // 4} live allocations at stop, with tracebacks:\n")
+        for stat in self._last.statistics("traceback")[:TOP_N // 4]:
+            out.write(f"\n{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+            for line in stat.traceback.format():
+                out.write(f"{line}\n")
+        return out.getvalue()
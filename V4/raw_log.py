@@ -0,0 +1,228 @@
+"""
+Compact binary raw log (.ccvraw) and conversion to/from the raw CSV.
+
+Layout (all little-endian):
+
+    header   16 bytes   magic "CCVRAW1\\n", version u16, record size u16, reserved u32
+    records  24 bytes   Time_s f64, Mode u8, Vib_On u8, Step u16, Value f32, Mass_g f32, Rate_g_s f32
+    index               chunk entries, then step runs (see CHUNK / STEP_RUN)
+    trailer  24 bytes   index offset u64, chunk count u32, step run count u32, magic "CCVIDX1\\n"
+
+Records are appended in chunks (one per group commit) and the index is
+written on close, so a reader can mmap the file and slice one step or time
+range without touching the rest. A log without a trailer (the run crashed)
+is still readable; the index is then rebuilt from the records.
+
+    python raw_log.py to-csv Test.ccvraw [Test.csv]
+
+CSV to .ccvraw lives in output_reader.to_binary(), which reads every raw
+CSV layout.
+"""
+import csv
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from log_writer import GroupCommitWriter, committed_length
+
+MAGIC = b"CCVRAW1\n"
+INDEX_MAGIC = b"CCVIDX1\n"
+VERSION = 1
+EXTENSION = ".ccvraw"
+
+HEADER = struct.Struct("<8sHHI")
+RECORD = struct.Struct("<dBBHfff")
+CHUNK = struct.Struct("<QIdd")        # offset, records, t_min, t_max
+STEP_RUN = struct.Struct("<HQIdd")    # step, offset, records, t_first, t_last
+TRAILER = struct.Struct("<QII8s")
+
+RECORD_DTYPE = np.dtype([("time", "<f8"), ("mode", "u1"), ("vib", "u1"), ("step", "<u2"),
+                         ("value", "<f4"), ("mass", "<f4"), ("rate", "<f4")])
+
+MODES = ("RPM", "RATE")
+MODE_CODES = {m: i for i, m in enumerate(MODES)}
+MODE_UNKNOWN = 255
+
+CSV_HEADER = ["Time_s", "Mode", "Value", "Mass_g", "Rate_g_s", "Vib_On", "Step"]
+
+
+class BinaryLogWriter(GroupCommitWriter):
+    """
+    GroupCommitWriter producing a .ccvraw file.
+
+    write_row() takes the raw CSV columns in CSV_HEADER order as numbers
+    (Mode as "RPM"/"RATE"). Steps are expected in running order; a step that
+    reappears simply gets another run in the index.
+    """
+
+    def _init_encoder(self, header):
+        self._bin = bytearray(HEADER.pack(MAGIC, VERSION, RECORD.size, 0))
+        self._chunks = []
+        self._runs = []       # [step, offset, count, t_first, t_last]
+        self._batch_t = None  # (t_min, t_max) of the pending chunk
+        self._batch_n = 0
+
+    def _encode(self, row):
+        t, mode, value, mass, rate, vib, step = row
+        t = float(t)
+        offset = self._offset + len(self._bin)
+        self._bin += RECORD.pack(t, MODE_CODES.get(mode, MODE_UNKNOWN), int(vib), int(step),
+                                 float(value), float(mass), float(rate))
+
+        self._batch_n += 1
+        bt = self._batch_t
+        self._batch_t = (t, t) if bt is None else (min(bt[0], t), max(bt[1], t))
+        runs = self._runs
+        if runs and runs[-1][0] == step:
+            r = runs[-1]
+            r[2] += 1
+            r[4] = t
+        else:
+            runs.append([int(step), offset, 1, t, t])
+
+    def _pending(self):
+        return len(self._bin)
+
+    def _close_chunk(self):
+        # Pending records form one chunk; they end the buffer (the first batch also carries the header)
+        if not self._batch_n: return
+        start = self._offset + len(self._bin) - self._batch_n * RECORD.size
+        self._chunks.append((start, self._batch_n) + self._batch_t)
+        self._batch_t = None
+        self._batch_n = 0
+
+    def _take(self):
+        self._close_chunk()
+        data = bytes(self._bin)
+        self._bin.clear()
+        return data
+
+    def _finish(self):
+        self._close_chunk()
+        index_offset = self._offset + len(self._bin)
+        for c in self._chunks: self._bin += CHUNK.pack(*c)
+        for r in self._runs: self._bin += STEP_RUN.pack(*r)
+        self._bin += TRAILER.pack(index_offset, len(self._chunks), len(self._runs), INDEX_MAGIC)
+
+
+class BinaryLogReader:
+    """
+    Memory-mapped reader for .ccvraw files.
+
+    records is a zero-copy structured NumPy view (RECORD_DTYPE) over the
+    mapped file; step() and between() return views into it, so only the
+    pages actually sliced are read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "rb")
+        size = os.fstat(self._f.fileno()).st_size
+        safe = committed_length(path)  # A crashed run may have a torn last batch
+        if safe is not None: size = min(size, safe)
+        if size < HEADER.size:
+            raise ValueError(f"{path}: not a raw log")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, rec_size, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or rec_size != RECORD.size:
+            raise ValueError(f"{path}: not a raw log (or unsupported version {version})")
+
+        self.complete = False
+        end = size
+        if size >= HEADER.size + TRAILER.size:
+            index_offset, n_chunks, n_runs, imagic = TRAILER.unpack_from(self._mm, size - TRAILER.size)
+            if imagic == INDEX_MAGIC:
+                self.complete = True
+                end = index_offset
+                pos = index_offset
+                self.chunks = [CHUNK.unpack_from(self._mm, pos + k * CHUNK.size) for k in range(n_chunks)]
+                pos += n_chunks * CHUNK.size
+                self.runs = [STEP_RUN.unpack_from(self._mm, pos + k * STEP_RUN.size) for k in range(n_runs)]
+
+        n = (end - HEADER.size) // RECORD.size
+        self.records = np.frombuffer(self._mm, dtype=RECORD_DTYPE, count=n, offset=HEADER.size)
+        if not self.complete:
+            self._rebuild_index()
+
+    def _rebuild_index(self):
+        # No trailer: derive step runs from the records and treat the file as one chunk
+        rec = self.records
+        self.chunks = []
+        self.runs = []
+        if not len(rec): return
+        self.chunks.append((HEADER.size, len(rec), float(rec["time"].min()), float(rec["time"].max())))
+        steps = rec["step"]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(steps)) + 1))
+        ends = np.concatenate((starts[1:], [len(rec)]))
+        for a, b in zip(starts, ends):
+            self.runs.append((int(steps[a]), HEADER.size + int(a) * RECORD.size, int(b - a),
+                              float(rec["time"][a]), float(rec["time"][b - 1])))
+
+    def __len__(self):
+        return len(self.records)
+
+    def _slice(self, offset, count):
+        i = (offset - HEADER.size) // RECORD.size
+        return self.records[i:i + count]
+
+    def steps(self):
+        """Step numbers in the order they ran."""
+        seen = []
+        for r in self.runs:
+            if r[0] not in seen: seen.append(r[0])
+        return seen
+
+    def step(self, n):
+        """Records of step n (a view unless the step ran in several pieces)."""
+        parts = [self._slice(r[1], r[2]) for r in self.runs if r[0] == n]
+        if not parts: return self.records[:0]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def between(self, t0, t1):
+        """Records with t0 <= Time_s < t1, located through the chunk index."""
+        parts = []
+        for offset, count, t_min, t_max in self.chunks:
+            if t_max < t0 or t_min >= t1: continue
+            rec = self._slice(offset, count)
+            t = rec["time"]
+            parts.append(rec[np.searchsorted(t, t0, "left"):np.searchsorted(t, t1, "left")])
+        if not parts: return self.records[:0]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def close(self):
+        self.records = None
+        try: self._mm.close()
+        except BufferError: pass  # Caller still holds a view; the map goes when that does
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- Conversion ---
+def binary_to_csv(src, dst):
+    """Write a .ccvraw log as the raw CSV layout. Returns the number of rows."""
+    with BinaryLogReader(src) as r, open(dst, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(CSV_HEADER)
+        rec = r.records
+        modes = [MODES[c] if c < len(MODES) else "" for c in range(256)]
+        for t, mode, vib, step, value, mass, rate in rec.tolist():
+            w.writerow([round(t, 2), modes[mode], f"{value:g}", f"{mass:.2f}", f"{rate:.2f}", vib, step])
+        return len(rec)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "to-csv":
+        print("python raw_log.py to-csv Test.ccvraw [Test.csv]")
+        sys.exit(2)
+    src = sys.argv[2]
+    dst = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(src)[0] + ".csv"
+    n = binary_to_csv(src, dst)
+    print(f"{n} rows -> {dst}")
@@ -0,0 +1,154 @@
+"""
+Headless re-analysis of archived raw logs.
+
+Walks a directory of raw logs (any V1-V4 layout, CSV or .ccvraw), splits
+each into steps and recomputes CCV, settled average rate, rate std, mass
+slope and the RPM-vs-rate calibration fit with the same code the app uses
+(analysis.py). Files are spread across a process pool.
+
+Writes one row per step to the results CSV and one row per file (fit
+m, c, R²) to <results>_Fits.csv.
+
+    python reanalyze.py OUTPUT/ [-o results.csv] [-j 8] [--settle 2.0] [--no-cache]
+    python reanalyze.py OUTPUT/ --import-to ccv_results.sqlite [--rig COM3]   # backfill the results store
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import analysis
+import output_reader
+import raw_log
+from results_store import ResultsStore
+
+STEP_COLUMNS = ["file", "layout", "step", "mode", "value", "samples", "span_s", "mass_delta",
+                "avg_rate", "rate_std", "mass_slope", "ccv"]
+FIT_COLUMNS = ["file", "layout", "steps", "fit_points", "fit_m", "fit_c", "fit_r2", "error"]
+
+
+def analyse_file(path, settle_s=2.0, cache=True):
+    """
+    (step rows DataFrame or None, fit row dict) for one file. Runs in a worker process.
+    Never raises: whatever goes wrong with one file lands in its fit row's error column.
+    """
+    fit = dict.fromkeys(FIT_COLUMNS)
+    fit["file"] = path
+    try:
+        return _analyse(path, settle_s, cache, fit)
+    except (ValueError, OSError, pd.errors.ParserError) as e:
+        fit["error"] = str(e)
+    except Exception as e:
+        # An odd archive file (unexpected layout details) must not abort the whole batch
+        fit["error"] = f"{type(e).__name__}: {e}"
+    return None, fit
+
+
+def _analyse(path, settle_s, cache, fit):
+    t = output_reader.load(path, cache=cache)
+    fit["layout"] = t.layout
+    if t.kind != "raw":
+        fit["error"] = "not a raw log"
+        return None, fit
+
+    c = t.columns
+    m = analysis.step_metrics(c["time"], c["step"], c["mode"], c["value"], c["mass"], c["rate"],
+                              settle_s=settle_s, rpm_mode=raw_log.MODE_CODES["RPM"])
+    rpm_steps = m["mode"] == raw_log.MODE_CODES["RPM"]
+    fm, fc, r2, npts = analysis.linear_fit(m["value"][rpm_steps], m["avg_rate"][rpm_steps])
+    fit.update(steps=len(m["step"]), fit_points=npts, fit_m=fm, fit_c=fc, fit_r2=r2 if fm is not None else None)
+
+    df = pd.DataFrame(m)
+    modes = np.array(raw_log.MODES + ("",) * (256 - len(raw_log.MODES)), dtype=object)
+    df["mode"] = modes[df["mode"].to_numpy(int)]
+    df.insert(0, "layout", t.layout)
+    df.insert(0, "file", path)
+    return df[STEP_COLUMNS], fit
+
+
+def _worker(args):
+    return analyse_file(*args)
+
+
+def run(paths, jobs=None, settle_s=2.0, cache=True, progress=None):
+    """Analyse every path; returns (steps DataFrame, fits DataFrame)."""
+    step_frames, fits = [], []
+    tasks = [(p, settle_s, cache) for p in paths]
+    if jobs == 1:
+        results = map(_worker, tasks)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        results = pool.map(_worker, tasks, chunksize=max(1, len(tasks) // (4 * (jobs or os.cpu_count() or 1))))
+    try:
+        for i, (df, fit) in enumerate(results):
+            if df is not None: step_frames.append(df)
+            fits.append(fit)
+            if progress: progress(i + 1, len(tasks))
+    finally:
+        if pool: pool.shutdown()
+    steps = pd.concat(step_frames, ignore_index=True) if step_frames else pd.DataFrame(columns=STEP_COLUMNS)
+    return steps, pd.DataFrame(fits, columns=FIT_COLUMNS)
+
+
+def import_raw_log(store, path, rig=None):
+    """Add an archived raw log (any layout) to a ResultsStore as a run, with its steps and fit. Returns the run id."""
+    steps, fit = analyse_file(path)
+    if steps is None: raise ValueError(f"{path}: {fit['error']}")
+    started = datetime.datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")
+    run_id = store.begin_run(rig, None, raw_path=path, started_at=started)
+    for s in steps.itertuples():
+        store.add_step(run_id, int(s.step), s.mode, float(s.value), None, float(s.span_s), int(s.samples),
+                       float(s.mass_delta), float(s.avg_rate), float(s.rate_std), float(s.ccv))
+    if fit["fit_m"] is not None and not np.isnan(fit["fit_m"]):
+        store.add_fit(run_id, fit["fit_m"], fit["fit_c"], fit["fit_r2"], fit["fit_points"])
+    store.end_run(run_id, "imported")
+    return run_id
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Recompute CCV / rate / calibration metrics for archived raw logs.")
+    ap.add_argument("root", help="Directory of raw logs (searched recursively)")
+    ap.add_argument("-o", "--out", default="reanalysis.csv", help="Per-step results CSV (fits go to <out>_Fits.csv)")
+    ap.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: all cores, 1 = in-process)")
+    ap.add_argument("--settle", type=float, default=2.0, help="Seconds at the start of each step left out of avg_rate")
+    ap.add_argument("--no-cache", action="store_true", help="Don't read or write the .ccv_cache sidecars")
+    ap.add_argument("--import-to", metavar="DB", help="Add every log as a run to this results database instead")
+    ap.add_argument("--rig", help="With --import-to: rig name recorded for the imported runs")
+    a = ap.parse_args(argv)
+
+    paths = [p for p in output_reader.scan(a.root) if not p.endswith("_Summary.csv")]
+    if a.import_to:
+        store = ResultsStore(a.import_to)
+        try:
+            for p in paths:
+                try: print(f"run {import_raw_log(store, p, a.rig)}: {p}")
+                except ValueError as ex: print(f"skipped {ex}", file=sys.stderr)
+        finally:
+            store.close()
+        return 0
+    t0 = time.perf_counter()
+
+    def progress(done, total):
+        if done == total or done % 50 == 0:
+            print(f"\r{done}/{total} files", end="", file=sys.stderr, flush=True)
+
+    steps, fits = run(paths, jobs=a.jobs, settle_s=a.settle, cache=not a.no_cache, progress=progress)
+    print(file=sys.stderr)
+
+    base, ext = os.path.splitext(a.out)
+    steps.to_csv(a.out, index=False, float_format="%.6g")
+    fits.to_csv(f"{base}_Fits{ext or '.csv'}", index=False, float_format="%.6g")
+    failed = fits["error"].notna().sum()
+    print(f"{len(paths)} files, {len(steps)} steps in {time.perf_counter() - t0:.1f} s"
+          f"{f' ({failed} skipped, see _Fits error column)' if failed else ''} -> {a.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
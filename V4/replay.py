@@ -0,0 +1,186 @@
+"""
+Replay a recorded raw log as a virtual rig on a pseudo-terminal.
+
+Reads any raw log output_reader understands (V1-V4 CSV or .ccvraw) and
+re-emits it as firmware telemetry at the recorded pace divided by speed.
+Open the printed port in the app (or a benchmark) to run the unmodified
+ingest, plotting and analysis paths against production data. POSIX only.
+
+    python replay.py Test.csv [--speed 100] [--loop] [--start-on-command] [--recorded-time]
+
+The T field carries the replay clock (recorded time / speed) so the host
+clock sync sees a steady device; --recorded-time sends the original times.
+BIN:<baud> is acknowledged and switches to binary packets like the rig;
+motion commands are counted but don't change the recording.
+"""
+import argparse
+import math
+import os
+import select
+import sys
+import threading
+import time
+
+import numpy as np
+
+import binary_protocol
+import output_reader
+import raw_log
+from rig_sim import open_pty, BINARY_WATCHDOG_MS
+
+MAX_BATCH = 4096  # Rows written per os.write at most, so commands are still read at high speeds
+
+
+class Replayer:
+    """
+    Emits one recording over a pty. port is the device path to open.
+
+    Rows due together (high speeds) go out in one os.write. Rows with no
+    mass or rate reading are skipped.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False, start_on_command=False, recorded_time=False):
+        t = output_reader.load(path)
+        if t.kind != "raw": raise ValueError(f"{path}: not a raw log")
+        c = t.columns
+        ok = ~(np.isnan(c["time"]) | np.isnan(c["mass"]) | np.isnan(c["rate"]))
+        tt = np.asarray(c["time"])[ok]
+        self.time = tt - tt[0] if len(tt) else tt  # Seconds from the first row
+        self.mass = np.asarray(c["mass"])[ok]
+        self.rate = np.asarray(c["rate"])[ok]
+        # The rig reports its RPM target; RATE steps have none we can reproduce
+        self.rpm = np.where(np.asarray(c["mode"])[ok] == raw_log.MODE_CODES["RPM"], np.asarray(c["value"])[ok], 0.0)
+        self.skipped_rows = int((~ok).sum())
+
+        self.speed = speed
+        self.loop = loop
+        self.start_on_command = start_on_command
+        self.recorded_time = recorded_time
+        self._master, self._slave, self.port = open_pty()
+        self._stop = threading.Event()
+        self._thread = None
+        self.binary = False
+        self.rows_out = 0
+        self.commands = 0
+        self.passes = 0
+        self.finished = threading.Event()
+
+    def __len__(self):
+        return len(self.time)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="Replayer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join()
+        for fd in (self._master, self._slave):
+            try: os.close(fd)
+            except OSError: pass
+
+    def _write(self, data):
+        try: os.write(self._master, data)
+        except OSError: pass
+
+    def _handle(self, line):
+        self.commands += 1
+        if line.startswith("BIN:"):
+            try: baud = int(line[4:])
+            except ValueError: baud = 0
+            if baud >= binary_protocol.DEFAULT_BAUD:
+                self._write(f"ACK:BIN:{baud}\n".encode())
+                self.binary = True
+        elif line == "ASCII":
+            self.binary = False
+        elif line == "TARE" and not self.binary:
+            self._write(b"System: Taring...\n")
+        return line.startswith("RPM:") or line.startswith("RATE:")
+
+    def _encode(self, a, b, t_ms, seq):
+        # Rows a..b-1 as firmware telemetry
+        mass, rate, rpm = self.mass[a:b].tolist(), self.rate[a:b].tolist(), self.rpm[a:b].tolist()
+        if self.binary:
+            return b"".join(binary_protocol.encode_frame(seq + k, mass[k], rate[k], rpm[k], t_ms[k]) for k in range(b - a))
+        return "".join(f"Mass:{mass[k]:.2f},Rate:{rate[k]:.2f},RPM:{rpm[k]:.0f},T:{t_ms[k]},Seq:{seq + k}\n"
+                       for k in range(b - a)).encode()
+
+    def _run(self):
+        n = len(self.time)
+        started = not self.start_on_command
+        t0 = time.monotonic()
+        i = 0
+        seq = 0
+        base_ms = 0.0        # Replay clock at the start of the current pass
+        last_host = 0.0
+        inbuf = b""
+        while not self._stop.is_set():
+            now = time.monotonic()
+            due_t = (now - t0) * self.speed  # Recording time that should have been sent by now
+            if started and i < n:
+                nxt = (t0 + self.time[i] / self.speed) - now
+            else:
+                nxt = 0.05
+            r, _, _ = select.select([self._master], [], [], max(0.0, min(nxt, 0.05)))
+            if r:
+                try: inbuf += os.read(self._master, 4096)
+                except OSError: inbuf = b""
+                *lines, inbuf = inbuf.split(b"\n")
+                for raw in lines:
+                    last_host = time.monotonic()
+                    if self._handle(raw.decode(errors="replace").strip()) and not started:
+                        started = True
+                        t0 = time.monotonic()
+                        due_t = 0.0
+            if self.binary and (time.monotonic() - last_host) * 1000.0 > BINARY_WATCHDOG_MS:
+                self.binary = False
+            if not started: continue
+
+            if i < n:
+                j = min(int(np.searchsorted(self.time, due_t, "right")), i + MAX_BATCH)
+                if j > i:
+                    rec = self.time[i:j] if self.recorded_time else self.time[i:j] / self.speed
+                    t_ms = [int(base_ms + x * 1000.0) & 0xFFFFFFFF for x in rec.tolist()]  # millis() wraps at 2^32
+                    self._write(self._encode(i, j, t_ms, seq))
+                    seq += j - i
+                    self.rows_out += j - i
+                    i = j
+            if i >= n:
+                self.passes += 1
+                if not self.loop:
+                    self.finished.set()
+                    self._stop.wait(0.05)
+                    continue
+                # Next pass continues the clock where this one ended
+                span = self.time[-1] if n else 0.0
+                base_ms += (span if self.recorded_time else span / self.speed) * 1000.0 + 100.0 / self.speed
+                t0 += span / self.speed + 0.1 / self.speed
+                i = 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Replay a raw log as a virtual rig on a pty.")
+    ap.add_argument("log", help="Raw log (V1-V4 CSV or .ccvraw)")
+    ap.add_argument("--speed", type=float, default=1.0, help="Replay speed-up (1 = real time, e.g. 10-1000)")
+    ap.add_argument("--loop", action="store_true", help="Start over at the end")
+    ap.add_argument("--start-on-command", action="store_true", help="Hold until the host sends RPM:/RATE:")
+    ap.add_argument("--recorded-time", action="store_true", help="Send the recorded sample times in T")
+    a = ap.parse_args(argv)
+
+    rep = Replayer(a.log, a.speed, a.loop, a.start_on_command, a.recorded_time).start()
+    dur = rep.time[-1] / a.speed if len(rep) else 0.0
+    print(f"Replaying {len(rep)} rows ({math.ceil(dur)} s at {a.speed:g}x) on {rep.port} (Ctrl-C to stop)", flush=True)
+    try:
+        while not (rep.finished.is_set() and not a.loop):
+            time.sleep(0.5)
+        print(f"Done: {rep.rows_out} rows sent, {rep.skipped_rows} unreadable rows skipped")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rep.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Embedded SQLite store of test results: runs, per-step results and calibration fits.
+
+One database collects every run regardless of where its CSVs were saved,
+indexed by rig, date, mode and target value. The app writes one
+transaction per finished step; the CSVs stay the raw record.
+
+    python results_store.py query [--rig COM3] [--mode RPM] [--min 100] [--max 300] [--since 2026-01-01] [--until ...]
+    python results_store.py export RUN_ID Out_Summary.csv
+
+Archived raw logs are backfilled with reanalyze.py OUTPUT/ --import-to DB.
+"""
+import argparse
+import csv
+import datetime
+import os
+import sqlite3
+import sys
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), "CCV_Results", "ccv_results.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id           INTEGER PRIMARY KEY,
+    rig          TEXT,
+    started_at   TEXT NOT NULL,
+    ended_at     TEXT,
+    op_mode      TEXT,
+    vib_on       INTEGER,
+    status       TEXT,
+    raw_path     TEXT,
+    summary_path TEXT,
+    samples_lost INTEGER
+);
+CREATE TABLE IF NOT EXISTS steps (
+    id         INTEGER PRIMARY KEY,
+    run_id     INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    step_num   INTEGER NOT NULL,
+    mode       TEXT,
+    target     REAL,
+    duration_s REAL,
+    span_s     REAL,
+    samples    INTEGER,
+    grams      REAL,
+    avg_rate   REAL,
+    rate_std   REAL,
+    ccv        REAL
+);
+CREATE TABLE IF NOT EXISTS fits (
+    id         INTEGER PRIMARY KEY,
+    run_id     INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    m          REAL,
+    c          REAL,
+    r2         REAL,
+    points     INTEGER,
+    uploaded   INTEGER DEFAULT 0,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_rig_date ON runs(rig, started_at);
+CREATE INDEX IF NOT EXISTS idx_runs_date ON runs(started_at);
+CREATE INDEX IF NOT EXISTS idx_steps_mode_target ON steps(mode, target);
+CREATE INDEX IF NOT EXISTS idx_steps_run ON steps(run_id, step_num);
+CREATE INDEX IF NOT EXISTS idx_fits_run ON fits(run_id);
+"""
+
+SUMMARY_HEADER = ["Step_Num", "TargetRPM", "Duration_s", "Grams_Dispensed", "CCV_Value"]
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+class ResultsStore:
+    """
+    Connection to the results database (one per thread, as sqlite3 requires).
+
+    add_step() only queues a row; commit() writes everything queued in one
+    transaction, so a step end costs one commit however many rows it adds.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        if path != ":memory:": os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=10.0)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")  # Readers (queries, exports) don't block the app
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+        self._migrate()
+        self._pending = []
+
+    def _migrate(self):
+        # Columns added after the first release; CREATE TABLE IF NOT EXISTS leaves older databases as they are
+        cols = {row["name"] for row in self.db.execute("PRAGMA table_info(runs)")}
+        if "samples_lost" not in cols:
+            with self.db: self.db.execute("ALTER TABLE runs ADD COLUMN samples_lost INTEGER")
+
+    # --- Writing ---
+    def begin_run(self, rig, op_mode, raw_path=None, summary_path=None, vib_on=None, started_at=None):
+        with self.db:
+            cur = self.db.execute(
+                "INSERT INTO runs (rig, started_at, op_mode, vib_on, status, raw_path, summary_path) VALUES (?,?,?,?,?,?,?)",
+                (rig, started_at or _now(), op_mode, vib_on, "running", raw_path, summary_path))
+        return cur.lastrowid
+
+    def add_step(self, run_id, step_num, mode, target, duration_s=None, span_s=None, samples=None,
+                 grams=None, avg_rate=None, rate_std=None, ccv=None):
+        self._pending.append((run_id, step_num, mode, target, duration_s, span_s, samples, grams, avg_rate, rate_std, ccv))
+
+    def commit(self):
+        if not self._pending: return
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO steps (run_id, step_num, mode, target, duration_s, span_s, samples, grams, avg_rate, rate_std, ccv)"
+                " VALUES (?,?,?,?,?,?,?,?,?,?,?)", self._pending)
+        self._pending = []
+
+    def end_run(self, run_id, status="complete", samples_lost=None):
+        self.commit()
+        with self.db:
+            self.db.execute("UPDATE runs SET ended_at = ?, status = ?, samples_lost = ? WHERE id = ?",
+                            (_now(), status, samples_lost, run_id))
+
+    def add_fit(self, run_id, m, c, r2, points, uploaded=False):
+        with self.db:
+            self.db.execute("INSERT INTO fits (run_id, m, c, r2, points, uploaded, created_at) VALUES (?,?,?,?,?,?,?)",
+                            (run_id, m, c, r2, points, int(uploaded), _now()))
+
+    def mark_fit_uploaded(self, run_id):
+        with self.db:
+            self.db.execute("UPDATE fits SET uploaded = 1 WHERE id = (SELECT MAX(id) FROM fits WHERE run_id = ?)", (run_id,))
+
+    def close(self):
+        try: self.commit()
+        finally: self.db.close()
+
+    # --- Reading ---
+    def query_steps(self, rig=None, mode=None, target_min=None, target_max=None, since=None, until=None):
+        """Steps joined with their run, filtered on the indexed columns. Dates are ISO strings."""
+        where, args = [], []
+        for cond, val in (("r.rig = ?", rig), ("s.mode = ?", mode), ("s.target >= ?", target_min),
+                          ("s.target <= ?", target_max), ("r.started_at >= ?", since), ("r.started_at < ?", until)):
+            if val is not None:
+                where.append(cond)
+                args.append(val)
+        sql = ("SELECT r.id AS run_id, r.rig, r.started_at, r.op_mode, s.step_num, s.mode, s.target, s.duration_s,"
+               " s.grams, s.avg_rate, s.ccv FROM steps s JOIN runs r ON r.id = s.run_id")
+        if where: sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY r.started_at, s.step_num"
+        return self.db.execute(sql, args).fetchall()
+
+    def run_steps(self, run_id):
+        return self.db.execute("SELECT * FROM steps WHERE run_id = ? ORDER BY step_num", (run_id,)).fetchall()
+
+    def export_summary_csv(self, run_id, path):
+        """Write a run in today's _Summary.csv layout. Returns the number of steps."""
+        rows = self.run_steps(run_id)
+        with open(path, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(SUMMARY_HEADER)
+            for s in rows:
+                w.writerow([s["step_num"], f"{s['target']:g}", f"{s['duration_s']:g}" if s["duration_s"] is not None else "",
+                            f"{s['grams']:.2f}", f"{s['ccv'] or 0.0:.1f}"])
+        return len(rows)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Query, export or backfill the CCV results database.")
+    ap.add_argument("--db", default=DEFAULT_DB_PATH)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    q = sub.add_parser("query")
+    q.add_argument("--rig"); q.add_argument("--mode")
+    q.add_argument("--min", type=float); q.add_argument("--max", type=float)
+    q.add_argument("--since"); q.add_argument("--until")
+    e = sub.add_parser("export")
+    e.add_argument("run_id", type=int); e.add_argument("out")
+    a = ap.parse_args(argv)
+
+    store = ResultsStore(a.db)
+    try:
+        if a.cmd == "query":
+            w = csv.writer(sys.stdout)
+            rows = store.query_steps(a.rig, a.mode, a.min, a.max, a.since, a.until)
+            if rows: w.writerow(rows[0].keys())
+            for r in rows: w.writerow(list(r))
+        else:
+            n = store.export_summary_csv(a.run_id, a.out)
+            print(f"{n} steps -> {a.out}")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+"""
+Software stand-in for the ESP32 rig (MCM_CCV_RIG_FullRange.ino) on a pseudo-terminal.
+
+RigModel mirrors the firmware: the 100 Hz motor loop with its 2 RPM/tick
+ramp and the sub-10 RPM duty cycling, mass from a flow model plus HX711
+noise, the EMA filter (alpha scaled to the sample interval) and the 1 s
+rate history. RigSimulator puts it behind a pty, so the app or any tool
+can open the printed port as if a rig were plugged in. POSIX only.
+
+    python rig_sim.py [--frame-hz 10] [--sample-hz 10] [--g-per-rev 0.5] [--noise 0.02] [--seed 1]
+
+Commands: RPM:<x>, STOP, TARE, VIB:0/1, BIN:<baud>, ASCII, PING as in the
+firmware, plus RATE:<g/s> and CAL:<a>,<b> which the app sends (RPM = a *
+rate + b). The FullRange firmware currently ignores the last two.
+
+VirtualRig drives the same model from a clocks.VirtualClock instead, for
+running whole test routines in virtual time (see test_runner.run_virtual).
+"""
+import argparse
+import math
+import os
+import random
+import select
+import sys
+import threading
+import time
+import tty
+
+import binary_protocol
+from ui_refresh import LiveSnapshot
+
+# --- Firmware constants (MCM_CCV_RIG_FullRange.ino) ---
+MIN_STABLE_RPM = 10.0
+DUTY_CYCLE_PERIOD_MS = 1000
+STARTUP_LATENCY_MS = 20
+ACCEL_STEP = 2.0
+MOTOR_LOOP_MS = 10
+RATE_SAMPLE_INTERVAL_MS = 100
+HISTORY_SIZE = 10            # RATE_WINDOW_SECONDS * 1000 / RATE_SAMPLE_INTERVAL_MS
+SMOOTHING_ALPHA = 0.3
+BINARY_SAMPLE_MS = 12.5      # HX711 at 80 SPS
+BINARY_WATCHDOG_MS = 5000
+MILLIS_WRAP = 1 << 32
+
+
+class RigModel:
+    """
+    Deterministic, time-stepped model of the rig firmware (no I/O).
+
+    Drive it with handle(line) for host commands and advance(t_ms) to move
+    its clock; it keeps the latest sample like the firmware's globals.
+    With a seed the noise, and so every output, is reproducible.
+    """
+
+    def __init__(self, g_per_rev=0.5, vib_gain=1.05, noise_g=0.02, sample_interval_ms=RATE_SAMPLE_INTERVAL_MS, seed=None):
+        self.g_per_rev = g_per_rev          # Grams dispensed per auger revolution
+        self.vib_gain = vib_gain            # Flow multiplier while the vibrator runs
+        self.noise_g = noise_g              # HX711 noise (std dev, grams)
+        self.sample_interval_ms = sample_interval_ms
+        self.rng = random.Random(seed)
+
+        self.t_ms = 0.0
+        self.target_rpm = 0.0
+        self.serial_control = False
+        self.vibration_enabled = False
+        self.cal = (1.0, 0.0)               # RPM = a * rate + b
+        self.physical_rpm = 0.0
+        self.motor_rpm = 0.0                # What setMotorSpeed() last got
+        self.vib_on = False
+        self.last_cycle_start = 0.0
+        self.binary = False
+
+        self.true_mass = 0.0
+        self.tare_offset = 0.0
+        self.filtered = 0.0
+        self.mass = 0.0
+        self.rate = 0.0
+        self.sample_ms = 0
+        self.history = [0.0] * HISTORY_SIZE
+        self.history_index = 0
+        self.buffer_full = False
+        self.history_accum = 0.0
+        self.last_sample = 0.0
+
+        self._next_motor = 0.0
+        self._next_sample = 0.0
+        self.new_samples = []               # (t_ms, mass, rate) of binary-mode samples not yet sent, see take_samples()
+
+    # --- Host commands (loop() in the firmware) ---
+    def handle(self, line):
+        """Apply one command line; returns the reply lines the firmware would print."""
+        line = line.strip()
+        if line.startswith("RPM:"):
+            self.target_rpm = _to_float(line[4:])
+            self.serial_control = True
+        elif line.startswith("RATE:"):
+            a, b = self.cal
+            self.target_rpm = max(0.0, a * _to_float(line[5:]) + b)
+            self.serial_control = True
+        elif line.startswith("CAL:"):
+            try: self.cal = tuple(float(x) for x in line[4:].split(","))[:2]
+            except ValueError: pass
+        elif line == "STOP":
+            self.target_rpm = 0.0
+            self.serial_control = False
+            self.vib_on = False
+        elif line == "TARE":
+            self.tare_offset = self.true_mass
+            self.filtered = self.mass = self.rate = 0.0
+            self.history = [0.0] * HISTORY_SIZE
+            self.sample_ms = int(self.t_ms)
+            if not self.binary: return ["System: Taring..."]
+        elif line.startswith("BIN:"):
+            try: baud = int(line[4:])
+            except ValueError: baud = 0
+            if baud >= binary_protocol.DEFAULT_BAUD:
+                self.binary = True
+                self.history_accum = 0.0
+                return [f"ACK:BIN:{baud}"]
+        elif line == "ASCII":
+            self.binary = False
+        elif line == "VIB:1":
+            self.vibration_enabled = True
+        elif line == "VIB:0":
+            self.vibration_enabled = False
+        return []
+
+    # --- Time ---
+    def advance(self, t_ms):
+        """Run the motor loop and the load cell task up to t_ms."""
+        interval = BINARY_SAMPLE_MS if self.binary else self.sample_interval_ms
+        while True:
+            nxt = min(self._next_motor, self._next_sample)
+            if nxt > t_ms: break
+            self._flow(nxt)
+            if nxt == self._next_motor:
+                self._motor_tick(nxt)
+                self._next_motor += MOTOR_LOOP_MS
+            if nxt == self._next_sample:
+                self._sample(nxt)
+                self._next_sample += interval
+        self._flow(t_ms)
+
+    def _flow(self, t_ms):
+        # Integrate dispensed mass at the current motor speed up to t_ms
+        dt = t_ms - self.t_ms
+        if dt <= 0: return
+        flow = self.g_per_rev * self.motor_rpm / 60.0
+        if self.vib_on: flow *= self.vib_gain
+        self.true_mass += flow * dt / 1000.0
+        self.t_ms = t_ms
+
+    def _motor_tick(self, now):
+        # manageMotorControl()
+        target = self.target_rpm if self.serial_control else 0.0
+        vibration = self.vibration_enabled if self.serial_control else False
+        if target <= 0:
+            self.motor_rpm = 0.0
+            if vibration: self.vib_on = False
+            self.physical_rpm = 0.0
+            return
+
+        effective = target
+        if target >= MIN_STABLE_RPM:
+            if self.physical_rpm < target:
+                self.physical_rpm = min(self.physical_rpm + ACCEL_STEP, target)
+            elif self.physical_rpm > target:
+                self.physical_rpm = max(self.physical_rpm - ACCEL_STEP, target)
+            effective = self.physical_rpm
+
+        if effective >= MIN_STABLE_RPM:
+            self.motor_rpm = effective
+            if vibration: self.vib_on = True
+        else:
+            on_time = int(DUTY_CYCLE_PERIOD_MS * target / MIN_STABLE_RPM)
+            if on_time > 0: on_time += STARTUP_LATENCY_MS
+            if now - self.last_cycle_start >= DUTY_CYCLE_PERIOD_MS:
+                self.last_cycle_start = now
+            if now - self.last_cycle_start < on_time:
+                self.motor_rpm = MIN_STABLE_RPM
+                if vibration: self.vib_on = True
+            else:
+                self.motor_rpm = 0.0
+
+    def _sample(self, now):
+        # loadCellTask(): raw reading -> EMA -> 1 s rate history
+        raw = self.true_mass - self.tare_offset + self.rng.gauss(0.0, self.noise_g)
+        dt = now - self.last_sample
+        self.last_sample = now
+        alpha = SMOOTHING_ALPHA
+        if self.binary and dt < RATE_SAMPLE_INTERVAL_MS:
+            alpha = 1.0 - math.pow(1.0 - SMOOTHING_ALPHA, dt / RATE_SAMPLE_INTERVAL_MS)
+        self.filtered = alpha * raw + (1.0 - alpha) * self.filtered
+        self.mass = self.filtered
+        self.sample_ms = int(now) % MILLIS_WRAP
+
+        push = True
+        if self.binary:
+            self.history_accum += dt
+            push = self.history_accum >= RATE_SAMPLE_INTERVAL_MS
+            if push: self.history_accum -= RATE_SAMPLE_INTERVAL_MS
+            if self.history_accum > RATE_SAMPLE_INTERVAL_MS: self.history_accum = 0.0
+        else:
+            self.history_accum = 0.0
+        if push:
+            old = self.history[self.history_index]
+            self.history[self.history_index] = self.filtered
+            self.history_index = (self.history_index + 1) % HISTORY_SIZE
+            if self.history_index == 0: self.buffer_full = True
+            if self.buffer_full: self.rate = self.filtered - old
+        if self.binary:
+            self.new_samples.append((self.sample_ms, self.mass, self.rate))
+
+    # --- Output ---
+    def take_samples(self):
+        out = self.new_samples
+        self.new_samples = []
+        return out
+
+    def ascii_line(self, seq):
+        return f"Mass:{self.mass:.2f},Rate:{self.rate:.2f},RPM:{self.target_rpm:.0f},T:{self.sample_ms},Seq:{seq}\n"
+
+
+def _to_float(s):
+    # Arduino String.toFloat(): 0 on garbage
+    try: return float(s)
+    except ValueError: return 0.0
+
+
+def open_pty():
+    """(master fd, slave fd, slave device path) of a raw pty pair."""
+    master, slave = os.openpty()
+    tty.setraw(slave)  # No echo or newline translation, like a USB CDC port
+    return master, slave, os.ttyname(slave)
+
+
+class VirtualRig:
+    """
+    RigModel on a clocks.VirtualClock, without a port or a thread.
+
+    write() takes command bytes like a serial port. frame_hz times a
+    (virtual) second the model is advanced to the clock and, if it took a
+    new sample, sink(LiveSnapshot) gets it with the sample time on the
+    clock's time base, exactly what the app's serial thread queues.
+    """
+
+    def __init__(self, model, clock, sink, frame_hz=10.0):
+        self.model = model
+        self.clock = clock
+        self.sink = sink
+        self.t0 = clock.now()
+        self.frames_out = 0
+        self.commands = []
+        self._last_sample = None
+        clock.call_every(1.0 / frame_hz, self._tick)
+
+    def write(self, data):
+        self.model.advance((self.clock.now() - self.t0) * 1000.0)
+        for line in data.decode(errors="replace").splitlines():
+            if line.strip():
+                self.commands.append(line.strip())
+                self.model.handle(line)
+        return len(data)
+
+    def _tick(self):
+        m = self.model
+        m.advance((self.clock.now() - self.t0) * 1000.0)
+        m.take_samples()
+        if m.sample_ms == self._last_sample: return
+        self._last_sample = m.sample_ms
+        self.frames_out += 1
+        self.sink(LiveSnapshot(m.mass, m.rate, m.target_rpm, self.t0 + m.sample_ms / 1000.0))
+
+
+class RigSimulator:
+    """
+    RigModel behind a pseudo-terminal. port is the device path to open.
+
+    In ASCII mode a status line goes out frame_hz times a second (10 Hz on
+    the real rig; raise it for stress tests, several kHz works). Lines due
+    together are written in one os.write. BIN:<baud> switches to 22-byte
+    packets for every load cell sample, with the firmware's 5 s watchdog.
+    """
+
+    def __init__(self, model=None, frame_hz=10.0):
+        self.model = model if model is not None else RigModel()
+        self.frame_hz = frame_hz
+        self._master, self._slave, self.port = open_pty()
+        self._stop = threading.Event()
+        self._thread = None
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.commands = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="RigSimulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join()
+        for fd in (self._master, self._slave):
+            try: os.close(fd)
+            except OSError: pass
+
+    def _write(self, data):
+        try: os.write(self._master, data)
+        except OSError: return  # Host side closed; keep simulating
+        self.bytes_out += len(data)
+
+    def _run(self):
+        model = self.model
+        t0 = time.monotonic()
+        period = 1.0 / self.frame_hz
+        next_frame = t0
+        seq = 0
+        bin_seq = 0
+        last_host = 0.0
+        inbuf = b""
+        while not self._stop.is_set():
+            timeout = max(0.0, min(next_frame - time.monotonic(), 0.05))
+            r, _, _ = select.select([self._master], [], [], timeout)
+            now_ms = (time.monotonic() - t0) * 1000.0
+            if r:
+                try: inbuf += os.read(self._master, 4096)
+                except OSError: inbuf = b""
+                *lines, inbuf = inbuf.split(b"\n")
+                for raw in lines:
+                    model.advance(now_ms)
+                    self.commands += 1
+                    last_host = now_ms
+                    for reply in model.handle(raw.decode(errors="replace")):
+                        self._write(reply.encode() + b"\n")
+
+            model.advance(now_ms)
+            if model.binary:
+                samples = model.take_samples()
+                if samples:
+                    out = b"".join(binary_protocol.encode_frame(bin_seq + k, m, r_, model.target_rpm, t)
+                                   for k, (t, m, r_) in enumerate(samples))
+                    bin_seq += len(samples)
+                    self.frames_out += len(samples)
+                    self._write(out)
+                if now_ms - last_host > BINARY_WATCHDOG_MS: model.handle("ASCII")
+                next_frame = time.monotonic() + BINARY_SAMPLE_MS / 1000.0
+                continue
+
+            now = time.monotonic()
+            if now >= next_frame:
+                # Every frame due since the last pass, in one write (keeps kHz rates cheap)
+                n = int((now - next_frame) / period) + 1
+                self._write("".join(model.ascii_line(seq + k) for k in range(n)).encode())
+                seq += n
+                self.frames_out += n
+                next_frame += n * period
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Simulated CCV rig on a pseudo-terminal.")
+    ap.add_argument("--frame-hz", type=float, default=10.0, help="ASCII status lines per second (rig: 10)")
+    ap.add_argument("--sample-hz", type=float, default=10.0, help="Load cell samples per second in ASCII mode (rig: 10)")
+    ap.add_argument("--g-per-rev", type=float, default=0.5)
+    ap.add_argument("--vib-gain", type=float, default=1.05)
+    ap.add_argument("--noise", type=float, default=0.02, help="Load cell noise, std dev in grams")
+    ap.add_argument("--seed", type=int, default=None)
+    a = ap.parse_args(argv)
+
+    model = RigModel(a.g_per_rev, a.vib_gain, a.noise, 1000.0 / a.sample_hz, a.seed)
+    sim = RigSimulator(model, a.frame_hz).start()
+    print(f"Simulated rig on {sim.port} (Ctrl-C to stop)", flush=True)
+    try:
+        while True:
+            time.sleep(5)
+            print(f"  frames {sim.frames_out}  commands {sim.commands}  target {model.target_rpm:.0f} RPM"
+                  f"  mass {model.mass:.2f} g  rate {model.rate:.2f} g/s", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-capacity, preallocated multi-column ring buffer for live telemetry.
+
+    Each column is stored twice (at i and i + capacity) so the most recent
+    `capacity` samples are always one contiguous slice: view() returns it
+    without copying and append() is two row writes, whatever the history length.
+
+    When spill_path is given, samples are appended to it in chunks just before
+    they are evicted, as raw little-endian float64 rows (see read_spill()).
+    """
+
+    def __init__(self, capacity, columns, spill_path=None, spill_chunk=None):
+        self.capacity = int(capacity)
+        self.columns = tuple(columns)
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        self._buf = np.zeros((len(self.columns), 2 * self.capacity), dtype="<f8")
+        self.spill_path = spill_path
+        self.spill_chunk = min(int(spill_chunk or max(1, self.capacity // 8)), self.capacity)
+        self._spill_file = None
+        self.clear()
+
+    def clear(self):
+        self.count = 0    # Samples ever appended since clear()
+        self.spilled = 0  # Samples written to spill_path
+        if self._spill_file:
+            self._spill_file.close()
+            self._spill_file = None
+        if self.spill_path and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, *values):
+        n = self.capacity
+        if self.count - self.spilled >= n and self.spill_path:
+            self._spill()
+        pos = self.count % n
+        buf = self._buf
+        buf[:, pos] = values
+        buf[:, pos + n] = values
+        self.count += 1
+
+    def _start(self):
+        # Offset of the oldest retained sample in the doubled buffer
+        if self.count <= self.capacity:
+            return 0
+        return self.count % self.capacity
+
+    def view(self, name):
+        """Zero-copy view of one column, oldest first."""
+        start = self._start()
+        return self._buf[self._index[name], start:start + len(self)]
+
+    def views(self):
+        start = self._start()
+        return self._buf[:, start:start + len(self)]
+
+    def last(self, name):
+        if not self.count:
+            return None
+        return float(self._buf[self._index[name], (self.count - 1) % self.capacity])
+
+    def _spill(self):
+        # The oldest spill_chunk samples are about to be overwritten; persist them first
+        n = self.capacity
+        first = self.spilled % n
+        chunk = self._buf[:, first:first + self.spill_chunk]
+        if self._spill_file is None:
+            self._spill_file = open(self.spill_path, "ab")
+        np.ascontiguousarray(chunk.T).tofile(self._spill_file)
+        self._spill_file.flush()
+        self.spilled += self.spill_chunk
+
+    def read_spill(self):
+        """Memory-mapped (rows, columns) array of everything spilled so far, or None."""
+        if self._spill_file:
+            self._spill_file.flush()
+        if not self.spill_path or not os.path.exists(self.spill_path) or os.path.getsize(self.spill_path) == 0:
+            return None
+        return np.memmap(self.spill_path, dtype="<f8", mode="r").reshape(-1, len(self.columns))
+
+    def close(self):
+        if self._spill_file:
+            self._spill_file.close()
+            self._spill_file = None
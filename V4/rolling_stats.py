@@ -0,0 +1,171 @@
+import math
+from collections import deque
+
+
+class RollingStats:
+    """
+    Sliding-window statistics; add() is O(1) amortised.
+
+    The window is bounded by sample count (max_samples), by age (window_s,
+    measured on the sample time axis), or both. Only the mean is read on
+    every frame, so add() just keeps a running sum for it; variance, min,
+    max and the least-squares slope of y over t are computed from the
+    window when read (O(window)). The sum is rebuilt from the window after
+    every window-length of evictions so floating point error cannot
+    accumulate over long runs.
+    """
+
+    def __init__(self, max_samples=None, window_s=None):
+        if max_samples is None and window_s is None:
+            raise ValueError("RollingStats needs max_samples and/or window_s")
+        if window_s is not None and window_s <= 0:
+            raise ValueError("RollingStats window_s must be positive")
+        self.max_samples = max_samples
+        self.window_s = window_s
+        self.clear()
+
+    def clear(self):
+        self._t = deque()
+        self._y = deque()
+        self._index = 0
+        self._since_rebuild = 0
+        self.sy = 0.0
+
+    def __len__(self):
+        return len(self._y)
+
+    def add(self, y, t=None):
+        if t is None: t = float(self._index)
+        self._index += 1
+        ts, ys = self._t, self._y
+        ts.append(t)
+        ys.append(y)
+        sy = self.sy + y
+
+        evicted = 0
+        if self.max_samples and len(ys) > self.max_samples:
+            ts.popleft()
+            sy -= ys.popleft()
+            evicted = 1
+        if self.window_s is not None:
+            oldest = t - self.window_s
+            while ts[0] <= oldest:
+                ts.popleft()
+                sy -= ys.popleft()
+                evicted += 1
+        if evicted:
+            self._since_rebuild += evicted
+            if self._since_rebuild >= max(len(ys), 64):
+                self._since_rebuild = 0
+                sy = math.fsum(ys)
+        self.sy = sy
+
+    @property
+    def mean(self):
+        n = len(self._y)
+        return self.sy / n if n else 0.0
+
+    @property
+    def variance(self):
+        n = len(self._y)
+        if n < 2: return 0.0
+        m = self.sy / n
+        return max(math.fsum((y - m) ** 2 for y in self._y), 0.0) / (n - 1)
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def min(self):
+        return min(self._y) if self._y else 0.0
+
+    @property
+    def max(self):
+        return max(self._y) if self._y else 0.0
+
+    @property
+    def slope(self):
+        """Least-squares dy/dt over the window."""
+        n = len(self._y)
+        if n < 2: return 0.0
+        t0 = self._t[0]  # Relative to the oldest sample to keep t*t well conditioned
+        x = [t - t0 for t in self._t]
+        mx = math.fsum(x) / n
+        my = self.sy / n
+        den = math.fsum((xi - mx) ** 2 for xi in x)
+        if den < 1e-12: return 0.0
+        return math.fsum((xi - mx) * (y - my) for xi, y in zip(x, self._y)) / den
+
+
+class RunningStats:
+    """
+    Unbounded statistics for one test step (Welford mean/variance, min/max,
+    slope over t, first/last sample). Used for per-step averages and CCV.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = self.max = 0.0
+        self.first = self.last = None
+        self.t_first = self.t_last = None
+        self._st = self._stt = self._sty = self._sy = 0.0
+
+    def add(self, y, t=None):
+        if t is None: t = float(self.n)
+        if self.n == 0:
+            self.first, self.t_first = y, t
+            self.min = self.max = y
+        elif y < self.min: self.min = y
+        elif y > self.max: self.max = y
+        self.last, self.t_last = y, t
+
+        self.n += 1
+        d = y - self.mean
+        self.mean += d / self.n
+        self._m2 += d * (y - self.mean)
+
+        x = t - self.t_first
+        self._st += x; self._stt += x * x; self._sty += x * y; self._sy += y
+
+    @property
+    def variance(self):
+        return self._m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def slope(self):
+        den = self.n * self._stt - self._st * self._st
+        if self.n < 2 or abs(den) < 1e-12: return 0.0
+        return (self.n * self._sty - self._st * self._sy) / den
+
+    @property
+    def delta(self):
+        """last - first (e.g. grams dispensed over the step)."""
+        return self.last - self.first if self.n else 0.0
+
+    @property
+    def span(self):
+        """Sample time covered, t_last - t_first."""
+        return self.t_last - self.t_first if self.n else 0.0
+
+
+class StepStats:
+    """Mass and rate statistics for one test step, fed with every frame sampled after t_start."""
+
+    def __init__(self, t_start, settle_s=2.0):
+        self.t_start = t_start
+        self.settle_s = settle_s  # Rate samples inside the start transient are left out
+        self.mass = RunningStats()
+        self.rate = RunningStats()
+
+    def add(self, t, mass, rate):
+        if t < self.t_start: return
+        self.mass.add(mass, t)
+        if t - self.t_start > self.settle_s:
+            self.rate.add(rate, t)
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import serial
+
+
+class LineFramer:
+    """Incrementally splits a raw byte stream into newline-terminated frames."""
+
+    def __init__(self, max_line=512):
+        self.max_line = max_line
+        self._buf = bytearray()
+        self.overflows = 0  # Partial lines dropped because no newline arrived in time
+
+    def feed(self, data):
+        """Append a chunk and return every complete line it finished (without CR/LF)."""
+        buf = self._buf
+        buf += data
+        end = buf.rfind(b"\n")
+        if end < 0:
+            # No terminator yet. Guard against a stream that never sends one (wrong baud, noise).
+            if len(buf) > self.max_line:
+                buf.clear()
+                self.overflows += 1
+            return []
+
+        block = bytes(buf[:end])
+        del buf[:end + 1]
+        return [line.rstrip(b"\r") for line in block.split(b"\n") if line and line != b"\r"]
+
+    def reset(self):
+        self._buf.clear()
+
+
+class SerialReader:
+    """
+    Dedicated ingest thread for the rig's serial port.
+
+    Blocks on the port until at least one byte arrives, then drains everything
+    already buffered in a single read() and passes everything the framer
+    completed to on_batch as one list. Nothing sleeps, so latency is bounded
+    by the port and not by a polling interval.
+
+    framer is any object with feed(bytes) -> list. The default LineFramer
+    yields raw lines; a telemetry_parser.TelemetryParser yields parsed frames.
+
+    latency is an optional metrics.Histogram of the host time from the first
+    byte of a read to on_batch returning (drain, parse and publish).
+    """
+
+    def __init__(self, ser, on_batch, on_error=None, chunk_size=4096, framer=None, latency=None):
+        self.ser = ser
+        self.on_batch = on_batch
+        self.on_error = on_error
+        self.chunk_size = chunk_size
+        self.framer = framer if framer is not None else LineFramer()
+        self.latency = latency
+
+        # Counters (read from other threads, only written here)
+        self.bytes_in = 0
+        self.frames_in = 0
+        self.batches = 0
+        self.max_batch = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="SerialReader", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        ser = self.ser
+        while not self._stop.is_set():
+            try:
+                # Blocks for up to ser.timeout waiting for the first byte of the next burst
+                data = ser.read(1)
+                if not data:
+                    continue
+                t0 = time.perf_counter()
+                waiting = ser.in_waiting
+                if waiting:
+                    data += ser.read(min(waiting, self.chunk_size))
+            except (serial.SerialException, OSError, TypeError, AttributeError) as e:
+                # TypeError/AttributeError: port closed underneath us by another thread
+                if not self._stop.is_set() and self.on_error:
+                    self.on_error(e)
+                break
+
+            self.bytes_in += len(data)
+            batch = self.framer.feed(data)
+            if batch:
+                self.frames_in += len(batch)
+                self.batches += 1
+                if len(batch) > self.max_batch: self.max_batch = len(batch)
+                self.on_batch(batch)
+            if self.latency is not None: self.latency.observe(time.perf_counter() - t0)
+
+    def stats(self):
+        return {
+            "bytes_in": self.bytes_in,
+            "frames_in": self.frames_in,
+            "batches": self.batches,
+            "max_batch": self.max_batch,
+            "framer_overflows": self.framer.overflows,
+        }
+
@@ -0,0 +1,384 @@
+"""
+Serial ingest and raw logging in a child process, published through shared memory.
+
+The child owns the port: it reads, decodes, timestamps (ClockSync on the
+system-wide monotonic clock) and sequence-checks every frame, appends the
+samples to a TelemetryRing in multiprocessing.shared_memory and, while a
+test runs, writes the raw log itself. Plotting, Tk and the test runner
+in the parent share a GIL the child never waits for, so a long
+canvas.draw() delays when samples are *consumed*, not when they are
+stamped or logged.
+
+TelemetryRing is single-producer and seqlock-like: the child first
+announces how far it is about to write (H_WRITING), then writes the
+records, then publishes them by storing the new total count (H_COUNT).
+Readers copy from their last count to the published one and afterwards
+re-read H_WRITING, discarding every copied slot a write in progress (or
+finished) may have overwritten; nobody takes a lock.
+The parent's views of the block are read-only.
+
+Used by DosingEngine.connect(port, ingest_process=True).
+"""
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import serial
+
+import binary_protocol
+import engine as engine_module
+from clock_sync import ClockSync, SequenceTracker, MILLIS_WRAP
+from serial_reader import SerialReader
+from step_scheduler import StepScheduler
+from test_runner import raw_row
+from ui_refresh import LiveSnapshot
+
+RING_CAPACITY = 1 << 16  # Samples retained (~13 min at 80 SPS); a reader further behind loses the oldest
+POLL_S = 0.02            # Parent poll period of the ring and the control pipe
+START_TIMEOUT_S = 10.0   # Port open + binary handshake in the child
+
+# Header words (uint64)
+H_COUNT, H_CAPACITY, H_BYTES_IN, H_RECEIVED, H_DROPPED, H_DUPLICATES, H_OUT_OF_ORDER, H_REJECTED, H_WRITING = range(9)
+HEADER_WORDS = 9
+RECORD_DTYPE = np.dtype([("mass", "<f8"), ("rate", "<f8"), ("rpm", "<f8"), ("t", "<f8")])  # LiveSnapshot order
+
+
+class TelemetryRing:
+    """Fixed-size sample ring in shared memory: one writer, any number of readers."""
+
+    def __init__(self, shm, owner, writable):
+        self.shm = shm
+        self.owner = owner
+        self.name = shm.name
+        self.header = np.ndarray((HEADER_WORDS,), dtype="<u8", buffer=shm.buf)
+        self.capacity = int(self.header[H_CAPACITY])
+        self.records = np.ndarray((self.capacity,), dtype=RECORD_DTYPE, buffer=shm.buf, offset=HEADER_WORDS * 8)
+        if not writable:
+            self.header.flags.writeable = False
+            self.records.flags.writeable = False
+        self.read_count = 0  # Reader position (total records consumed)
+        self.lost = 0        # Records overwritten before this reader got to them
+
+    @classmethod
+    def create(cls, capacity=RING_CAPACITY):
+        """New ring owned (and unlinked on close) by the caller, mapped read-only."""
+        shm = shared_memory.SharedMemory(create=True, size=HEADER_WORDS * 8 + capacity * RECORD_DTYPE.itemsize)
+        header = np.ndarray((HEADER_WORDS,), dtype="<u8", buffer=shm.buf)
+        header[:] = 0
+        header[H_CAPACITY] = capacity
+        del header
+        return cls(shm, owner=True, writable=False)
+
+    @classmethod
+    def attach(cls, name):
+        """Writer side, in the ingest process."""
+        return cls(shared_memory.SharedMemory(name=name), owner=False, writable=True)
+
+    # --- Writer ---
+    def write(self, samples):
+        """Append (mass, rate, rpm, t) tuples and publish them."""
+        n = len(samples)
+        if not n: return
+        cap = self.capacity
+        count = int(self.header[H_COUNT])
+        if n > cap:
+            samples = samples[-cap:]
+            count += n - cap
+            n = cap
+        arr = np.array(samples, dtype=RECORD_DTYPE)
+        self.header[H_WRITING] = count + n  # Announce before any slot is touched
+        pos = count % cap
+        first = min(n, cap - pos)
+        self.records[pos:pos + first] = arr[:first]
+        if first < n: self.records[:n - first] = arr[first:]
+        self.header[H_COUNT] = count + n  # Publish after the records are in place
+
+    # --- Reader ---
+    def read(self):
+        """Structured array of the records published since the last read (oldest first)."""
+        cap = self.capacity
+        end = int(self.header[H_COUNT])
+        start = max(self.read_count, end - cap)
+        self.lost += start - self.read_count
+        n = end - start
+        if n <= 0: return self.records[:0].copy()
+        pos = start % cap
+        first = min(n, cap - pos)
+        out = np.concatenate((self.records[pos:pos + first], self.records[:n - first])) if first < n else self.records[pos:pos + n].copy()
+        # Slots a write started since (published or not) may have changed under the copy are not trustworthy
+        lapped = int(self.header[H_WRITING]) - cap - start
+        if lapped > 0:
+            out = out[lapped:]
+            self.lost += lapped
+        self.read_count = end
+        return out
+
+    def stats(self):
+        h = self.header
+        return {
+            "count": int(h[H_COUNT]),
+            "bytes_in": int(h[H_BYTES_IN]),
+            "received": int(h[H_RECEIVED]),
+            "dropped": int(h[H_DROPPED]),
+            "duplicates": int(h[H_DUPLICATES]),
+            "out_of_order": int(h[H_OUT_OF_ORDER]),
+            "rejected": int(h[H_REJECTED]),
+            "reader_lag": int(h[H_COUNT]) - self.read_count,
+            "reader_lost": self.lost,
+        }
+
+    def close(self):
+        # numpy views hold exports of the buffer; drop them before closing
+        self.header = self.records = None
+        try: self.shm.close()
+        except BufferError: pass
+        if self.owner:
+            try: self.shm.unlink()
+            except FileNotFoundError: pass
+
+
+# --- CHILD PROCESS ---
+class _ChildIngest:
+    """Runs in the ingest process: serial reader thread + command loop on the main thread."""
+
+    def __init__(self, ser, ring, binary_active, conn):
+        self.ser = ser
+        self.ring = ring
+        self.binary_active = binary_active
+        self.conn = conn
+        self.parser = engine_module.new_parser(binary_active)
+        self.clock_sync = ClockSync()
+        self.seq_tracker = SequenceTracker(binary_protocol.SEQ_MODULUS if binary_active else MILLIS_WRAP)
+        self.reader = SerialReader(ser, self._on_batch, on_error=self._on_error, framer=self.parser)
+        self._send_lock = threading.Lock()  # Pipe writes from the reader thread and the main thread
+        self._log_lock = threading.Lock()
+        self._log = None  # (writer, scheduler, steps, t0, vib_status, binary) while a test runs
+        self.last_rx_t = time.monotonic()  # Last read that held a valid frame
+        self._stop = threading.Event()
+
+    def _reply(self, *msg):
+        with self._send_lock:
+            try: self.conn.send(msg)
+            except (OSError, EOFError): self._stop.set()
+
+    def _on_error(self, e):
+        self._reply("error", str(e))
+        self._stop.set()
+
+    def _on_batch(self, frames):
+        rx_t = self.last_rx_t = time.monotonic()
+        samples = []
+        for frame in frames:
+            if frame.seq is not None and not self.seq_tracker.observe(frame.seq): continue
+            t = self.clock_sync.observe(frame.t_ms, rx_t) if frame.t_ms is not None else rx_t
+            samples.append((frame.mass, frame.rate, frame.rpm, t))
+        ring = self.ring
+        ring.write(samples)
+        h, st = ring.header, self.seq_tracker
+        h[H_BYTES_IN] = self.reader.bytes_in
+        h[H_RECEIVED], h[H_DROPPED], h[H_DUPLICATES], h[H_OUT_OF_ORDER] = st.received, st.dropped, st.duplicates, st.out_of_order
+        h[H_REJECTED] = getattr(self.parser, "rejected", 0) + getattr(self.parser, "crc_errors", 0)
+
+        with self._log_lock:
+            if self._log is None: return
+            writer, sched, steps, t0, vib_status, binary = self._log
+            for mass, rate, rpm, t in samples:
+                i = sched.index(t)
+                if 0 <= i < len(steps):
+                    writer.write_row(raw_row(t - t0, steps[i], i, mass, rate, vib_status, binary))
+
+    def _renegotiate_binary(self):
+        self.reader.stop()  # negotiate_binary() reads the reply itself
+        if not engine_module.renegotiate_binary(self.ser): return False
+        self.parser = binary_protocol.BinaryFrameDecoder()
+        self.seq_tracker.reset()
+        self.last_rx_t = time.monotonic()
+        self.reader = SerialReader(self.ser, self._on_batch, on_error=self._on_error, framer=self.parser)
+        self.reader.start()
+        return True
+
+    def _start_log(self, filename, log_binary, t0, steps, vib_status):
+        raw_log = engine_module.open_raw_log(filename, log_binary)  # The summary stays with the runner
+        sched = StepScheduler([step["duration"] for step in steps], t0)
+        with self._log_lock:
+            self._log = (raw_log, sched, steps, t0, vib_status, log_binary)
+        return raw_log.path
+
+    def _stop_log(self):
+        with self._log_lock:
+            log, self._log = self._log, None
+        if log is None: return {}
+        log[0].close()
+        return log[0].stats()
+
+    def serve(self):
+        self.reader.start()
+        last_ping = 0.0
+        while not self._stop.is_set():
+            try:
+                ready = self.conn.poll(binary_protocol.KEEPALIVE_S / 2 if self.binary_active else 0.5)
+            except (OSError, EOFError):
+                break
+            if self.binary_active and time.monotonic() - last_ping >= binary_protocol.KEEPALIVE_S:
+                # The rig falls back to ASCII if it hears nothing from us for a few seconds
+                try: self.ser.write(b"PING\n")
+                except Exception: pass
+                last_ping = time.monotonic()
+                # Its watchdog fired anyway (host stall, rig reset): it now talks ASCII at the default baud
+                if engine_module.binary_silent(self.last_rx_t) and not self._renegotiate_binary():
+                    self._on_error(engine_module.silence_error())
+                    break
+            if not ready: continue
+            try: msg = self.conn.recv()
+            except (OSError, EOFError): break  # Parent gone
+            cmd = msg[0]
+            try:
+                if cmd == "send":
+                    self.ser.write(msg[1].encode())
+                elif cmd == "log":
+                    self._reply("log_started", self._start_log(*msg[1:]))
+                elif cmd == "log_stop":
+                    self._reply("log_closed", self._stop_log())
+                elif cmd == "close":
+                    break
+            except Exception as e:
+                self._reply("log_error" if cmd.startswith("log") else "error", str(e))
+
+        self._stop_log()
+        self.reader.stop()
+        if self.binary_active:
+            try: binary_protocol.leave_binary(self.ser)
+            except Exception: pass
+        self.ser.close()
+
+
+def _child_main(port, binary, ring_name, conn):
+    ring = TelemetryRing.attach(ring_name)
+    try:
+        ser, binary_active = engine_module.open_port(port, binary)
+    except Exception as e:
+        conn.send(("error", str(e)))
+        ring.close()
+        return
+    conn.send(("connected", binary_active))
+    try:
+        _ChildIngest(ser, ring, binary_active, conn).serve()
+    finally:
+        ring.close()
+
+
+# --- PARENT SIDE ---
+class IngestProcess:
+    """
+    Parent handle of one ingest process.
+
+    start() spawns the child and waits for the port; run_reader() polls the
+    ring every poll_s on a thread and hands on_batch a list of LiveSnapshots.
+    Commands and raw log control go over a pipe.
+    """
+
+    def __init__(self, port, binary=False, capacity=RING_CAPACITY, poll_s=POLL_S):
+        self.port = port
+        self.binary = binary
+        self.capacity = capacity
+        self.poll_s = poll_s
+        self.binary_active = False
+        self.ring = None
+        self.proc = None
+        self._conn = None
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._replies = {}
+        self._reply_event = threading.Condition()
+
+    def start(self, timeout=START_TIMEOUT_S):
+        self.ring = TelemetryRing.create(self.capacity)
+        self._conn, child_conn = multiprocessing.Pipe()
+        self.proc = multiprocessing.Process(target=_child_main, args=(self.port, self.binary, self.ring.name, child_conn),
+                                            name=f"Ingest-{self.port}", daemon=True)
+        self.proc.start()
+        child_conn.close()
+        msg = self._conn.recv() if self._conn.poll(timeout) else ("error", "ingest process did not start")
+        if msg[0] != "connected":
+            self.close()
+            raise serial.SerialException(msg[1])
+        self.binary_active = msg[1]
+        return self
+
+    def send(self, cmd):
+        with self._send_lock:
+            self._conn.send(("send", cmd))
+
+    def _request(self, msg, reply, timeout):
+        # Replies are picked up by the reader thread (the only one receiving on the pipe)
+        if self._conn is None: return None  # Closed (rig disconnected); the child closed its log on exit
+        with self._reply_event:
+            self._replies.pop(reply, None)
+        with self._send_lock:
+            self._conn.send(msg)
+        with self._reply_event:
+            self._reply_event.wait_for(lambda: reply in self._replies or "log_error" in self._replies, timeout)
+            if "log_error" in self._replies: raise OSError(self._replies.pop("log_error"))
+            return self._replies.pop(reply, None)
+
+    def start_log(self, filename, log_binary, t0, steps, vib_status, timeout=5.0):
+        """Child starts the raw log of a test on the runner's step boundaries; returns its path."""
+        path = self._request(("log", filename, log_binary, t0, list(steps), vib_status), "log_started", timeout)
+        if path is None: raise OSError("ingest process did not open the raw log")
+        return path
+
+    def stop_log(self, timeout=10.0):
+        """Child closes (commits) the raw log; returns its writer stats."""
+        return self._request(("log_stop",), "log_closed", timeout) or {}
+
+    def run_reader(self, on_batch, on_error):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(on_batch, on_error), name="RingReader", daemon=True)
+        self._thread.start()
+
+    def _run(self, on_batch, on_error):
+        ring, conn = self.ring, self._conn
+        while not self._stop.is_set():
+            recs = ring.read()
+            if len(recs): on_batch(list(map(LiveSnapshot._make, recs.tolist())))
+            try:
+                while conn.poll():
+                    msg = conn.recv()
+                    if msg[0] == "error":
+                        on_error(OSError(msg[1]))
+                        return
+                    with self._reply_event:
+                        self._replies[msg[0]] = msg[1]
+                        self._reply_event.notify_all()
+            except (OSError, EOFError) as e:
+                on_error(e)
+                return
+            if not self.proc.is_alive():
+                on_error(OSError(f"ingest process exited ({self.proc.exitcode})"))
+                return
+            self._stop.wait(self.poll_s)
+
+    def close(self, timeout=5.0):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+        if self.proc is not None:
+            try:
+                with self._send_lock: self._conn.send(("close",))
+            except (OSError, EOFError, ValueError): pass
+            self.proc.join(timeout)
+            if self.proc.is_alive(): self.proc.terminate()
+            self.proc = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def stats(self):
+        return self.ring.stats() if self.ring else {}
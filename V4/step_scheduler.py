@@ -0,0 +1,83 @@
+import asyncio
+import bisect
+import queue
+import time
+
+
+class StepScheduler:
+    """
+    Step timing for a test sequence on absolute deadlines.
+
+    Step i runs over [boundaries[i], boundaries[i+1]) where the boundaries are
+    t0 plus the cumulative step durations, so per-step overhead (serial
+    writes, file I/O, a slow wakeup) never accumulates into drift. The clock
+    is monotonic by default and injectable.
+
+    Frames are not sampled from shared state. pump() consumes every frame
+    the serial thread queued and hands it to on_frame together with the index
+    of the step its *sample time* falls into, so the raw log is complete and
+    a frame belongs to exactly one step.
+    """
+
+    def __init__(self, durations, t0, clock=time.monotonic, poll_s=0.25):
+        self.clock = clock
+        self.poll_s = poll_s  # Upper bound on how long a stop request can go unnoticed
+        self.boundaries = [t0]
+        for d in durations:
+            self.boundaries.append(self.boundaries[-1] + d)
+        self.latest_t = float("-inf")  # Newest sample time consumed so far
+
+    def start(self, i):
+        return self.boundaries[i]
+
+    def end(self, i):
+        return self.boundaries[i + 1]
+
+    def index(self, t):
+        """Step index for sample time t: -1 before the first step, len(steps) after the last."""
+        return bisect.bisect_right(self.boundaries, t) - 1
+
+    def pump(self, frames, on_frame, until, sample_until=None, stop=None):
+        """
+        Feed queued frames to on_frame(step_index, frame) until the clock reaches `until`.
+
+        With sample_until, return as soon as a frame sampled at or after that
+        time has been consumed: every earlier frame has then arrived, since the
+        link delivers in order. Returns False if stop() asked to abort.
+        """
+        clock = self.clock
+        while True:
+            if stop is not None and stop():
+                return False
+            if sample_until is not None and self.latest_t >= sample_until:
+                return True
+            remaining = until - clock()
+            if remaining <= 0:
+                return True
+            try:
+                frame = frames.get(timeout=min(remaining, self.poll_s))
+            except queue.Empty:
+                continue
+            if frame.t > self.latest_t: self.latest_t = frame.t
+            on_frame(self.index(frame.t), frame)
+
+    async def apump(self, frames, on_frame, until, sample_until=None, stop=None):
+        """pump() for an asyncio.Queue of frames, waiting in the running event loop."""
+        clock = self.clock
+        while True:
+            if stop is not None and stop():
+                return False
+            if sample_until is not None and self.latest_t >= sample_until:
+                return True
+            remaining = until - clock()
+            if remaining <= 0:
+                return True
+            if frames.empty():
+                try:
+                    frame = await asyncio.wait_for(frames.get(), min(remaining, self.poll_s))
+                except asyncio.TimeoutError:
+                    continue
+            else:
+                frame = frames.get_nowait()
+            if frame.t > self.latest_t: self.latest_t = frame.t
+            on_frame(self.index(frame.t), frame)
@@ -0,0 +1,177 @@
+"""
+In-process publish/subscribe bus for telemetry samples.
+
+The acquisition thread publishes each batch once; every subscriber (test
+runner, plot, analyzers, exporters) has its own bounded queue, so a slow
+consumer only ever loses its own samples and never holds up acquisition or
+the other consumers. Samples are immutable and numbered, so a consumer can
+see exactly which ones it missed; `latest` is always one whole sample.
+
+Overflow policies, per subscription:
+    DROP_OLDEST  keep the newest maxsize samples (live views, default)
+    DROP_NEWEST  keep what is queued and refuse new samples
+    BLOCK        make the publisher wait up to block_timeout_s for room, then
+                 drop the rest like DROP_NEWEST (consumers that must not
+                 lose data but are expected to keep up)
+"""
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+
+from ui_refresh import LiveSnapshot
+
+# One published sample: a LiveSnapshot plus the bus sequence number
+Sample = namedtuple("Sample", LiveSnapshot._fields + ("seq",))
+EMPTY_SAMPLE = Sample(0.0, 0.0, 0.0, 0.0, -1)
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class Subscription:
+    """
+    One consumer's bounded queue. get()/get_nowait() follow queue.Queue
+    (raising queue.Empty), so a subscription can stand in for the frame
+    queue of a TestRunner; get_batch() drains many samples at once.
+    """
+
+    def __init__(self, bus, name, maxsize=1024, policy=DROP_OLDEST, block_timeout_s=0.05):
+        if policy not in POLICIES: raise ValueError(f"unknown overflow policy {policy!r}")
+        self.bus = bus
+        self.name = name
+        self.maxsize = int(maxsize)
+        self.policy = policy
+        self.block_timeout_s = block_timeout_s
+        self._q = deque(maxlen=self.maxsize if policy == DROP_OLDEST else None)
+        self._cond = threading.Condition()
+        self.closed = False
+
+        # Counters
+        self.delivered = 0   # Samples queued for this consumer
+        self.dropped = 0     # Samples this consumer lost to overflow
+        self.blocked_s = 0.0 # Time the publisher spent waiting on this queue (BLOCK)
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self._q)
+
+    def qsize(self):
+        return len(self._q)
+
+    # --- Publisher side ---
+    def _offer(self, samples):
+        n = len(samples)
+        with self._cond:
+            if self.closed: return
+            q = self._q
+            if self.policy == DROP_OLDEST:
+                over = len(q) + n - self.maxsize
+                if over > 0: self.dropped += over
+                q.extend(samples)  # deque(maxlen) evicts from the left
+                self.delivered += n
+            else:
+                if self.policy == BLOCK and len(q) + n > self.maxsize:
+                    t0 = time.monotonic()
+                    self._cond.wait_for(lambda: self.closed or len(q) + n <= self.maxsize, self.block_timeout_s)
+                    self.blocked_s += time.monotonic() - t0
+                room = max(0, self.maxsize - len(q))
+                if room < n:
+                    self.dropped += n - room
+                    samples = samples[:room]
+                q.extend(samples)
+                self.delivered += len(samples)
+            if len(q) > self.max_depth: self.max_depth = len(q)
+            self._cond.notify_all()
+
+    # --- Consumer side ---
+    def get(self, block=True, timeout=None):
+        with self._cond:
+            if not self._q:
+                if not block: raise queue.Empty
+                self._cond.wait_for(lambda: self._q or self.closed, timeout)
+                if not self._q: raise queue.Empty
+            sample = self._q.popleft()
+            if self.policy == BLOCK: self._cond.notify_all()
+            return sample
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def get_batch(self, max_n=None, timeout=0.0):
+        """Up to max_n queued samples (all by default), waiting up to timeout for the first."""
+        with self._cond:
+            if not self._q and timeout:
+                self._cond.wait_for(lambda: self._q or self.closed, timeout)
+            q = self._q
+            n = len(q) if max_n is None else min(max_n, len(q))
+            out = [q.popleft() for _ in range(n)]
+            if out and self.policy == BLOCK: self._cond.notify_all()
+            return out
+
+    def close(self):
+        self.bus.unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "maxsize": self.maxsize,
+            "depth": len(self._q),
+            "max_depth": self.max_depth,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "blocked_s": self.blocked_s,
+        }
+
+
+class TelemetryBus:
+    """Numbers published samples and fans them out to every subscription."""
+
+    def __init__(self):
+        self.latest = EMPTY_SAMPLE  # Replaced (never mutated) once per published batch
+        self.seq = 0                # Sequence number of the next sample
+        self.published = 0
+        self._subs = ()             # Copy-on-write, so publish() iterates without a lock
+        self._lock = threading.Lock()
+
+    def subscribe(self, name, maxsize=1024, policy=DROP_OLDEST, block_timeout_s=0.05):
+        sub = Subscription(self, name, maxsize, policy, block_timeout_s)
+        with self._lock:
+            self._subs = self._subs + (sub,)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs = tuple(s for s in self._subs if s is not sub)
+
+    @property
+    def subscriptions(self):
+        return self._subs
+
+    def publish(self, items):
+        """Publish (mass, rate, rpm, t) records (e.g. LiveSnapshots); returns the Samples."""
+        with self._lock:
+            seq = self.seq
+            samples = [Sample(m, r, rpm, t, seq + k) for k, (m, r, rpm, t) in enumerate(items)]
+            if not samples: return samples
+            self.seq = seq + len(samples)
+            self.published += len(samples)
+            self.latest = samples[-1]
+            subs = self._subs
+        for sub in subs:
+            sub._offer(samples)
+        return samples
+
+    def stats(self):
+        return {"published": self.published, "subscribers": {s.name: s.stats() for s in self._subs}}
@@ -0,0 +1,143 @@
+import re
+from collections import namedtuple
+from itertools import repeat
+
+# One firmware telemetry sample: Serial.printf("Mass:%.2f,Rate:%.2f,RPM:%.0f,T:%lu,Seq:%lu\n", ...)
+# seq and t_ms (device millis() of the sample) are None for firmware that predates them
+TelemetryFrame = namedtuple("TelemetryFrame", ["mass", "rate", "rpm", "seq", "t_ms"], defaults=(None, None))
+
+_NUM = rb"([-.\d]+)"  # float() has the final say; a field it refuses makes the line a reject
+_FRAME = rb"Mass:" + _NUM + rb",Rate:" + _NUM + rb",RPM:" + _NUM + rb"(?:,T:(\d+),Seq:(\d+))?\r?\n"
+_FRAME_RE = re.compile(_FRAME)
+_LINE_RE = re.compile(rb"^" + _FRAME, re.M)  # Whole lines only: no garbage in front of the frame
+
+_new = tuple.__new__  # Builds a TelemetryFrame without the Python-level namedtuple __new__
+_NONE = repeat(None)
+
+MAX_PENDING = 512  # Bytes kept waiting for a newline before the partial line is thrown away
+
+
+class TelemetryParser:
+    """
+    Single-pass parser for the rig's ASCII telemetry stream.
+
+    feed() takes raw bytes straight from the port (any chunking) and returns
+    TelemetryFrame records. Anything between valid frames is accounted for
+    instead of being silently dropped:
+
+      rejected      - lines that look like telemetry ("Mass:") but don't parse
+      other_lines   - status text such as "System: Taring..."
+      resyncs       - frames recovered after skipping garbage on the same line
+      skipped_bytes - total bytes discarded by rejects and resyncs
+
+    A chunk of nothing but whole frames (the normal case) is parsed with a
+    single findall and converted column by column; only a chunk with
+    something else in it is walked frame by frame to classify the rest.
+    """
+
+    def __init__(self):
+        self._pending = b""
+        self.frames = 0
+        self.rejected = 0
+        self.resyncs = 0
+        self.skipped_bytes = 0
+        self.other_lines = 0
+        self.overflows = 0
+        self.last_message = ""
+
+    def feed(self, data):
+        buf = self._pending + data if self._pending else bytes(data)
+        end = buf.rfind(b"\n") + 1
+        out = self._parse_clean(buf, end) if end else None
+        if out is None:
+            out, pos = self._parse_resync(buf)
+        else:
+            pos = end
+        self.frames += len(out)
+
+        # Whole lines after the last frame are not telemetry; keep only the unfinished tail
+        nl = buf.rfind(b"\n", pos)
+        if nl >= 0:
+            self._skip(buf, pos, nl + 1)
+            pos = nl + 1
+        if len(buf) - pos > MAX_PENDING:
+            self.overflows += 1
+            self.skipped_bytes += len(buf) - pos
+            pos = len(buf)
+        self._pending = buf[pos:]
+        return out
+
+    def _parse_clean(self, buf, end):
+        # Fast path: every complete line is a frame. One findall for the whole chunk and
+        # column-wise conversion, so there is no match object or Python call per frame.
+        # None sends the chunk through _parse_resync for the error accounting.
+        rows = _LINE_RE.findall(buf, 0, end)
+        if len(rows) != buf.count(b"\n", 0, end): return None
+        mass, rate, rpm, t_ms, seq = zip(*rows)
+        try:
+            if all(t_ms):
+                cols = zip(map(float, mass), map(float, rate), map(float, rpm), map(int, seq), map(int, t_ms))
+            elif not any(t_ms):
+                cols = zip(map(float, mass), map(float, rate), map(float, rpm), _NONE, _NONE)
+            else:
+                return None
+            return list(map(_new, repeat(TelemetryFrame), cols))
+        except ValueError:
+            return None
+
+    def _parse_resync(self, buf):
+        # Frame by frame, classifying whatever lies between frames
+        out = []
+        append = out.append
+        pos = 0
+        for m in _FRAME_RE.finditer(buf):
+            try:
+                if m[4] is None:
+                    frame = TelemetryFrame(float(m[1]), float(m[2]), float(m[3]))
+                else:
+                    frame = TelemetryFrame(float(m[1]), float(m[2]), float(m[3]), int(m[5]), int(m[4]))
+            except ValueError:
+                continue  # A malformed number ("1.2.3", "-"): left to _skip, which counts the line as a reject
+            start = m.start()
+            if start != pos:
+                self._skip(buf, pos, start)
+            append(frame)
+            pos = m.end()
+        return out, pos
+
+    def parse_lines(self, lines):
+        """Parse already-framed lines (no terminators), e.g. from serial_reader.LineFramer."""
+        return self.feed(b"\n".join(lines) + b"\n") if lines else []
+
+    def reset(self):
+        self._pending = b""
+
+    def _skip(self, buf, start, end):
+        # Classify the bytes between two frames. Complete lines are rejects or status text;
+        # a trailing fragment without a newline is garbage in front of the next frame.
+        last_nl = buf.rfind(b"\n", start, end)
+        if last_nl >= 0:
+            for line in buf[start:last_nl].split(b"\n"):
+                line = line.rstrip(b"\r")
+                if not line:
+                    continue
+                if b"Mass:" in line:
+                    self.rejected += 1
+                    self.skipped_bytes += len(line)
+                else:
+                    self.other_lines += 1
+                    self.last_message = line.decode("utf-8", errors="ignore")
+            start = last_nl + 1
+        if end > start:
+            self.resyncs += 1
+            self.skipped_bytes += end - start
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "rejected": self.rejected,
+            "resyncs": self.resyncs,
+            "skipped_bytes": self.skipped_bytes,
+            "other_lines": self.other_lines,
+            "overflows": self.overflows,
+        }
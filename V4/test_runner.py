@@ -0,0 +1,214 @@
+import analysis
+from clocks import SYSTEM_CLOCK, VirtualClock
+from rolling_stats import StepStats
+from step_scheduler import StepScheduler
+
+# Seconds to wait past a step boundary for frames sampled before it to arrive
+DRAIN_GRACE_S = 0.5
+
+
+def raw_row(t_rel, step, i, mass, rate, vib_status, binary=False):
+    """Raw log row of one frame in step i (0-based): numeric for BinaryLogWriter, formatted for CSV."""
+    if binary:
+        return (t_rel, step["type"], step["val"], mass, rate, vib_status, i + 1)
+    return [round(t_rel, 2), step["type"], step["val"], f"{mass:.2f}", f"{rate:.2f}", vib_status, i + 1]
+
+
+class StepResult:
+    """Outcome of one finished step."""
+
+    def __init__(self, num, mode, val, duration, stats, span, ccv):
+        self.num = num
+        self.mode = mode
+        self.val = val
+        self.duration = duration
+        self.stats = stats          # StepStats (mass / rate RunningStats)
+        self.span = span            # Sample time covered, falls back to the nominal duration
+        self.ccv = ccv              # None outside CCV mode
+        self.mass_delta = stats.mass.delta
+
+
+class TestRunner:
+    """
+    Executes one test sequence: sends each step's command on its absolute
+    start boundary, consumes every telemetry frame from `frames`, logs it
+    and finalises each step once its stragglers have drained.
+
+    Everything time-related goes through `clock` (clocks.SystemClock or
+    clocks.VirtualClock) and frames arrive on a queue made by that clock,
+    so the same code runs a rig in real time or a model in virtual time.
+
+    send(cmd) writes one command line. Optional sinks: raw_log / sum_log
+    (GroupCommitWriter-like), store (ResultsStore) + run_id, and
+    on_step(StepResult) for UI updates. stop() aborts between frames.
+    start_time fixes the first step boundary in advance (default: when
+    run() starts), e.g. for a raw log written elsewhere on the same schedule.
+    jitter (metrics.Histogram) receives how late each step command went out.
+    """
+
+    def __init__(self, steps, op_mode, send, frames, clock=SYSTEM_CLOCK, raw_log=None, raw_binary=False,
+                 sum_log=None, store=None, run_id=None, vib_status="1", stop=None, on_step=None, start_time=None,
+                 jitter=None):
+        self.steps = list(steps)
+        self.op_mode = op_mode  # "CCV" or "CAL"
+        self.send = send
+        self.frames = frames
+        self.clock = clock
+        self.raw_log = raw_log
+        self.raw_binary = raw_binary
+        self.sum_log = sum_log
+        self.store = store
+        self.run_id = run_id
+        self.vib_status = vib_status
+        self.stop = stop if stop is not None else (lambda: False)
+        self.on_step = on_step
+        self.jitter = jitter
+
+        self.start_time = start_time
+        self.results = []
+        self.calibration_results = []  # (RPM, settled mean rate) per RPM step
+        self.stopped = False
+
+    def _begin(self):
+        if self.start_time is None: self.start_time = self.clock.now()
+        start_time = self.start_time
+        sched = self.sched = StepScheduler([step["duration"] for step in self.steps], start_time, clock=self.clock.now)
+        self.step_stats = [StepStats(sched.start(i)) for i in range(len(self.steps))]
+        return sched
+
+    def _start_step(self, i):
+        mode = self.steps[i]["type"]
+        val = self.steps[i]["val"]
+
+        # --- V3 CCV ENFORCEMENT ---
+        if self.op_mode == "CCV" and mode == "RATE":
+            # Warning: CCV mode logic relies on RPM.
+            # We will run it, but CCV math will be meaningless if we don't know RPM.
+            pass
+
+        # Send Command (at the step's absolute start boundary)
+        if self.jitter is not None: self.jitter.observe(max(0.0, self.clock.now() - self.sched.start(i)))
+        self.send(f"RPM:{val}\n" if mode == "RPM" else f"RATE:{val}\n")
+
+    def run(self):
+        sched = self._begin()
+        started = 0
+        for i in range(len(self.steps)):
+            if self.stop(): break
+            self._start_step(i)
+            started = i + 1
+
+            # --- END OF PREVIOUS STEP LOGIC ---
+            if i > 0: self._finish_step(i - 1)
+
+            # Frame-driven wait until this step's deadline
+            if not sched.pump(self.frames, self._on_frame, until=sched.end(i), stop=self.stop): break
+
+        # End Loop
+        self.stopped = self.stop()
+        self.send("STOP\n")
+        if started: self._finish_step(started - 1)
+        return self.results
+
+    def _on_frame(self, i, f):
+        # Each frame is logged and counted against the step its sample time falls in
+        if i < 0 or i >= len(self.steps): return
+        self.step_stats[i].add(f.t, f.mass, f.rate)
+        if self.raw_log is None: return
+        self.raw_log.write_row(raw_row(f.t - self.start_time, self.steps[i], i, f.mass, f.rate, self.vib_status, self.raw_binary))
+
+    def _finish_step(self, i):
+        # Frames sampled before the boundary may still be in flight; collect them first
+        sched = self.sched
+        sched.pump(self.frames, self._on_frame, until=sched.end(i) + DRAIN_GRACE_S, sample_until=sched.end(i), stop=self.stop)
+        self._close_step(i)
+
+    def _close_step(self, i):
+        mode = self.steps[i]["type"]
+        val = self.steps[i]["val"]
+        duration = self.steps[i]["duration"]
+        stats = self.step_stats[i]
+
+        # 1. Calibration Data Store (mean rate after the 2s start transient)
+        if mode == "RPM":
+            self.calibration_results.append((val, stats.rate.mean))
+
+        mass_delta = stats.mass.delta
+        # Span between the first and last mass samples of the step, so a host stall can't skew CCV
+        sample_span = stats.mass.span
+        if sample_span <= 0: sample_span = duration
+        ccv_val = None
+
+        # 2. CCV Summary Logic (V3 Feature)
+        if self.op_mode == "CCV":
+            # Calculate CCV
+            # Formula: CCV = (Degrees Rotated / Grams Dispensed) * 100
+            # Note: Only valid if Mode was RPM.
+            ccv_val = analysis.ccv(val, sample_span, mass_delta) if mode == "RPM" else 0.0
+            if self.sum_log:
+                self.sum_log.write_row([i + 1, val, duration, f"{mass_delta:.2f}", f"{ccv_val:.1f}"])
+                self.sum_log.flush()
+
+        # 3. Results database: one transaction per step
+        if self.store:
+            self.store.add_step(self.run_id, i + 1, mode, val, duration, sample_span, stats.mass.n, mass_delta,
+                                stats.rate.mean, stats.rate.std, ccv_val)
+            self.store.commit()
+
+        result = StepResult(i + 1, mode, val, duration, stats, sample_span, ccv_val)
+        self.results.append(result)
+        if self.on_step: self.on_step(result)
+
+    def fit(self):
+        """Calibration fit (m, c, r_squared, n_points) over the RPM steps run so far."""
+        rpms = [rpm for rpm, rate in self.calibration_results]
+        rates = [rate for rpm, rate in self.calibration_results]
+        return analysis.linear_fit(rpms, rates)
+
+
+class AsyncTestRunner(TestRunner):
+    """
+    TestRunner for an asyncio event loop: frames is an asyncio.Queue and
+    every wait is awaited, so many runners share one thread (see multi_rig.py).
+    Writers and the store are the same blocking-but-brief calls as in run().
+    """
+
+    async def run_async(self):
+        sched = self._begin()
+        started = 0
+        for i in range(len(self.steps)):
+            if self.stop(): break
+            self._start_step(i)
+            started = i + 1
+            if i > 0: await self._finish_step_async(i - 1)
+            if not await sched.apump(self.frames, self._on_frame, until=sched.end(i), stop=self.stop): break
+
+        self.stopped = self.stop()
+        self.send("STOP\n")
+        if started: await self._finish_step_async(started - 1)
+        return self.results
+
+    async def _finish_step_async(self, i):
+        sched = self.sched
+        await sched.apump(self.frames, self._on_frame, until=sched.end(i) + DRAIN_GRACE_S, sample_until=sched.end(i), stop=self.stop)
+        self._close_step(i)
+
+
+def run_virtual(steps, op_mode="CCV", model=None, frame_hz=10.0, vibration=True, **runner_kw):
+    """
+    Run a routine against a rig model in virtual time; returns the finished TestRunner.
+
+    A 7-step, 10 s/step calibration completes in milliseconds, so routines
+    and model parameters can be swept offline. Extra keyword arguments go
+    to TestRunner (raw_log, sum_log, store, ...).
+    """
+    from rig_sim import RigModel, VirtualRig
+    clock = VirtualClock()
+    frames = clock.queue()
+    rig = VirtualRig(model if model is not None else RigModel(seed=0), clock, frames.put, frame_hz=frame_hz)
+    rig.write(b"VIB:1\n" if vibration else b"VIB:0\n")
+    clock.sleep(0.1)
+    runner = TestRunner(steps, op_mode, lambda cmd: rig.write(cmd.encode()), frames, clock=clock,
+                        vib_status="1" if vibration else "0", **runner_kw)
+    runner.run()
+    return runner
@@ -0,0 +1,128 @@
+"""Round trips between the raw log formats: .ccvraw, V4 CSV and the older CSV layouts."""
+import os
+
+import numpy as np
+import pytest
+
+import output_reader
+import raw_log
+from log_writer import committed_length, marker_path, recover
+
+V3_HEADER = "Time_s,TargetRPM,Mass_g,Rate_g_s,Vib_On"
+
+
+def write_binary(path, rows, **kw):
+    w = raw_log.BinaryLogWriter(path, fsync=False, **kw)
+    for row in rows: w.write_row(row)
+    w.close()
+
+
+def sample_rows():
+    # Two RPM steps then a RATE step, 10 Hz
+    rows = []
+    for k in range(60):
+        step = k // 20 + 1
+        mode, value = ("RATE", 0.5) if step == 3 else ("RPM", 20 * step)
+        rows.append((k / 10.0, mode, value, 0.1 * k, 0.3 + 0.01 * k, 1, step))
+    return rows
+
+
+def test_binary_round_trip(tmp_path):
+    path = str(tmp_path / "run.ccvraw")
+    rows = sample_rows()
+    write_binary(path, rows, commit_interval_s=0.0)
+    with raw_log.BinaryLogReader(path) as r:
+        assert r.complete
+        assert len(r) == len(rows)
+        assert r.steps() == [1, 2, 3]
+        assert len(r.chunks) >= 1
+        s3 = r.step(3)
+        assert len(s3) == 20
+        assert s3["mode"][0] == raw_log.MODE_CODES["RATE"]
+        np.testing.assert_allclose(r.records["time"], [x[0] for x in rows])
+        np.testing.assert_allclose(r.between(1.0, 2.0)["time"], np.arange(10, 20) / 10.0)
+
+
+def test_binary_without_trailer_rebuilds_index(tmp_path):
+    path = str(tmp_path / "run.ccvraw")
+    write_binary(path, sample_rows())
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(raw_log.HEADER.size + 45 * raw_log.RECORD.size)  # Crash before close(): no index
+    assert os.path.getsize(path) < size
+    with raw_log.BinaryLogReader(path) as r:
+        assert not r.complete
+        assert len(r) == 45
+        assert r.steps() == [1, 2, 3]
+        assert len(r.step(3)) == 5
+
+
+def test_binary_to_csv_and_back(tmp_path):
+    src, csv_path, back = (str(tmp_path / n) for n in ("a.ccvraw", "a.csv", "b.ccvraw"))
+    rows = sample_rows()
+    write_binary(src, rows)
+    assert raw_log.binary_to_csv(src, csv_path) == len(rows)
+
+    t = output_reader.load(csv_path, cache=False)
+    assert t.layout == "V4" and t.kind == "raw"
+    assert [s for s, _, _ in t.step_bounds()] == [1, 2, 3]
+
+    assert output_reader.to_binary(csv_path, back) == len(rows)
+    with raw_log.BinaryLogReader(src) as a, raw_log.BinaryLogReader(back) as b:
+        for name in ("time", "mode", "vib", "step", "value"):
+            np.testing.assert_array_equal(a.records[name], b.records[name])
+        np.testing.assert_allclose(a.records["mass"], b.records["mass"], atol=0.005)
+
+
+def test_v3_csv_layout_and_steps(tmp_path):
+    path = str(tmp_path / "old.csv")
+    with open(path, "w") as f:
+        f.write(V3_HEADER + "\n")
+        for k in range(30):
+            f.write(f"{k / 10:.1f},{20 if k < 15 else 40},{0.1 * k:.2f},0.50,1\n")
+    t = output_reader.load(path, cache=False)
+    assert t.layout == "V2/V3"
+    assert len(t) == 30
+    assert (t["mode"] == raw_log.MODE_CODES["RPM"]).all()
+    assert t.step_bounds() == [(1, 0, 15), (2, 15, 30)]
+
+    dst = str(tmp_path / "old.ccvraw")
+    assert output_reader.to_binary(path, dst) == 30
+    with raw_log.BinaryLogReader(dst) as r:
+        assert r.steps() == [1, 2]
+        assert set(r.step(2)["value"].tolist()) == {40.0}
+
+
+def test_unknown_header_is_rejected():
+    with pytest.raises(ValueError):
+        output_reader.detect_layout(["a", "b"])
+
+
+def test_cache_serves_the_second_load(tmp_path):
+    path = str(tmp_path / "a.csv")
+    src = str(tmp_path / "a.ccvraw")
+    write_binary(src, sample_rows())
+    raw_log.binary_to_csv(src, path)
+    first = output_reader.load(path)
+    second = output_reader.load(path)
+    assert isinstance(second["time"], np.memmap)
+    for name in output_reader.RAW_COLUMNS:
+        np.testing.assert_array_equal(first[name], second[name])
+
+
+def test_wal_marker_limits_the_log(tmp_path):
+    path = str(tmp_path / "run.csv")
+    src = str(tmp_path / "run.ccvraw")
+    write_binary(src, sample_rows())
+    raw_log.binary_to_csv(src, path)
+    with open(path, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    good = sum(len(x) for x in lines[:11])  # Header + 10 rows reached the disk
+    with open(marker_path(path), "w") as f:
+        f.write(f"{good} {10 ** 6}")  # The next batch did not
+
+    assert committed_length(path) == good
+    assert len(output_reader.load(path, cache=False)) == 10
+    assert recover(path) == good
+    assert os.path.getsize(path) == good
+    assert not os.path.exists(marker_path(path))
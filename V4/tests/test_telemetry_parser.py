@@ -0,0 +1,43 @@
+"""TelemetryParser: the whole-chunk fast path and the frame-by-frame resync path agree."""
+from telemetry_parser import TelemetryFrame, TelemetryParser
+
+CLEAN = b"Mass:1.25,Rate:0.50,RPM:60\nMass:1.30,Rate:0.51,RPM:60\n"
+WITH_SEQ = b"Mass:1.25,Rate:0.50,RPM:60,T:1000,Seq:7\r\nMass:1.30,Rate:0.51,RPM:60,T:1100,Seq:8\r\n"
+
+
+def feed_all(data, chunk):
+    p = TelemetryParser()
+    out = []
+    for i in range(0, len(data), chunk):
+        out += p.feed(data[i:i + chunk])
+    return out, p
+
+
+def test_clean_stream_any_chunking():
+    expected = [TelemetryFrame(1.25, 0.5, 60.0), TelemetryFrame(1.3, 0.51, 60.0)]
+    for chunk in (1, 7, 4096):
+        out, p = feed_all(CLEAN, chunk)
+        assert out == expected
+        assert p.stats()["frames"] == 2
+
+
+def test_sequence_and_device_time():
+    out, _ = feed_all(WITH_SEQ, 4096)
+    assert out == [TelemetryFrame(1.25, 0.5, 60.0, 7, 1000), TelemetryFrame(1.3, 0.51, 60.0, 8, 1100)]
+    assert type(out[0]) is TelemetryFrame and out[0].seq == 7
+
+
+def test_errors_are_accounted():
+    data = (b"System: Taring...\n" + CLEAN + b"Mass:1.2.3,Rate:1,RPM:2\n" + b"\x00\xffMass:2.00,Rate:1.00,RPM:30\n"
+            + b"Mass:-,Rate:1,RPM:2\n" + WITH_SEQ)
+    out, p = feed_all(data, 4096)
+    assert [f.mass for f in out] == [1.25, 1.3, 2.0, 1.25, 1.3]
+    s = p.stats()
+    assert (s["rejected"], s["other_lines"], s["resyncs"]) == (2, 1, 1)
+    assert p.last_message == "System: Taring..."
+
+
+def test_partial_line_waits_for_its_newline():
+    p = TelemetryParser()
+    assert p.feed(b"Mass:1.25,Rate:0.5") == []
+    assert p.feed(b"0,RPM:60\n") == [TelemetryFrame(1.25, 0.5, 60.0)]
@@ -0,0 +1,75 @@
+"""Routines run against rig_sim.RigModel in virtual time (no serial port, no sleeping)."""
+import pytest
+
+from log_writer import GroupCommitWriter
+from raw_log import BinaryLogReader, BinaryLogWriter, CSV_HEADER
+from rig_sim import RigModel
+from test_runner import run_virtual
+
+G_PER_REV = 0.5
+VIB_GAIN = 1.05
+# Degrees per gram * 100 and RPM per g/s of the model with the vibrator on
+EXPECTED_CCV = 360.0 / (G_PER_REV * VIB_GAIN) * 100.0
+EXPECTED_M = 60.0 / (G_PER_REV * VIB_GAIN)
+
+
+def rpm_steps(values, duration=10):
+    return [{"type": "RPM", "val": v, "duration": duration} for v in values]
+
+
+def model():
+    return RigModel(g_per_rev=G_PER_REV, vib_gain=VIB_GAIN, seed=1)
+
+
+def test_ccv_routine():
+    steps = rpm_steps([20, 40, 60])
+    runner = run_virtual(steps, "CCV", model=model())
+    assert [r.num for r in runner.results] == [1, 2, 3]
+    assert not runner.stopped
+    for r, step in zip(runner.results, steps):
+        assert r.val == step["val"]
+        assert r.span == pytest.approx(step["duration"], abs=0.2)
+        assert r.stats.mass.n >= 90  # 10 Hz frames
+        assert r.ccv == pytest.approx(EXPECTED_CCV, rel=0.05)
+
+
+def test_cal_routine_fit():
+    runner = run_virtual(rpm_steps([10, 20, 30, 40, 50, 60, 70]), "CAL", model=model())
+    assert len(runner.results) == 7
+    assert all(r.ccv is None for r in runner.results)
+    m, c, r2, n = runner.fit()
+    assert n == 7
+    assert m == pytest.approx(EXPECTED_M, rel=0.02)
+    assert c == pytest.approx(0.0, abs=2.0)
+    assert r2 > 0.999
+
+
+def test_stop_aborts_between_frames():
+    done = []
+    runner = run_virtual(rpm_steps([30, 30, 30]), "CCV", model=model(),
+                         on_step=done.append, stop=lambda: len(done) >= 1)
+    assert runner.stopped
+    assert len(runner.results) < 3
+
+
+def test_raw_logs_follow_the_run(tmp_path):
+    csv_path, bin_path = str(tmp_path / "run.csv"), str(tmp_path / "run.ccvraw")
+    steps = rpm_steps([20, 40], duration=5)
+    csv_log = GroupCommitWriter(csv_path, CSV_HEADER, fsync=False)
+    runner = run_virtual(steps, "CCV", model=model(), raw_log=csv_log)
+    csv_log.close()
+    bin_log = BinaryLogWriter(bin_path, fsync=False)
+    bin_runner = run_virtual(steps, "CCV", model=model(), raw_log=bin_log, raw_binary=True)
+    bin_log.close()
+
+    with open(csv_path) as f:
+        rows = f.read().splitlines()
+    assert rows[0] == ",".join(CSV_HEADER)
+    n = sum(r.stats.mass.n for r in runner.results)
+    assert len(rows) - 1 == n
+
+    with BinaryLogReader(bin_path) as r:
+        assert r.complete
+        assert r.steps() == [1, 2]
+        assert len(r) == sum(x.stats.mass.n for x in bin_runner.results)
+        assert set(r.step(2)["value"].tolist()) == {40.0}
@@ -0,0 +1,74 @@
+import time
+from collections import namedtuple
+
+# Latest telemetry as one immutable record; the serial thread swaps the reference, never mutates it
+LiveSnapshot = namedtuple("LiveSnapshot", ["mass", "rate", "rpm", "t"])
+EMPTY_SNAPSHOT = LiveSnapshot(0.0, 0.0, 0.0, 0.0)
+
+
+class UiRefresher:
+    """
+    Fixed-rate Tk display refresh.
+
+    One after() callback per tick takes a single snapshot, renders every
+    bound StringVar from it and only calls set() on values whose text
+    changed. Worker threads never queue Tk callbacks for live readouts, so
+    the event queue stays short at any frame rate.
+
+    Metrics (read on the Tk thread): queue_depth is the number of pending
+    Tk `after` events at the last tick, lag_ms how late that tick ran.
+    """
+
+    def __init__(self, root, snapshot, interval_ms=100):
+        self.root = root
+        self.snapshot = snapshot  # Callable returning the current LiveSnapshot
+        self.interval_ms = interval_ms
+        self._bindings = []
+        self._next = None
+        self.ticks = 0
+        self.updates = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def bind(self, var, render):
+        """render(snapshot) -> str for var."""
+        self._bindings.append([var, render, None])
+
+    def start(self):
+        self._next = time.monotonic()
+        self.root.after(0, self._tick)
+
+    def _tick(self):
+        now = time.monotonic()
+        self.lag_ms = max(0.0, (now - self._next) * 1000.0)
+        if self.lag_ms > self.max_lag_ms: self.max_lag_ms = self.lag_ms
+
+        snap = self.snapshot()
+        for b in self._bindings:
+            text = b[1](snap)
+            if text != b[2]:
+                b[0].set(text)
+                b[2] = text
+                self.updates += 1
+
+        pending = self.root.tk.call("after", "info")
+        self.queue_depth = len(pending) if isinstance(pending, tuple) else len(str(pending).split())
+        if self.queue_depth > self.max_queue_depth: self.max_queue_depth = self.queue_depth
+        self.ticks += 1
+
+        # Absolute deadlines so the display rate doesn't drift with tick cost
+        self._next += self.interval_ms / 1000.0
+        if self._next < now: self._next = now + self.interval_ms / 1000.0
+        self.root.after(max(1, int((self._next - time.monotonic()) * 1000)), self._tick)
+
+    def stats(self):
+        return {
+            "ticks": self.ticks,
+            "updates": self.updates,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "lag_ms": self.lag_ms,
+            "max_lag_ms": self.max_lag_ms,
+        }